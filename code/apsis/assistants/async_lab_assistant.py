@@ -0,0 +1,345 @@
+__author__ = 'Frederik Diehl'
+
+import sys
+import threading
+import Queue
+from apsis.utilities.logging_utils import get_logger
+
+
+class Future(object):
+    """
+    The result of an operation which is executed in the background.
+
+    The interface follows concurrent.futures.Future: result and exception
+    block until the operation is done, and callbacks registered with
+    add_done_callback are called with the Future once it is done. This
+    allows event loops to be notified without blocking.
+    """
+    _condition = None
+    _done = False
+    _result = None
+    _exc_info = None
+    _callbacks = None
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._callbacks = []
+
+    def done(self):
+        """
+        Returns whether the operation is done.
+        """
+        with self._condition:
+            return self._done
+
+    def result(self, timeout=None):
+        """
+        Returns the result of the operation, waiting for it if necessary.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            The maximum number of seconds to wait. None waits indefinitely.
+
+        Raises
+        ------
+        RuntimeError :
+            Iff the operation is not done after timeout seconds.
+        Exception :
+            The exception raised by the operation, if any.
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """
+        Returns the exception raised by the operation or None.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            The maximum number of seconds to wait. None waits indefinitely.
+
+        Raises
+        ------
+        RuntimeError :
+            Iff the operation is not done after timeout seconds.
+        """
+        self._wait(timeout)
+        if self._exc_info is None:
+            return None
+        return self._exc_info[1]
+
+    def add_done_callback(self, fn):
+        """
+        Registers fn to be called with this Future once it is done.
+
+        If the Future is already done, fn is called immediately. Otherwise,
+        it is called in the thread finishing the operation.
+        """
+        with self._condition:
+            if not self._done:
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def set_result(self, result):
+        """
+        Finishes the Future with result.
+        """
+        self._finish(result, None)
+
+    def set_exception(self, exc_info):
+        """
+        Finishes the Future with an exception.
+
+        Parameters
+        ----------
+        exc_info : tuple
+            The exception as returned by sys.exc_info.
+        """
+        self._finish(None, exc_info)
+
+    def _finish(self, result, exc_info):
+        with self._condition:
+            if self._done:
+                raise RuntimeError("The Future is already done.")
+            self._result = result
+            self._exc_info = exc_info
+            self._done = True
+            self._condition.notify_all()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for fn in callbacks:
+            fn(self)
+
+    def _wait(self, timeout):
+        with self._condition:
+            if not self._done:
+                self._condition.wait(timeout)
+            if not self._done:
+                raise RuntimeError("The operation is not done after %s "
+                                   "seconds." %timeout)
+
+
+class AsyncLabAssistant(object):
+    """
+    Offers the methods of a lab assistant without blocking the caller.
+
+    get_next_candidate, update and get_best_candidate return Futures
+    immediately, and the work - in particular fitting the optimizer - is
+    done by a pool of worker threads.
+
+    The operations for one experiment are executed in the order they were
+    requested, one at a time. Requests for next candidates which are
+    waiting at the same time are coalesced into a single call to
+    get_next_candidates, so the optimizer is fitted once for all of them.
+    Different experiments are processed in parallel.
+
+    Attributes
+    ----------
+    lab_assistant : BasicLabAssistant
+        The lab assistant executing the operations. It must not be used
+        directly while operations are outstanding.
+    logger : logging.logger
+        The logger for this class.
+    """
+    lab_assistant = None
+    logger = None
+
+    _lock = None
+    _operations = None
+    _scheduled = None
+    _work_queue = None
+    _workers = None
+
+    def __init__(self, lab_assistant, max_workers=4):
+        """
+        Initializes the assistant and starts the worker threads.
+
+        Parameters
+        ----------
+        lab_assistant : BasicLabAssistant
+            The lab assistant executing the operations.
+        max_workers : int, optional
+            The number of worker threads, that is the number of experiments
+            which can be processed in parallel. Default is 4.
+        """
+        self.logger = get_logger(self)
+        self.lab_assistant = lab_assistant
+        self._lock = threading.Lock()
+        #maps the experiment name to the list of its queued operations, each
+        #a (method, args, future) tuple.
+        self._operations = {}
+        #the experiments which are queued for or being processed by a worker.
+        self._scheduled = set()
+        self._work_queue = Queue.Queue()
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._worker,
+                                      name="apsis-async-lab-%i" %i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def init_experiment(self, name, optimizer, param_defs,
+                        optimizer_arguments=None, minimization=True):
+        """
+        Initializes a new experiment. See BasicLabAssistant.init_experiment.
+
+        This does not fit the optimizer and is executed directly.
+        """
+        self.lab_assistant.init_experiment(
+            name, optimizer, param_defs,
+            optimizer_arguments=optimizer_arguments,
+            minimization=minimization)
+
+    def get_next_candidate(self, exp_name):
+        """
+        Requests the Candidate next to evaluate for an experiment.
+
+        Parameters
+        ----------
+        exp_name : string
+            The name of the experiment.
+
+        Returns
+        -------
+        future : Future
+            Its result is the Candidate, or None.
+        """
+        return self._submit(exp_name, "get_next_candidate", ())
+
+    def update(self, exp_name, candidate, status="finished"):
+        """
+        Requests an update of a candidate's status for an experiment.
+
+        See BasicLabAssistant.update for the parameters.
+
+        Returns
+        -------
+        future : Future
+            Its result is None once the update has been applied.
+        """
+        return self._submit(exp_name, "update", (candidate, status))
+
+    def get_best_candidate(self, exp_name):
+        """
+        Requests the best Candidate to date for an experiment.
+
+        Parameters
+        ----------
+        exp_name : string
+            The name of the experiment.
+
+        Returns
+        -------
+        future : Future
+            Its result is the best Candidate, or None.
+        """
+        return self._submit(exp_name, "get_best_candidate", ())
+
+    def close(self):
+        """
+        Executes all outstanding operations, stops the workers and closes
+        the lab assistant.
+        """
+        with self._lock:
+            workers = self._workers
+            self._workers = []
+        for worker in workers:
+            self._work_queue.put(None)
+        for worker in workers:
+            worker.join()
+        self.lab_assistant.close()
+
+    def _submit(self, exp_name, method, args):
+        """
+        Queues an operation for an experiment and schedules the experiment.
+        """
+        future = Future()
+        with self._lock:
+            if not self._workers:
+                raise RuntimeError("The AsyncLabAssistant has been closed.")
+            self._operations.setdefault(exp_name, []).append(
+                (method, args, future))
+            if exp_name not in self._scheduled:
+                self._scheduled.add(exp_name)
+                self._work_queue.put(exp_name)
+        return future
+
+    def _worker(self):
+        """
+        The loop of a worker thread.
+
+        Processes scheduled experiments until a None is received. Since the
+        Nones are queued last, all operations queued before are processed.
+        """
+        while True:
+            exp_name = self._work_queue.get()
+            if exp_name is None:
+                return
+            self._process(exp_name)
+
+    def _process(self, exp_name):
+        """
+        Executes the queued operations of an experiment until none is left.
+        """
+        while True:
+            with self._lock:
+                operations = self._operations.pop(exp_name, [])
+                if not operations:
+                    self._scheduled.discard(exp_name)
+                    return
+            i = 0
+            while i < len(operations):
+                method, args, future = operations[i]
+                if method == "get_next_candidate":
+                    #coalesce all consecutive requests.
+                    j = i
+                    while (j < len(operations) and
+                           operations[j][0] == "get_next_candidate"):
+                        j += 1
+                    self._execute_next_candidates(
+                        exp_name, [op[2] for op in operations[i:j]])
+                    i = j
+                else:
+                    self._execute(future, getattr(self.lab_assistant, method),
+                                  exp_name, *args)
+                    i += 1
+
+    def _execute_next_candidates(self, exp_name, futures):
+        """
+        Computes the Candidates for several requests at once.
+        """
+        try:
+            if len(futures) == 1:
+                candidates = [self.lab_assistant.get_next_candidate(exp_name)]
+            else:
+                self.logger.debug("Coalescing %i candidate requests for %s."
+                                  %(len(futures), exp_name))
+                candidates = self.lab_assistant.get_next_candidates(
+                    exp_name, len(futures))
+        except Exception:
+            exc_info = sys.exc_info()
+            for future in futures:
+                future.set_exception(exc_info)
+            return
+        for i, future in enumerate(futures):
+            if i < len(candidates):
+                future.set_result(candidates[i])
+            else:
+                future.set_result(None)
+
+    def _execute(self, future, fn, *args):
+        """
+        Calls fn with args and finishes future with its result.
+        """
+        try:
+            result = fn(*args)
+        except Exception:
+            future.set_exception(sys.exc_info())
+        else:
+            future.set_result(result)
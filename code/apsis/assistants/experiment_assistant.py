@@ -1,6 +1,7 @@
 __author__ = 'Frederik Diehl'
 
 from apsis.models.experiment import Experiment
+from apsis.models.experiment_journal import ExperimentJournal
 from apsis.models.candidate import Candidate
 from apsis.utilities.optimizer_utils import check_optimizer
 from apsis.utilities.file_utils import ensure_directory_exists
@@ -9,7 +10,9 @@ from apsis.utilities.plot_utils import plot_lists
 import datetime
 import os
 import time
+import threading
 from apsis.utilities.logging_utils import get_logger
+from apsis.utilities.csv_utils import BufferedCSVWriter
 
 class BasicExperimentAssistant(object):
     """
@@ -18,6 +21,11 @@ class BasicExperimentAssistant(object):
     It provides methods for getting candidates to evaluate, returning the
     evaluated Candidate and administrates the optimizer.
 
+    Its methods may be called by several threads at once. The experiment
+    and the optimizer are locked separately, and the optimizer works on a
+    snapshot of the experiment, so update never waits for the computation
+    of new proposals.
+
     Attributes
     ----------
     optimizer : Optimizer
@@ -36,6 +44,22 @@ class BasicExperimentAssistant(object):
     csv_write_frequency : int
         States how often the csv file should be written to.
         If set to 0 no results will be written.
+    csv_flush_rows : int
+        The number of csv rows after which the results file is flushed.
+    csv_flush_interval : float
+        The number of seconds after which the results file is flushed.
+    precompute_proposals : bool
+        Whether new proposals are computed in a background thread after
+        each finished candidate.
+    max_proposal_staleness_steps : int
+        Proposals computed with at most this many finished candidates less
+        than the experiment currently has are still served.
+    max_proposal_staleness_seconds : float or None
+        Proposals older than this are not served anymore. None means no
+        limit.
+    journal : ExperimentJournal or None
+        The journal all candidate transitions and the optimizer state are
+        written to, if any.
     logger : logging.logger
         The logger for this class.
     """
@@ -50,12 +74,35 @@ class BasicExperimentAssistant(object):
     experiment_directory_base = None
     csv_write_frequency = None
     csv_steps_written = 0
+    csv_flush_rows = None
+    csv_flush_interval = None
+    _csv_writer = None
+
+    precompute_proposals = False
+    max_proposal_staleness_steps = 1
+    max_proposal_staleness_seconds = None
+    _pending_step = None
+    _pending_time = None
+    _experiment_lock = None
+    _optimizer_lock = None
+    _precompute_condition = None
+    _precompute_thread = None
+    _precompute_snapshot = None
+    _precomputed = None
+    _precomputed_step = None
+    _precomputed_time = None
+
+    journal = None
+    _restored_optimizer_state = None
 
     logger = None
 
     def __init__(self, name, optimizer, param_defs, experiment=None, optimizer_arguments=None,
                  minimization=True, write_directory_base="/tmp/APSIS_WRITING",
-                 experiment_directory_base=None, csv_write_frequency=1):
+                 experiment_directory_base=None, csv_write_frequency=1,
+                 csv_flush_rows=10, csv_flush_interval=5.,
+                 precompute_proposals=False, max_proposal_staleness_steps=1,
+                 max_proposal_staleness_seconds=None, journal_filename=None):
         """
         Initializes the BasicExperimentAssistant.
 
@@ -89,18 +136,75 @@ class BasicExperimentAssistant(object):
         csv_write_frequency : int, optional
             States how often the csv file should be written to.
             If set to 0 no results will be written.
+        csv_flush_rows : int, optional
+            The results file is kept open and flushed every csv_flush_rows
+            rows. Default is 10.
+        csv_flush_interval : float, optional
+            The results file is also flushed if this many seconds have passed
+            since the last flush. Default is 5.
+        precompute_proposals : bool, optional
+            If True, the optimizer computes the next proposals in a
+            background thread after each finished candidate, on a snapshot
+            of the experiment. get_next_candidate then serves them
+            immediately as long as they are fresh enough. Default is False,
+            which computes proposals on request and discards them after
+            each finished candidate.
+        max_proposal_staleness_steps : int, optional
+            Proposals computed with at most this many finished candidates
+            less than the experiment currently has are still served.
+            Default is 1.
+        max_proposal_staleness_seconds : float or None, optional
+            Proposals older than this many seconds are not served anymore.
+            Default is None, which means no limit.
+        journal_filename : string or None, optional
+            If given, all candidate transitions and the optimizer state are
+            journaled to this SQLite file. If the file already contains an
+            experiment, that experiment is resumed instead of creating a new
+            one, and the optimizer continues from its stored state. Default
+            is None, which keeps the experiment in memory only.
+
+        Raises
+        ------
+        ValueError :
+            Iff experiment is given and the journal already contains one.
         """
         self.logger = get_logger(self)
         self.logger.info("Initializing experiment assistant.")
         self.optimizer = optimizer
         self.optimizer_arguments = optimizer_arguments
 
-        if experiment is None:
+        restored = None
+        if journal_filename is not None:
+            self.journal = ExperimentJournal(journal_filename)
+            restored = self.journal.read_experiment()
+        if restored is not None:
+            if experiment is not None:
+                raise ValueError("The journal %s already contains an "
+                                 "experiment." %journal_filename)
+            self.logger.info("Resuming experiment with %i finished "
+                             "candidates from %s."
+                             %(len(restored.candidates_finished),
+                               journal_filename))
+            self.experiment = restored
+            self._restored_optimizer_state = \
+                self.journal.read_optimizer_state()
+        elif experiment is None:
             self.experiment = Experiment(name, param_defs, minimization)
         else:
             self.experiment = experiment
+        if self.journal is not None and restored is None:
+            self.journal.write_experiment(self.experiment)
 
         self.csv_write_frequency = csv_write_frequency
+        self.csv_flush_rows = csv_flush_rows
+        self.csv_flush_interval = csv_flush_interval
+
+        self.precompute_proposals = precompute_proposals
+        self.max_proposal_staleness_steps = max_proposal_staleness_steps
+        self.max_proposal_staleness_seconds = max_proposal_staleness_seconds
+        self._experiment_lock = threading.RLock()
+        self._optimizer_lock = threading.Lock()
+        self._precompute_condition = threading.Condition()
 
         if self.csv_write_frequency != 0:
             self.write_directory_base = write_directory_base
@@ -121,16 +225,86 @@ class BasicExperimentAssistant(object):
             The Candidate object that should be evaluated next. May be None.
         """
         self.logger.info("Returning next candidate.")
-        self.optimizer = check_optimizer(self.optimizer,
-                                optimizer_arguments=self.optimizer_arguments)
-        if not self.experiment.candidates_pending:
-            self.experiment.candidates_pending.extend(
-                self.optimizer.get_next_candidates(self.experiment))
-        next_candidate = self.experiment.candidates_pending.pop()
+        candidates = self._get_candidates(1, exact=False)
+        next_candidate = candidates[0] if candidates else None
         self.logger.info("next candidate found: %s" %next_candidate)
         return next_candidate
 
+    def get_next_candidates(self, num_candidates):
+        """
+        Returns several Candidates to evaluate next.
+
+        Pending candidates are returned first. The missing ones are computed
+        by a single call to the optimizer, so this is cheaper than calling
+        get_next_candidate num_candidates times.
+
+        Parameters
+        ----------
+        num_candidates : int
+            The number of Candidates to return.
+
+        Returns
+        -------
+        next_candidates : list of Candidate
+            The Candidates that should be evaluated next. Usually contains
+            num_candidates Candidates, but may contain less.
+        """
+        self.logger.info("Returning %i next candidates." %num_candidates)
+        return self._get_candidates(num_candidates, exact=True)
+
+    def _get_candidates(self, num_candidates, exact):
+        """
+        Pops num_candidates pending candidates, computing them if necessary.
 
+        Parameters
+        ----------
+        num_candidates : int
+            The number of Candidates to return.
+        exact : bool
+            If True, the optimizer is asked for exactly the number of missing
+            candidates. Otherwise, it chooses how many to propose, and the
+            surplus is kept pending.
+
+        Returns
+        -------
+        next_candidates : list of Candidate
+            At most num_candidates Candidates.
+        """
+        if self.precompute_proposals:
+            self._wait_for_precomputation()
+        with self._experiment_lock:
+            candidates = self._pop_pending_candidates(num_candidates)
+        if len(candidates) < num_candidates:
+            with self._optimizer_lock:
+                with self._experiment_lock:
+                    #another caller may have computed candidates meanwhile.
+                    candidates.extend(self._pop_pending_candidates(
+                        num_candidates - len(candidates)))
+                    missing = num_candidates - len(candidates)
+                    if missing > 0:
+                        snapshot = self._snapshot_experiment()
+                if missing > 0:
+                    #the optimizer works on a snapshot, so updates do not
+                    #have to wait for it.
+                    self._check_optimizer()
+                    if exact:
+                        new_candidates = self.optimizer.get_next_candidates(
+                            snapshot, num_candidates=missing)
+                    else:
+                        new_candidates = self.optimizer.get_next_candidates(
+                            snapshot)
+                    self._journal_optimizer_state()
+                    with self._experiment_lock:
+                        self.experiment.candidates_pending.extend(
+                            new_candidates)
+                        self._pending_step = len(
+                            snapshot.candidates_finished)
+                        self._pending_time = time.time()
+                        while (len(candidates) < num_candidates and
+                               self.experiment.candidates_pending):
+                            candidates.append(
+                                self.experiment.candidates_pending.pop())
+        return candidates
 
     def update(self, candidate, status="finished"):
         """
@@ -165,22 +339,39 @@ class BasicExperimentAssistant(object):
                          " and result %s" %(status, candidate, candidate.params,
                                             candidate.result))
 
-        if status == "finished":
-            self.experiment.add_finished(candidate)
-            #Also delete all pending candidates from the experiment - we have
-            #new data available.
-            self.experiment.candidates_pending = []
-
-            #invoke the writing to files
-            step = len(self.experiment.candidates_finished)
-            if self.csv_write_frequency != 0 and step != 0 \
-                    and step % self.csv_write_frequency == 0:
-                self._append_to_detailed_csv()
-
-        elif status == "pausing":
-            self.experiment.add_pausing(candidate)
-        elif status == "working":
-            self.experiment.add_working(candidate)
+        with self._experiment_lock:
+            if not self.experiment._check_candidate(candidate):
+                message = ("candidate %s is not valid for the experiment."
+                           %str(candidate))
+                self.logger.error(message)
+                raise ValueError(message)
+            if self.journal is not None:
+                #journaled after the candidate has been validated, so only
+                #transitions the experiment accepts are replayed, but before
+                #the experiment changes, so a failed write leaves both
+                #unchanged.
+                self.journal.append(status, candidate)
+            if status == "finished":
+                self.experiment.add_finished(candidate)
+                if self.precompute_proposals:
+                    #the pending candidates are kept while they are fresh
+                    #enough, and replaced once the new proposals are ready.
+                    self._start_precomputation()
+                else:
+                    #Also delete all pending candidates from the experiment -
+                    #we have new data available.
+                    self.experiment.candidates_pending = []
+
+                #invoke the writing to files
+                step = len(self.experiment.candidates_finished)
+                if self.csv_write_frequency != 0 and step != 0 \
+                        and step % self.csv_write_frequency == 0:
+                    self._append_to_detailed_csv()
+
+            elif status == "pausing":
+                self.experiment.add_pausing(candidate)
+            elif status == "working":
+                self.experiment.add_working(candidate)
 
     def get_best_candidate(self):
         """
@@ -192,29 +383,235 @@ class BasicExperimentAssistant(object):
             Returns a candidate if there is a best one (which corresponds to
             at least one candidate evaluated) or None if none exists.
         """
-        return self.experiment.best_candidate
+        with self._experiment_lock:
+            return self.experiment.best_candidate
+
+    def close(self):
+        """
+        Waits for the proposal precomputation and closes the results file
+        and the journal.
+
+        Further results will reopen them for appending.
+        """
+        with self._precompute_condition:
+            self._precompute_snapshot = None
+            while self._precompute_thread is not None:
+                self._precompute_condition.wait()
+        if self._csv_writer is not None:
+            self._csv_writer.close()
+            self._csv_writer = None
+        if self.journal is not None:
+            self.journal.close()
+
+    def _check_optimizer(self):
+        """
+        Initializes the optimizer if necessary and restores its journaled
+        state. The caller has to hold _optimizer_lock.
+        """
+        self.optimizer = check_optimizer(self.optimizer,
+                            optimizer_arguments=self.optimizer_arguments)
+        if self._restored_optimizer_state is not None:
+            self.optimizer.set_state(self._restored_optimizer_state)
+            self._restored_optimizer_state = None
+
+    def _journal_optimizer_state(self):
+        """
+        Writes the optimizer's state to the journal, if any. The caller has
+        to hold _optimizer_lock.
+        """
+        if self.journal is not None:
+            self.journal.write_optimizer_state(self.optimizer.get_state())
+
+    def _is_fresh(self, step, computed_time):
+        """
+        Returns whether proposals are fresh enough to be served.
+
+        Parameters
+        ----------
+        step : int or None
+            The number of finished candidates the proposals were computed
+            with.
+        computed_time : float or None
+            The time at which the proposals were computed.
+
+        Returns
+        -------
+        fresh : bool
+            True iff the proposals satisfy both staleness limits.
+        """
+        if step is None:
+            return False
+        finished = len(self.experiment.candidates_finished)
+        if finished - step > self.max_proposal_staleness_steps:
+            return False
+        if (self.max_proposal_staleness_seconds is not None and
+                time.time() - computed_time >
+                self.max_proposal_staleness_seconds):
+            return False
+        return True
+
+    def _start_precomputation(self):
+        """
+        Requests new proposals to be computed in the background.
+
+        The computation uses a snapshot of the current experiment. If a
+        computation is already running, only the latest request is computed
+        after it finishes.
+        """
+        snapshot = self._snapshot_experiment()
+        with self._precompute_condition:
+            self._precompute_snapshot = snapshot
+            if self._precompute_thread is None:
+                self._precompute_thread = threading.Thread(
+                    target=self._precompute_worker,
+                    name="apsis-precompute-%s" %self.experiment.name)
+                self._precompute_thread.daemon = True
+                self._precompute_thread.start()
+
+    def _precompute_worker(self):
+        """
+        The loop of the precomputation thread.
+
+        Computes proposals for the latest snapshot until no further one has
+        been requested.
+        """
+        while True:
+            with self._precompute_condition:
+                snapshot = self._precompute_snapshot
+                self._precompute_snapshot = None
+                if snapshot is None:
+                    self._precompute_thread = None
+                    self._precompute_condition.notify_all()
+                    return
+            candidates = None
+            try:
+                with self._optimizer_lock:
+                    self._check_optimizer()
+                    candidates = self.optimizer.get_next_candidates(snapshot)
+                    self._journal_optimizer_state()
+            except Exception as e:
+                self.logger.exception("Precomputing proposals failed: %s" %e)
+            with self._precompute_condition:
+                if candidates is not None:
+                    self._precomputed = candidates
+                    self._precomputed_step = len(snapshot.candidates_finished)
+                    self._precomputed_time = time.time()
+                self._precompute_condition.notify_all()
+
+    def _snapshot_experiment(self):
+        """
+        Returns a clone of the experiment for the optimizer.
+
+        The finished matrix is built on the experiment itself, so all
+        snapshots share it and it is only appended to afterwards instead of
+        being rebuilt for every snapshot. The caller has to hold
+        _experiment_lock.
+        """
+        if self.experiment.supports_finished_matrix():
+            self.experiment.get_finished_matrix()
+        return self.experiment.clone()
+
+    def _pop_pending_candidate(self):
+        """
+        Pops the next pending candidate if it is fresh enough.
+
+        Stale pending candidates are discarded, and newer precomputed
+        proposals replace the pending ones. The caller has to hold
+        _experiment_lock.
+
+        Returns
+        -------
+        next_candidate : Candidate or None
+            The next pending candidate, or None if there is none.
+        """
+        if self.precompute_proposals:
+            self._install_precomputed_proposals()
+        #pending candidates not proposed by the optimizer are always kept.
+        if (self.experiment.candidates_pending and
+                self._pending_step is not None and
+                not self._is_fresh(self._pending_step, self._pending_time)):
+            self.logger.debug("Discarding stale pending candidates.")
+            self.experiment.candidates_pending = []
+        if not self.experiment.candidates_pending:
+            return None
+        return self.experiment.candidates_pending.pop()
+
+    def _pop_pending_candidates(self, num_candidates):
+        """
+        Pops up to num_candidates pending candidates if they are fresh enough.
+
+        The caller has to hold _experiment_lock.
+
+        Returns
+        -------
+        next_candidates : list of Candidate
+            The popped candidates, in order.
+        """
+        candidates = []
+        while len(candidates) < num_candidates:
+            candidate = self._pop_pending_candidate()
+            if candidate is None:
+                break
+            candidates.append(candidate)
+        return candidates
+
+    def _wait_for_precomputation(self):
+        """
+        Waits for a running precomputation if nothing fresh is available.
+
+        If neither the pending candidates nor the precomputed proposals are
+        fresh, the running precomputation is likely to finish before a new
+        computation would.
+        """
+        with self._precompute_condition:
+            while (self._precompute_thread is not None and
+                   not self._is_fresh(self._precomputed_step,
+                                      self._precomputed_time) and
+                   not (self.experiment.candidates_pending and
+                        self._is_fresh(self._pending_step,
+                                       self._pending_time))):
+                self._precompute_condition.wait()
+
+    def _install_precomputed_proposals(self):
+        """
+        Replaces the pending candidates by newer precomputed proposals.
+
+        Proposals which have been handed out or finished since are dropped.
+        The caller has to hold _experiment_lock.
+        """
+        with self._precompute_condition:
+            if self._precomputed is None:
+                return
+            if (self._pending_step is not None and
+                    self._precomputed_step < self._pending_step):
+                self._precomputed = None
+                return
+            candidates = [c for c in self._precomputed if
+                          c not in self.experiment.candidates_finished and
+                          c not in self.experiment.candidates_working]
+            self.experiment.candidates_pending = candidates
+            self._pending_step = self._precomputed_step
+            self._pending_time = self._precomputed_time
+            self._precomputed = None
 
     def _append_to_detailed_csv(self):
         if len(self.experiment.candidates_finished) <= self.csv_steps_written:
             return
 
-        #create file and header if
-        wHeader = False
-        if self.csv_steps_written == 0:
-            #set use header
-            wHeader = True
-
-        csv_string, steps_included = self.experiment.to_csv_results(wHeader=wHeader,
-                                            fromIndex=self.csv_steps_written)
+        if self._csv_writer is None:
+            filename = os.path.join(self.experiment_directory_base,
+                                    self.experiment.name + "_results.csv")
+            self._csv_writer = BufferedCSVWriter(filename,
+                                        flush_rows=self.csv_flush_rows,
+                                        flush_interval=self.csv_flush_interval)
 
-        #write
-        filename = os.path.join(self.experiment_directory_base,
-                                self.experiment.name + "_results.csv")
-
-        with open(filename, 'a+') as detailed_file:
-            detailed_file.write(csv_string)
+        #create header if nothing has been written yet.
+        if self.csv_steps_written == 0:
+            self._csv_writer.writerow(self.experiment.csv_header())
 
-        self.csv_steps_written += steps_included
+        for row in self.experiment.csv_rows(fromIndex=self.csv_steps_written):
+            self._csv_writer.writerow(row)
+            self.csv_steps_written += 1
 
     def _create_experiment_directory(self):
         global_start_date = time.time()
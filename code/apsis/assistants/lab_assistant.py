@@ -2,13 +2,14 @@ __author__ = 'Frederik Diehl'
 
 from apsis.assistants.experiment_assistant import BasicExperimentAssistant, PrettyExperimentAssistant
 import matplotlib.pyplot as plt
-from apsis.utilities.plot_utils import _create_figure, _polish_figure, plot_lists, write_plot_to_file
+from apsis.utilities.plot_utils import _create_figure, _polish_figure, plot_lists, write_plot_to_file, PYPLOT_LOCK
 from apsis.utilities.file_utils import ensure_directory_exists
 import time
 import datetime
 import os
 from apsis.utilities.logging_utils import get_logger
 import numpy as np
+import threading
 
 class BasicLabAssistant(object):
     """
@@ -34,6 +35,8 @@ class BasicLabAssistant(object):
     global_start_date = None
     logger = None
 
+    _lock = None
+
     def __init__(self, write_directory_base="/tmp/APSIS_WRITING"):
         """
         Initializes the lab assistant with no experiments.
@@ -44,6 +47,7 @@ class BasicLabAssistant(object):
             The directory to write all the results and plots to.
         """
         self.exp_assistants = {}
+        self._lock = threading.RLock()
         self.logger = get_logger(self)
         self.logger.info("Initializing laboratory assistant.")
         self.write_directory_base = write_directory_base
@@ -53,7 +57,8 @@ class BasicLabAssistant(object):
         self.logger.info("laboratory assistant successfully initialized.")
 
     def init_experiment(self, name, optimizer, param_defs,
-                        optimizer_arguments=None, minimization=True):
+                        optimizer_arguments=None, minimization=True,
+                        journal_filename=None):
         """
         Initializes a new experiment.
 
@@ -74,18 +79,23 @@ class BasicLabAssistant(object):
             as to which are available.
         minimization : bool, optional
             Whether the problem is one of minimization or maximization.
+        journal_filename : string or None, optional
+            The SQLite file to journal the experiment to. If it already
+            contains the experiment, it is resumed. See
+            BasicExperimentAssistant.
         """
         self.logger.info("Initializing new experiment \"%s\". "
                      " Parameter definitions: %s. Minimization is %s"
                      %(name, param_defs, minimization))
-        if name in self.exp_assistants:
-            raise ValueError("Already an experiment with name %s registered."
-                             %name)
-        self.exp_assistants[name] = PrettyExperimentAssistant(name, optimizer,
-            param_defs, optimizer_arguments=optimizer_arguments,
-            minimization=minimization,
-            write_directory_base=self.lab_run_directory,
-            csv_write_frequency=1)
+        with self._lock:
+            if name in self.exp_assistants:
+                raise ValueError("Already an experiment with name %s "
+                                 "registered." %name)
+            self.exp_assistants[name] = PrettyExperimentAssistant(name,
+                optimizer, param_defs, optimizer_arguments=optimizer_arguments,
+                minimization=minimization,
+                write_directory_base=self.lab_run_directory,
+                csv_write_frequency=1, journal_filename=journal_filename)
         self.logger.info("Experiment initialized successfully.")
 
     def get_next_candidate(self, exp_name):
@@ -104,6 +114,26 @@ class BasicLabAssistant(object):
         """
         return self.exp_assistants[exp_name].get_next_candidate()
 
+    def get_next_candidates(self, exp_name, num_candidates):
+        """
+        Returns several Candidates to evaluate next for a specific experiment.
+
+        Parameters
+        ----------
+        exp_name : string
+            Has to be in experiment_assistants.
+        num_candidates : int
+            The number of Candidates to return.
+
+        Returns
+        -------
+        next_candidates : list of Candidate
+            The Candidates that should be evaluated next. Usually contains
+            num_candidates Candidates, but may contain less.
+        """
+        return self.exp_assistants[exp_name].get_next_candidates(
+            num_candidates)
+
     def update(self, exp_name, candidate, status="finished"):
         """
         Updates the experiment with the status of an experiment
@@ -141,6 +171,13 @@ class BasicLabAssistant(object):
         """
         return self.exp_assistants[exp_name].get_best_candidate()
 
+    def close(self):
+        """
+        Flushes and closes the result files of all experiments.
+        """
+        for exp_assistant in self.exp_assistants.values():
+            exp_assistant.close()
+
     def _init_directory_structure(self):
         """
         Method to create the directory structure if not exists
@@ -156,13 +193,199 @@ class BasicLabAssistant(object):
             ensure_directory_exists(self.lab_run_directory)
 
 class PrettyLabAssistant(BasicLabAssistant):
+    """
+    A 'prettier' version of the lab assistant, which writes out plots.
+
+    After each update, the plots are written out. By default, this happens in
+    a background thread, so update never waits for the rendering. Requests
+    arriving while a plot is being rendered are coalesced into one.
+
+    Attributes
+    ----------
+    async_plotting : bool
+        Whether plots are rendered in a background thread.
+    plot_min_interval : float
+        The minimum number of seconds between two renderings. Requests
+        arriving earlier are delayed and coalesced, or dropped if
+        async_plotting is False.
+    plot_every_n_steps : int
+        Only every plot_every_n_steps-th plot request is rendered. If 0, no
+        plots are written automatically.
+    """
     COLORS = ["g", "r", "c", "b", "m", "y"]
 
+    async_plotting = None
+    plot_min_interval = None
+    plot_every_n_steps = None
+
+    _plot_thread = None
+    _plot_condition = None
+    _plot_pending = None
+    _plot_rendering = None
+    _plot_closing = None
+    _plot_requests_skipped = None
+    _last_plot_time = None
+
+    def __init__(self, write_directory_base="/tmp/APSIS_WRITING",
+                 async_plotting=True, plot_min_interval=0.,
+                 plot_every_n_steps=1):
+        """
+        Initializes the lab assistant with no experiments.
+
+        Parameters
+        ----------
+        write_directory_base : String, optional
+            The directory to write all the results and plots to.
+        async_plotting : bool, optional
+            Whether plots are rendered in a background thread. Default is
+            True.
+        plot_min_interval : float, optional
+            The minimum number of seconds between two renderings. Default is
+            0.
+        plot_every_n_steps : int, optional
+            Only every plot_every_n_steps-th plot request is rendered. If 0,
+            no plots are written automatically. Default is 1.
+        """
+        self.async_plotting = async_plotting
+        self.plot_min_interval = plot_min_interval
+        self.plot_every_n_steps = plot_every_n_steps
+        self._plot_condition = threading.Condition()
+        self._plot_pending = False
+        self._plot_rendering = False
+        self._plot_closing = False
+        self._plot_requests_skipped = 0
+        self._last_plot_time = 0
+        super(PrettyLabAssistant, self).__init__(
+            write_directory_base=write_directory_base)
+
     def update(self, exp_name, candidate, status="finished"):
         super(PrettyLabAssistant, self).update(exp_name, candidate, status=status)
 
         #trigger the writing, but by default only on equal steps
-        self.write_out_plots_current_step(same_steps_only=True)
+        self._request_plot_writing(same_steps_only=True)
+
+    def flush_plots(self, timeout=None):
+        """
+        Waits until all requested plots have been written.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum number of seconds to wait. If None, waits
+            indefinitely.
+
+        Returns
+        -------
+        flushed : bool
+            True iff no plot is pending or being rendered anymore.
+        """
+        end_time = None
+        if timeout is not None:
+            end_time = time.time() + timeout
+        with self._plot_condition:
+            #a pending plot should not wait for the minimum interval.
+            self._last_plot_time = 0
+            self._plot_condition.notify_all()
+            while self._plot_pending or self._plot_rendering:
+                if end_time is None:
+                    self._plot_condition.wait()
+                else:
+                    remaining = end_time - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._plot_condition.wait(remaining)
+        return True
+
+    def close(self):
+        """
+        Writes the outstanding plots, stops the plotting thread and closes
+        all result files.
+        """
+        self._stop_plotting()
+        super(PrettyLabAssistant, self).close()
+
+    def _stop_plotting(self):
+        """
+        Writes the outstanding plots and stops the plotting thread.
+        """
+        self.flush_plots()
+        with self._plot_condition:
+            self._plot_closing = True
+            self._plot_condition.notify_all()
+        if self._plot_thread is not None:
+            self._plot_thread.join()
+            self._plot_thread = None
+
+    def _request_plot_writing(self, same_steps_only=True):
+        """
+        Requests the plots of the current step to be written.
+
+        This applies the throttling settings and, if async_plotting is set,
+        only hands the request to the plotting thread.
+
+        Parameters
+        ---------
+        same_steps_only : boolean, optional
+            Write only if all experiment assistants in this lab assistant
+            are currently in the same step.
+        """
+        if not self.plot_every_n_steps:
+            return
+        if same_steps_only and not self._compute_current_step_overall()[1]:
+            return
+        with self._lock:
+            self._plot_requests_skipped += 1
+            if self._plot_requests_skipped < self.plot_every_n_steps:
+                return
+            self._plot_requests_skipped = 0
+
+        if not self.async_plotting:
+            if time.time() - self._last_plot_time >= self.plot_min_interval:
+                self.write_out_plots_current_step(same_steps_only=False)
+                self._last_plot_time = time.time()
+            return
+
+        with self._plot_condition:
+            self._plot_pending = True
+            if self._plot_thread is None:
+                self._plot_closing = False
+                self._plot_thread = threading.Thread(
+                    target=self._plot_worker, name="apsis-plotting")
+                self._plot_thread.daemon = True
+                self._plot_thread.start()
+            self._plot_condition.notify_all()
+
+    def _plot_worker(self):
+        """
+        The loop of the plotting thread.
+
+        Renders the pending plot request once the minimum interval since the
+        last rendering has passed, until close is called.
+        """
+        while True:
+            with self._plot_condition:
+                while not self._plot_pending and not self._plot_closing:
+                    self._plot_condition.wait()
+                if not self._plot_pending:
+                    return
+                wait = (self._last_plot_time + self.plot_min_interval
+                        - time.time())
+                if wait > 0 and not self._plot_closing:
+                    self._plot_condition.wait(wait)
+                    continue
+                self._plot_pending = False
+                self._plot_rendering = True
+            try:
+                #the step requirement has already been checked on request.
+                with PYPLOT_LOCK:
+                    self.write_out_plots_current_step(same_steps_only=False)
+            except Exception as e:
+                self.logger.exception("Writing plots failed: %s" %e)
+            finally:
+                with self._plot_condition:
+                    self._last_plot_time = time.time()
+                    self._plot_rendering = False
+                    self._plot_condition.notify_all()
 
 
     def write_out_plots_current_step(self, same_steps_only=True):
@@ -318,18 +541,20 @@ class ValidationLabAssistant(PrettyLabAssistant):
     ----------
     cv : int
         The number of crossvalidations used.
-    exp_current : dict
-        A dictionary of string keys and int or None values, which stores the
-        last experiment for each experiment name from which a candidate has
-        been returned.
+    candidate_folds : dict
+        A dictionary of experiment names to dictionaries, which map the
+        cand_id of each candidate handed out and not yet finished to the
+        index of the sub-experiment it belongs to. This allows several
+        workers to evaluate candidates of the same experiment at once.
     disable_auto_plot: bool
         To disable automatic plot writing functionality completely.
     """
     cv = None
-    exp_current = None
+    candidate_folds = None
     disable_auto_plot = None
 
-    def __init__(self, cv=5, disable_auto_plot=False):
+    def __init__(self, cv=5, disable_auto_plot=False, async_plotting=True,
+                 plot_min_interval=0., plot_every_n_steps=1):
         """
         Initializes the ValidationLabAssistant.
 
@@ -339,11 +564,30 @@ class ValidationLabAssistant(PrettyLabAssistant):
             The number of crossvalidations used.
         disable_auto_plot: bool, optional
             To disable automatic plot writing functionality completely.
+        async_plotting : bool, optional
+            Whether plots are rendered in a background thread.
+        plot_min_interval : float, optional
+            The minimum number of seconds between two renderings.
+        plot_every_n_steps : int, optional
+            Only every plot_every_n_steps-th plot request is rendered.
         """
-        super(ValidationLabAssistant, self).__init__()
+        super(ValidationLabAssistant, self).__init__(
+            async_plotting=async_plotting,
+            plot_min_interval=plot_min_interval,
+            plot_every_n_steps=plot_every_n_steps)
         self.cv = cv
         self.disable_auto_plot = disable_auto_plot
-        self.exp_current = {}
+        self.candidate_folds = {}
+
+    def close(self):
+        """
+        Writes the outstanding plots, stops the plotting thread and closes
+        the result files of all experiments.
+        """
+        self._stop_plotting()
+        for exp_assistants in self.exp_assistants.values():
+            for exp_assistant in exp_assistants:
+                exp_assistant.close()
 
     def init_experiment(self, name, optimizer, param_defs,
                         optimizer_arguments=None, minimization=True):
@@ -375,17 +619,19 @@ class ValidationLabAssistant(PrettyLabAssistant):
         self.logger.info("Initializing new experiment \"%s\". "
                      " Parameter definitions: %s. Minimization is %s"
                      %(name, param_defs, minimization))
-        if name in self.exp_assistants:
-            raise ValueError("Already an experiment with name %s registered."
-                             %name)
-        self.exp_assistants[name] = []
-        self.exp_current[name] = None
-        for i in range(self.cv):
-            self.exp_assistants[name].append(PrettyExperimentAssistant(name + "_" + str(i), optimizer,
-                param_defs, optimizer_arguments=optimizer_arguments,
-                minimization=minimization,
-                write_directory_base=self.lab_run_directory,
-                csv_write_frequency=1))
+        with self._lock:
+            if name in self.exp_assistants:
+                raise ValueError("Already an experiment with name %s "
+                                 "registered." %name)
+            exp_assistants = []
+            for i in range(self.cv):
+                exp_assistants.append(PrettyExperimentAssistant(name + "_" + str(i), optimizer,
+                    param_defs, optimizer_arguments=optimizer_arguments,
+                    minimization=minimization,
+                    write_directory_base=self.lab_run_directory,
+                    csv_write_frequency=1))
+            self.candidate_folds[name] = {}
+            self.exp_assistants[name] = exp_assistants
         self.logger.info("Experiment initialized successfully.")
 
     def clone_experiments_by_name(self, exp_name, new_exp_name, optimizer,
@@ -421,16 +667,15 @@ class ValidationLabAssistant(PrettyLabAssistant):
             These are arguments for the optimizer. Refer to their documentation
             as to which are available.
         """
-        self.exp_assistants[new_exp_name] = []
-        self.exp_current[new_exp_name] = None
+        new_exp_assistants = []
 
         #every experiment has self.cv many assistants
         for i in range(len(self.exp_assistants[exp_name])):
             old_exp_assistant = self.exp_assistants[exp_name][i]
-            old_exp = old_exp_assistant.experiment
 
             #clone and rename experiment
-            new_exp = old_exp.clone()
+            with old_exp_assistant._experiment_lock:
+                new_exp = old_exp_assistant.experiment.clone()
 
             new_name_cved = new_exp_name + "_" + str(i)
             new_exp.name = new_name_cved
@@ -441,7 +686,14 @@ class ValidationLabAssistant(PrettyLabAssistant):
                 minimization=new_exp.minimization_problem,
                 write_directory_base=self.lab_run_directory,
                 csv_write_frequency=1)
-            self.exp_assistants[new_exp_name].append(new_exp_assistant)
+            new_exp_assistants.append(new_exp_assistant)
+
+        with self._lock:
+            if new_exp_name in self.exp_assistants:
+                raise ValueError("Already an experiment with name %s "
+                                 "registered." %new_exp_name)
+            self.candidate_folds[new_exp_name] = {}
+            self.exp_assistants[new_exp_name] = new_exp_assistants
 
         self.logger.info("Experiment " + str(exp_name) + " cloned to " + str(new_exp_name) + " and successfully initialized.")
 
@@ -453,25 +705,38 @@ class ValidationLabAssistant(PrettyLabAssistant):
         """
         Updates the experiment with a new candidate.
 
-        This is done by updating the experiment from which the last candidate
-        has been returned using get_next_candidate.
+        This is done by updating the sub-experiment from which the candidate
+        has been returned by get_next_candidate, identified by its cand_id.
         Note that this LabAssistant does not feature the ability to update with
         arbitrary candidates.
+
+        Raises
+        ------
+        ValueError :
+            Iff candidate has not been handed out by get_next_candidate or
+            has already been finished.
         """
-        if self.exp_current[exp_name] is None:
-            raise ValueError("No candidate given to the outside for that experiment.")
-        self.exp_assistants[exp_name][self.exp_current[exp_name]].update(candidate, status)
-        self.exp_current[exp_name] = None
+        with self._lock:
+            fold = self.candidate_folds[exp_name].get(candidate.cand_id)
+            if fold is None:
+                raise ValueError("No candidate given to the outside for that "
+                                 "experiment.")
+        self.exp_assistants[exp_name][fold].update(candidate, status)
+        #only forgotten once the update succeeded, so a rejected update can
+        #be retried.
+        if status == "finished":
+            with self._lock:
+                self.candidate_folds[exp_name].pop(candidate.cand_id, None)
 
         if not self.disable_auto_plot:
-            self.write_out_plots_current_step()
+            self._request_plot_writing()
 
     def get_next_candidate(self, exp_name):
         """
         Returns the Candidate next to evaluate for a specific experiment.
 
         This is done by using the get_next_candidate function from the
-        sub-experiment with the least finished candidates.
+        sub-experiment with the least finished and outstanding candidates.
 
         Parameters
         ----------
@@ -483,14 +748,59 @@ class ValidationLabAssistant(PrettyLabAssistant):
         next_candidate : Candidate or None:
             The Candidate object that should be evaluated next. May be None.
         """
-        min_finished = 0
-        for i in range(len(self.exp_assistants[exp_name])):
-            if (len(self.exp_assistants[exp_name][i].experiment.candidates_finished) <
-                len(self.exp_assistants[exp_name][min_finished].experiment.candidates_finished)):
-                if i != self.exp_current[exp_name]:
-                    min_finished = i
-        self.exp_current[exp_name] = min_finished
-        return self.exp_assistants[exp_name][min_finished].get_next_candidate()
+        exp_assistants = self.exp_assistants[exp_name]
+        with self._lock:
+            outstanding = [0] * len(exp_assistants)
+            for fold in self.candidate_folds[exp_name].values():
+                outstanding[fold] += 1
+            min_fold = 0
+            min_load = None
+            for i, exp_assistant in enumerate(exp_assistants):
+                load = (len(exp_assistant.experiment.candidates_finished)
+                        + outstanding[i])
+                if min_load is None or load < min_load:
+                    min_fold = i
+                    min_load = load
+            #reserve the fold before computing the candidate, so concurrent
+            #callers are spread over the folds.
+            reservation = object()
+            self.candidate_folds[exp_name][reservation] = min_fold
+        candidate = None
+        try:
+            candidate = exp_assistants[min_fold].get_next_candidate()
+        finally:
+            with self._lock:
+                del self.candidate_folds[exp_name][reservation]
+                if candidate is not None:
+                    self.candidate_folds[exp_name][candidate.cand_id] = \
+                        min_fold
+        return candidate
+
+    def get_next_candidates(self, exp_name, num_candidates):
+        """
+        Returns several Candidates to evaluate next for a specific experiment.
+
+        Each Candidate is chosen as in get_next_candidate, so they are spread
+        over the sub-experiments.
+
+        Parameters
+        ----------
+        exp_name : string
+            Has to be in experiment_assistants.
+        num_candidates : int
+            The number of Candidates to return.
+
+        Returns
+        -------
+        next_candidates : list of Candidate
+            The Candidates that should be evaluated next.
+        """
+        candidates = []
+        for i in range(num_candidates):
+            candidate = self.get_next_candidate(exp_name)
+            if candidate is not None:
+                candidates.append(candidate)
+        return candidates
 
     def plot_result_per_step(self, experiments, show_plot=True, plot_min=None, plot_max=None, title=None):
         """
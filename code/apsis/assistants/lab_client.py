@@ -0,0 +1,216 @@
+__author__ = 'Frederik Diehl'
+
+import socket
+import json
+from apsis.models.candidate import from_dict
+from apsis.models.parameter_definition import param_def_to_dict
+from apsis.utilities.json_utils import to_json
+
+
+class RemoteError(Exception):
+    """
+    An exception raised by the lab assistant behind a LabAssistantServer.
+
+    Attributes
+    ----------
+    error_type : string
+        The name of the exception's type on the server.
+    """
+    error_type = None
+
+    def __init__(self, error_type, message):
+        super(RemoteError, self).__init__("%s: %s" %(error_type, message))
+        self.error_type = error_type
+
+
+class LabAssistantClient(object):
+    """
+    Calls a lab assistant exposed by a LabAssistantServer.
+
+    It offers the same methods as the lab assistant and keeps one connection
+    open for all calls. Only the standard library and apsis.models are used,
+    so workers do not need to import the optimizers.
+
+    Several calls can be sent at once, either as one request (batch) or as
+    several requests without waiting for the responses in between
+    (pipeline).
+
+    A client must not be used by several threads at once; use one client
+    per thread instead.
+
+    Attributes
+    ----------
+    address : (string, int) tuple
+        The host and port of the server.
+    """
+    #exceptions of these types are raised as the same type on the client.
+    BUILTIN_ERRORS = {
+        "ValueError": ValueError,
+        "KeyError": KeyError,
+        "TypeError": TypeError,
+        "IndexError": IndexError,
+    }
+
+    address = None
+
+    _socket = None
+    _rfile = None
+    _next_id = 0
+
+    def __init__(self, host="localhost", port=None, timeout=None):
+        """
+        Connects to a LabAssistantServer.
+
+        Parameters
+        ----------
+        host : string, optional
+            The host of the server. Default is "localhost".
+        port : int
+            The port of the server.
+        timeout : float or None, optional
+            The socket timeout in seconds. Default is None, which waits
+            indefinitely.
+        """
+        self.address = (host, port)
+        self._socket = socket.create_connection(self.address, timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._rfile = self._socket.makefile("rb")
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        if self._socket is None:
+            return
+        self._rfile.close()
+        self._socket.close()
+        self._socket = None
+
+    def init_experiment(self, name, optimizer, param_defs,
+                        optimizer_arguments=None, minimization=True):
+        """
+        See BasicLabAssistant.init_experiment. optimizer has to be a string,
+        and optimizer_arguments json serializable.
+        """
+        self.call("init_experiment", **self._init_experiment_params(
+            name, optimizer, param_defs, optimizer_arguments, minimization))
+
+    def get_next_candidate(self, exp_name):
+        """
+        See BasicLabAssistant.get_next_candidate.
+        """
+        return self._to_candidate(self.call("get_next_candidate",
+                                            exp_name=exp_name))
+
+    def update(self, exp_name, candidate, status="finished"):
+        """
+        See BasicLabAssistant.update.
+        """
+        self.call("update", exp_name=exp_name, candidate=candidate.to_dict(),
+                  status=status)
+
+    def get_best_candidate(self, exp_name):
+        """
+        See BasicLabAssistant.get_best_candidate.
+        """
+        return self._to_candidate(self.call("get_best_candidate",
+                                            exp_name=exp_name))
+
+    def call(self, method, **params):
+        """
+        Calls method on the server and returns its json result.
+
+        Raises
+        ------
+        ValueError, KeyError, TypeError, IndexError or RemoteError :
+            Iff the call raised an exception on the server.
+        """
+        self._send([self._make_call(method, params)], batch=False)
+        return self._unwrap(self._receive())
+
+    def batch(self, calls):
+        """
+        Sends several calls as one request and returns their results.
+
+        Parameters
+        ----------
+        calls : list of (string, dict) tuples
+            The method names and their keyword arguments, in order.
+
+        Returns
+        -------
+        results : list
+            The json result of each call, or the exception it raised.
+        """
+        self._send([self._make_call(m, p) for m, p in calls], batch=True)
+        return [self._unwrap(r, raise_error=False) for r in self._receive()]
+
+    def pipeline(self, calls):
+        """
+        Sends several calls without waiting and returns their results.
+
+        Parameters
+        ----------
+        calls : list of (string, dict) tuples
+            The method names and their keyword arguments, in order.
+
+        Returns
+        -------
+        results : list
+            The json result of each call, or the exception it raised.
+        """
+        self._send([self._make_call(m, p) for m, p in calls], batch=False)
+        return [self._unwrap(self._receive(), raise_error=False)
+                for c in calls]
+
+    def _init_experiment_params(self, name, optimizer, param_defs,
+                                optimizer_arguments, minimization):
+        return {
+            "name": name,
+            "optimizer": optimizer,
+            "param_defs": dict((k, param_def_to_dict(v))
+                               for k, v in param_defs.items()),
+            "optimizer_arguments": optimizer_arguments,
+            "minimization": minimization
+        }
+
+    def _make_call(self, method, params):
+        self._next_id += 1
+        return {"id": self._next_id, "method": method, "params": params}
+
+    def _send(self, calls, batch):
+        if batch:
+            lines = [to_json(calls)]
+        else:
+            lines = [to_json(c) for c in calls]
+        self._socket.sendall("".join(l + "\n" for l in lines))
+
+    def _receive(self):
+        line = self._rfile.readline()
+        if not line:
+            raise IOError("The server closed the connection.")
+        return json.loads(line)
+
+    def _unwrap(self, response, raise_error=True):
+        error = response.get("error")
+        if error is None:
+            return response.get("result")
+        error_class = self.BUILTIN_ERRORS.get(error.get("type"))
+        if error_class is not None:
+            exception = error_class(error.get("message"))
+        else:
+            exception = RemoteError(error.get("type"), error.get("message"))
+        if raise_error:
+            raise exception
+        return exception
+
+    def _to_candidate(self, d):
+        if d is None:
+            return None
+        return from_dict(d)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
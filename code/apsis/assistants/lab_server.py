@@ -0,0 +1,181 @@
+__author__ = 'Frederik Diehl'
+
+import SocketServer
+import json
+import threading
+from apsis.models.candidate import from_dict
+from apsis.models.parameter_definition import param_def_from_dict
+from apsis.utilities.logging_utils import get_logger
+from apsis.utilities.json_utils import to_json
+
+
+class LabAssistantServer(SocketServer.ThreadingMixIn,
+                         SocketServer.TCPServer):
+    """
+    Exposes a lab assistant to other processes via a TCP socket.
+
+    The protocol is line-based json. Each request is one line containing
+    either a single call or a list of calls, which are executed in order
+    (batching). A call is a dict with the keys "method", "params" - a dict
+    of keyword arguments - and optionally "id". For each request line, one
+    response line is written, containing a dict (or a list of dicts) with
+    the keys "id", "result" and "error". error is None on success or a dict
+    with the "type" and "message" of the exception.
+
+    Connections are kept open until the client closes them, and a client
+    may send several request lines before reading the responses
+    (pipelining). Responses are written in the order of the requests. Each
+    connection is handled by its own thread, so the lab assistant has to be
+    thread-safe.
+
+    Candidates are sent as dicts as returned by Candidate.to_dict, and
+    parameter definitions as returned by param_def_to_dict.
+
+    Attributes
+    ----------
+    lab_assistant : BasicLabAssistant
+        The lab assistant whose methods are exposed.
+    logger : logging.logger
+        The logger for this class.
+    """
+    RPC_METHODS = ["init_experiment", "get_next_candidate", "update",
+                   "get_best_candidate"]
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    lab_assistant = None
+    logger = None
+
+    _thread = None
+
+    def __init__(self, lab_assistant, host="localhost", port=0):
+        """
+        Initializes the server and binds it to host and port.
+
+        Parameters
+        ----------
+        lab_assistant : BasicLabAssistant
+            The lab assistant whose methods are exposed.
+        host : string, optional
+            The host to bind to. Default is "localhost".
+        port : int, optional
+            The port to bind to. Default is 0, which chooses a free port. See
+            address for the port actually used.
+        """
+        self.logger = get_logger(self)
+        self.lab_assistant = lab_assistant
+        SocketServer.TCPServer.__init__(self, (host, port),
+                                        _LabAssistantRequestHandler)
+
+    @property
+    def address(self):
+        """
+        The (host, port) tuple the server is bound to.
+        """
+        return self.server_address
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        name="apsis-lab-server")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops serving and closes the socket.
+        """
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def handle_call(self, call):
+        """
+        Executes a single call and returns its response.
+
+        Parameters
+        ----------
+        call : dict
+            The call, with the keys "method", "params" and optionally "id".
+
+        Returns
+        -------
+        response : dict
+            The response, with the keys "id", "result" and "error".
+        """
+        response = {"id": None, "result": None, "error": None}
+        try:
+            if not isinstance(call, dict):
+                raise ValueError("A call has to be a dict, not %s."
+                                 %repr(call))
+            response["id"] = call.get("id")
+            method = call.get("method")
+            if method not in self.RPC_METHODS:
+                raise ValueError("%s is not one of the methods %s."
+                                 %(method, self.RPC_METHODS))
+            params = call.get("params") or {}
+            response["result"] = getattr(self, "_rpc_" + method)(**params)
+        except Exception as e:
+            self.logger.debug("Call %s failed: %s" %(call, e))
+            response["error"] = {"type": type(e).__name__,
+                                 "message": str(e)}
+        return response
+
+    def _rpc_init_experiment(self, name, optimizer, param_defs,
+                             optimizer_arguments=None, minimization=True):
+        param_defs = dict((k, param_def_from_dict(v))
+                          for k, v in param_defs.items())
+        #optimizers are only found by their name as str, not unicode.
+        self.lab_assistant.init_experiment(
+            name, str(optimizer), param_defs,
+            optimizer_arguments=optimizer_arguments,
+            minimization=minimization)
+
+    def _rpc_get_next_candidate(self, exp_name):
+        candidate = self.lab_assistant.get_next_candidate(exp_name)
+        if candidate is None:
+            return None
+        return candidate.to_dict()
+
+    def _rpc_update(self, exp_name, candidate, status="finished"):
+        self.lab_assistant.update(exp_name, from_dict(candidate),
+                                  status=status)
+
+    def _rpc_get_best_candidate(self, exp_name):
+        candidate = self.lab_assistant.get_best_candidate(exp_name)
+        if candidate is None:
+            return None
+        return candidate.to_dict()
+
+
+class _LabAssistantRequestHandler(SocketServer.StreamRequestHandler):
+    """
+    Handles one connection to a LabAssistantServer until it is closed.
+    """
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"id": None, "result": None,
+                            "error": {"type": "ValueError",
+                                      "message": "Invalid json: %s" %e}}
+            else:
+                if isinstance(request, list):
+                    response = [self.server.handle_call(c) for c in request]
+                else:
+                    response = self.server.handle_call(request)
+            self.wfile.write(to_json(response) + "\n")
+            self.wfile.flush()
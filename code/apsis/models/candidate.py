@@ -1,5 +1,60 @@
 __author__ = 'Frederik Diehl'
 
+import uuid
+
+
+class FrozenParams(dict):
+    """
+    An immutable dictionary of parameter values.
+
+    It behaves like a dict, but every modification raises a TypeError. Use
+    dict(params) to get a modifiable copy.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("The parameters of a Candidate are immutable.")
+
+    __setitem__ = _immutable
+    __delitem__ = _immutable
+    clear = _immutable
+    update = _immutable
+    setdefault = _immutable
+    pop = _immutable
+    popitem = _immutable
+
+    def __reduce__(self):
+        return FrozenParams, (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def params_fingerprint(params):
+    """
+    Computes a hash fingerprint of a parameter dictionary.
+
+    Equal parameter dictionaries have equal fingerprints. Unhashable values
+    are fingerprinted via their representation.
+
+    Parameters
+    ----------
+    params : dict
+        The parameter dictionary.
+
+    Returns
+    -------
+    fingerprint : int
+        The hash fingerprint.
+    """
+    items = frozenset(params.items())
+    try:
+        return hash(items)
+    except TypeError:
+        return hash(repr(sorted(params.items())))
+
 
 class Candidate(object):
     """
@@ -13,9 +68,9 @@ class Candidate(object):
     Attributes
     ----------
 
-    params : dict of string keys
-        A dictionary of parameter value. The keys must correspond to the
-        problem definition.
+    params : FrozenParams of string keys
+        An immutable dictionary of parameter value. The keys must correspond
+        to the problem definition.
         The dictionary requires one key - and value - per parameter defined.
 
     result : float
@@ -30,14 +85,20 @@ class Candidate(object):
         This is worker-settable information which might be used for
         communicating things necessary for resuming evaluations et cetera. This
         is never touched in apsis.
-    """
 
-    params = None
-    result = None
-    cost = None
-    worker_information = None
+    cand_id : string
+        A unique and stable id of this candidate. It is kept when converting
+        the candidate to and from a dictionary.
+
+    fingerprint : int
+        The hash fingerprint of params, computed once on initialization.
+        Candidates are hashable via this fingerprint, so they can be used in
+        sets and as dictionary keys.
+    """
+    __slots__ = ["_params", "_fingerprint", "result", "cost",
+                 "worker_information", "cand_id"]
 
-    def __init__(self, params, worker_information=None):
+    def __init__(self, params, worker_information=None, cand_id=None):
         """
         Initializes the unevaluated candidate object.
 
@@ -50,6 +111,8 @@ class Candidate(object):
         worker_information : string, optional
             This is worker-settable information which might be used for
             communicating things necessary for resuming evaluations et cetera.
+        cand_id : string, optional
+            The id of this candidate. If None, a new unique id is generated.
 
         Raises
         ------
@@ -58,8 +121,43 @@ class Candidate(object):
         """
         if not isinstance(params, dict):
             raise ValueError("No parameter dictionary given.")
-        self.params = params
+        if not isinstance(params, FrozenParams):
+            params = FrozenParams(params)
+        self._params = params
+        self._fingerprint = params_fingerprint(params)
+        self.result = None
+        self.cost = None
         self.worker_information = worker_information
+        if cand_id is None:
+            cand_id = uuid.uuid4().hex
+        self.cand_id = cand_id
+
+    @property
+    def params(self):
+        return self._params
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint
+
+    def __getstate__(self):
+        """
+        Returns the state for pickling and copying.
+        """
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    def __setstate__(self, state):
+        """
+        Restores the state from pickling and copying.
+        """
+        for k, v in state.items():
+            setattr(self, k, v)
+
+    def __hash__(self):
+        """
+        Returns the fingerprint of the params.
+        """
+        return self._fingerprint
 
     def __eq__(self, other):
         """
@@ -84,10 +182,15 @@ class Candidate(object):
         if not isinstance(other, Candidate):
             return False
 
+        if self._fingerprint != other._fingerprint:
+            return False
         if self.params == other.params:
             return True
         return False
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
     def __str__(self):
         """
         Stringifies this Candidate.
@@ -131,14 +234,30 @@ class Candidate(object):
             string : string
                 The (one-line) string representing this Candidate as a csv line
         """
+        return delimiter.join(self.to_csv_row(key_order=key_order))
+
+    def to_csv_row(self, key_order=None):
+        """
+        Returns the csv fields representing this candidate.
+
+        Parameters
+        ----------
+            key_order : list of param names, optional
+                A list defining the order of keys written to csv. If None, the
+                order will be set by sorting the keys.
+
+        Returns
+        -------
+            row : list of strings
+                All parameters in the order defined by `key_order`, followed
+                by the cost and result.
+        """
         if key_order is None:
             key_order = sorted(self.params.keys())
-        string = ""
-        for k in key_order:
-            string += str(self.params[k]) + delimiter
-        string += str(self.cost) + delimiter
-        string += str(self.result)
-        return string
+        row = [str(self.params[k]) for k in key_order]
+        row.append(str(self.cost))
+        row.append(str(self.result))
+        return row
 
     def to_dict(self):
         """
@@ -149,6 +268,7 @@ class Candidate(object):
         d["result"] = self.result
         d["cost"] = self.cost
         d["worker_information"] = self.worker_information
+        d["cand_id"] = self.cand_id
 
         return d
 
@@ -165,7 +285,7 @@ def from_dict(dict):
     """
     EXPERIMENTAL
     """
-    c = Candidate(dict["params"])
+    c = Candidate(dict["params"], cand_id=dict.get("cand_id", None))
     c.result = dict.get("result", None)
     c.cost = dict.get("cost", None)
     c.worker_information = dict.get("worker_information", None)
@@ -0,0 +1,242 @@
+__author__ = 'Frederik Diehl'
+
+from collections import OrderedDict
+from itertools import takewhile
+
+
+class _CandidateStorage(object):
+    """
+    The storage of one or several CandidateLists.
+
+    Several CandidateLists share a storage after copying. Each of them only
+    sees the entries with serials below its own limit, so a list whose limit
+    equals next_serial may append in place without affecting the others.
+    """
+    entries = None
+    index = None
+    next_serial = None
+    shared = False
+
+    def __init__(self, entries=None, next_serial=0):
+        #maps an increasing serial number to the candidate, in order.
+        self.entries = OrderedDict()
+        #maps the candidate to the serial numbers of equal candidates.
+        self.index = {}
+        self.next_serial = next_serial
+        if entries is not None:
+            for serial, candidate in entries:
+                self.entries[serial] = candidate
+                self.index.setdefault(candidate, []).append(serial)
+
+
+class CandidateList(object):
+    """
+    An ordered collection of Candidates with constant-time bookkeeping.
+
+    It behaves like a list of Candidates, but membership tests, appending,
+    removing and popping from either end are O(1) instead of comparing
+    against each Candidate in the list. Candidates are indexed by their
+    hash, that is their params fingerprint. As with a list, it may contain
+    several equal Candidates; remove removes the first of them.
+
+    Copying is O(1): the copy shares the storage with the original. Both
+    can append without copying as long as the other one has not appended
+    since. Otherwise, and before removing anything from a shared storage, a
+    list copies the storage it sees, once.
+
+    Indexing with an integer or a slice is supported for compatibility, but
+    is O(n).
+    """
+    _storage = None
+    _limit = None
+    _length = None
+
+    def __init__(self, candidates=None):
+        """
+        Initializes the CandidateList.
+
+        Parameters
+        ----------
+        candidates : iterable of Candidate, optional
+            The initial Candidates, in order.
+        """
+        self._storage = _CandidateStorage()
+        #the serials visible to this list are those below _limit.
+        self._limit = 0
+        self._length = 0
+        if candidates is not None:
+            self.extend(candidates)
+
+    def copy(self):
+        """
+        Returns a copy of this CandidateList in O(1).
+
+        The Candidates themselves are not copied.
+        """
+        self._storage.shared = True
+        copied = CandidateList()
+        copied._storage = self._storage
+        copied._limit = self._limit
+        copied._length = self._length
+        return copied
+
+    def append(self, candidate):
+        """
+        Appends candidate at the end.
+        """
+        if self._limit != self._storage.next_serial:
+            #another list sharing the storage has appended.
+            self._own_storage()
+        storage = self._storage
+        serial = storage.next_serial
+        storage.next_serial += 1
+        storage.entries[serial] = candidate
+        storage.index.setdefault(candidate, []).append(serial)
+        self._limit = storage.next_serial
+        self._length += 1
+
+    def extend(self, candidates):
+        """
+        Appends all of candidates at the end.
+        """
+        for c in candidates:
+            self.append(c)
+
+    def remove(self, candidate):
+        """
+        Removes the first Candidate equal to candidate.
+
+        Raises
+        ------
+        ValueError :
+            Iff no such Candidate exists.
+        """
+        if not self.discard(candidate):
+            raise ValueError("%s is not in the CandidateList." %candidate)
+
+    def discard(self, candidate):
+        """
+        Removes the first Candidate equal to candidate, if one exists.
+
+        Returns
+        -------
+        removed : bool
+            True iff a Candidate has been removed.
+        """
+        if candidate not in self:
+            return False
+        if self._storage.shared:
+            self._own_storage()
+        storage = self._storage
+        serials = storage.index[candidate]
+        serial = serials.pop(0)
+        if not serials:
+            del storage.index[candidate]
+        del storage.entries[serial]
+        self._length -= 1
+        return True
+
+    def pop(self, index=-1):
+        """
+        Removes and returns the Candidate at index.
+
+        Popping the first or last Candidate is O(1), unless the storage is
+        shared and has to be copied first.
+
+        Raises
+        ------
+        IndexError :
+            Iff the CandidateList is empty or index is out of range.
+        """
+        if not self._length:
+            raise IndexError("pop from empty CandidateList")
+        if self._storage.shared:
+            self._own_storage()
+        storage = self._storage
+        if index == -1 or index == self._length - 1:
+            serial, candidate = storage.entries.popitem(last=True)
+        elif index == 0:
+            serial, candidate = storage.entries.popitem(last=False)
+        else:
+            serial = list(storage.entries.keys())[index]
+            candidate = storage.entries.pop(serial)
+        serials = storage.index[candidate]
+        serials.remove(serial)
+        if not serials:
+            del storage.index[candidate]
+        self._length -= 1
+        return candidate
+
+    def iter_from(self, index):
+        """
+        Returns an iterator over the Candidates from index on.
+
+        The Candidates are collected from the end, so this is O(len - index)
+        unless lists sharing the storage have appended since.
+
+        Parameters
+        ----------
+        index : int
+            The index of the first Candidate.
+        """
+        num_candidates = self._length - max(index, 0)
+        entries = self._storage.entries
+        candidates = []
+        if num_candidates > 0:
+            for serial in reversed(entries):
+                if serial < self._limit:
+                    candidates.append(entries[serial])
+                    if len(candidates) == num_candidates:
+                        break
+        return reversed(candidates)
+
+    def _own_storage(self):
+        """
+        Replaces the storage by an unshared copy of the visible entries.
+        """
+        self._storage = _CandidateStorage(self._visible_items(),
+                                          next_serial=self._limit)
+
+    def _visible_items(self):
+        """
+        Returns the (serial, candidate) tuples visible to this list, in order.
+        """
+        limit = self._limit
+        return list(takewhile(lambda item: item[0] < limit,
+                              self._storage.entries.iteritems()))
+
+    def __contains__(self, candidate):
+        try:
+            serials = self._storage.index.get(candidate)
+        except TypeError:
+            return False
+        #the serials are ascending, so the first one is the smallest.
+        return bool(serials) and serials[0] < self._limit
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter([c for s, c in self._visible_items()])
+
+    def __reversed__(self):
+        return reversed([c for s, c in self._visible_items()])
+
+    def __getitem__(self, index):
+        return [c for s, c in self._visible_items()][index]
+
+    def __iadd__(self, candidates):
+        self.extend(candidates)
+        return self
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "CandidateList(%s)" %repr(list(self))
@@ -1,8 +1,11 @@
 __author__ = 'Frederik Diehl'
 
 from apsis.models.candidate import Candidate
-from apsis.models.parameter_definition import ParamDef
+from apsis.models.candidate_list import CandidateList
+from apsis.models.parameter_definition import ParamDef, NumericParamDef, \
+    PositionParamDef
 import copy
+import numpy as np
 
 class Experiment(object):
     """
@@ -22,15 +25,19 @@ class Experiment(object):
         example when evaluating errors - or a maximum result - for example when
         evaluating scores.
 
-    candidates_pending : list of Candidate instances
+    candidates_pending : CandidateList of Candidate instances
         These Candidate instances have been generated by an optimizer to be
         evaluated at the next possible time, but are not yet assigned to a
         worker.
-    candidates_working : list of Candidate instances
+    candidates_working : CandidateList of Candidate instances
         These Candidate instances are currently being evaluated by workers.
-    candidates_finished : list of Candidate instances
+    candidates_finished : CandidateList of Candidate instances
         These Candidate instances have finished evaluated.
 
+    All three are CandidateLists, which behave like lists but allow
+    constant-time membership tests and removal. Assigning a list to them
+    converts it to a CandidateList.
+
 
     best_candidate : Candidate instance
         The as of yet best Candidate instance found, according to the result.
@@ -40,12 +47,19 @@ class Experiment(object):
     parameter_definitions = None
     minimization_problem = None
 
-    candidates_pending = None
-    candidates_working = None
-    candidates_finished = None
+    _candidates_pending = None
+    _candidates_working = None
+    _candidates_finished = None
 
     best_candidate = None
 
+    _finished_matrix = None
+    _finished_results = None
+    _num_matrix_rows = 0
+    #the number of rows written to the finished matrix storage, shared with
+    #all clones sharing the storage.
+    _matrix_rows_written = None
+
     def __init__(self, name, parameter_definitions, minimization_problem=True):
         """
         Initializes an Experiment with a certain parameter definition.
@@ -88,6 +102,44 @@ class Experiment(object):
         self.candidates_pending = []
         self.candidates_working = []
 
+    @property
+    def candidates_pending(self):
+        return self._candidates_pending
+
+    @candidates_pending.setter
+    def candidates_pending(self, candidates):
+        self._candidates_pending = self._to_candidate_list(candidates)
+
+    @property
+    def candidates_working(self):
+        return self._candidates_working
+
+    @candidates_working.setter
+    def candidates_working(self, candidates):
+        self._candidates_working = self._to_candidate_list(candidates)
+
+    @property
+    def candidates_finished(self):
+        return self._candidates_finished
+
+    @candidates_finished.setter
+    def candidates_finished(self, candidates):
+        self._candidates_finished = self._to_candidate_list(candidates)
+        #the new candidates may differ from the old ones even if their
+        #number is the same, so the finished matrix is rebuilt on demand.
+        self._finished_matrix = None
+        self._finished_results = None
+        self._num_matrix_rows = 0
+        self._matrix_rows_written = None
+
+    def _to_candidate_list(self, candidates):
+        """
+        Converts candidates to a CandidateList, unless it already is one.
+        """
+        if isinstance(candidates, CandidateList):
+            return candidates
+        return CandidateList(candidates)
+
     def add_finished(self, candidate):
         """
         Announces a Candidate instance to be finished evaluating.
@@ -109,11 +161,11 @@ class Experiment(object):
             raise ValueError("candidate is not an instance of Candidate.")
         if not self._check_candidate(candidate):
             raise  ValueError("candidate %s is not valid." %candidate)
-        if candidate in self.candidates_pending:
-            self.candidates_pending.remove(candidate)
-        if candidate in self.candidates_working:
-            self.candidates_working.remove(candidate)
+        self.candidates_pending.discard(candidate)
+        self.candidates_working.discard(candidate)
         self.candidates_finished.append(candidate)
+        if self._finished_matrix is not None:
+            self._append_to_finished_matrix(candidate)
         if (self.best_candidate is None or
                     self.better_cand(candidate, self.best_candidate)):
             self.best_candidate = candidate
@@ -163,8 +215,7 @@ class Experiment(object):
             raise ValueError("candidate is not an instance of Candidate.")
         if not self._check_candidate(candidate):
             raise  ValueError("candidate is not valid.")
-        if candidate in self.candidates_pending:
-            self.candidates_pending.remove(candidate)
+        self.candidates_pending.discard(candidate)
         self.candidates_working.append(candidate)
 
     def add_pausing(self, candidate):
@@ -189,8 +240,7 @@ class Experiment(object):
             raise ValueError("candidate is not an instance of Candidate.")
         if not self._check_candidate(candidate):
             raise  ValueError("candidate is not valid.")
-        if candidate in self.candidates_working:
-            self.candidates_working.remove(candidate)
+        self.candidates_working.discard(candidate)
         self.candidates_pending.append(candidate)
 
     def better_cand(self, candidateA, candidateB):
@@ -297,6 +347,224 @@ class Experiment(object):
             warped_out[name] = self.parameter_definitions[name].warp_out(value)
         return warped_out
 
+    def is_known_candidate(self, candidate, epsilon=0):
+        """
+        Returns whether an equal Candidate is finished, working or pending.
+
+        The exact test is O(1). If epsilon is bigger than 0, candidate is
+        also known if it is within an euclidean distance of epsilon, in the
+        warped-in space, of any of these candidates. This is only supported
+        if all parameters can be warped in; otherwise only the exact test is
+        used.
+
+        Parameters
+        ----------
+        candidate : Candidate
+            The candidate to test.
+        epsilon : float, optional
+            The distance in the warped-in space below which two candidates
+            are considered to be the same. Default is 0.
+
+        Returns
+        -------
+        known : bool
+            True iff candidate is known to this experiment.
+        """
+        if (candidate in self.candidates_finished or
+                candidate in self.candidates_working or
+                candidate in self.candidates_pending):
+            return True
+        if epsilon <= 0 or not self.supports_finished_matrix():
+            return False
+
+        point = self.warp_vector_in(candidate.params)
+        candidate_matrix, _ = self.get_finished_matrix()
+        if candidate_matrix.shape[0] > 0:
+            distances = np.sqrt(np.sum((candidate_matrix - point)**2, axis=1))
+            if np.min(distances) <= epsilon:
+                return True
+        busy = list(self.candidates_working) + list(self.candidates_pending)
+        if busy:
+            busy_matrix = self.warp_matrix_in([c.params for c in busy])
+            distances = np.sqrt(np.sum((busy_matrix - point)**2, axis=1))
+            if np.min(distances) <= epsilon:
+                return True
+        return False
+
+    def warp_vector_in(self, params):
+        """
+        Warps in a point and returns it as a vector.
+
+        Parameters
+        ----------
+        params : dict of string keys
+            The point to warp in.
+
+        Returns
+        -------
+        warped_in : numpy nd_array of shape (d,)
+            The warped-in parameter values in order of the sorted parameter
+            names.
+        """
+        warped_in = self.warp_pt_in(params)
+        return np.array([warped_in[pn] for pn in
+                         sorted(self.parameter_definitions.keys())],
+                        dtype=float)
+
+    def warp_matrix_in(self, params_list):
+        """
+        Warps in several points at once.
+
+        Each parameter is warped in with one call to its parameter
+        definition's warp_in_array.
+
+        Parameters
+        ----------
+        params_list : list of dicts of string keys
+            The points to warp in.
+
+        Returns
+        -------
+        warped_in : numpy nd_array of shape (n, d)
+            One row per point. The columns are the warped-in parameter
+            values in order of the sorted parameter names.
+        """
+        param_names = sorted(self.parameter_definitions.keys())
+        warped_in = np.zeros((len(params_list), len(param_names)))
+        if len(params_list) == 0:
+            return warped_in
+        for i, pn in enumerate(param_names):
+            warped_in[:, i] = self.parameter_definitions[pn].warp_in_array(
+                [params[pn] for params in params_list])
+        return warped_in
+
+    def warp_matrix_out(self, warped_matrix):
+        """
+        Warps out several points at once.
+
+        Each parameter is warped out with one call to its parameter
+        definition's warp_out_array.
+
+        Parameters
+        ----------
+        warped_matrix : numpy nd_array of shape (n, d)
+            One row per point. The columns are the warped-in parameter
+            values in order of the sorted parameter names.
+
+        Returns
+        -------
+        params_list : list of dicts of string keys
+            The warped-out points, in order.
+        """
+        param_names = sorted(self.parameter_definitions.keys())
+        warped_matrix = np.asarray(warped_matrix, dtype=float)
+        columns = [self.parameter_definitions[pn].warp_out_array(
+                       warped_matrix[:, i])
+                   for i, pn in enumerate(param_names)]
+        params_list = []
+        for j in range(warped_matrix.shape[0]):
+            params_list.append(dict((pn, columns[i][j])
+                                    for i, pn in enumerate(param_names)))
+        return params_list
+
+    def supports_finished_matrix(self):
+        """
+        Returns whether all parameters of this experiment can be warped in.
+
+        Only then can the finished candidates be represented as a matrix.
+
+        Returns
+        -------
+        supported : bool
+            True iff every parameter definition is a NumericParamDef or a
+            PositionParamDef.
+        """
+        for pd in self.parameter_definitions.values():
+            if not isinstance(pd, (NumericParamDef, PositionParamDef)):
+                return False
+        return True
+
+    def get_finished_matrix(self):
+        """
+        Returns the warped-in finished candidates and their results.
+
+        The matrix is kept by the experiment and grows with each finished
+        candidate, so this does not warp in or copy all candidates again.
+        The returned arrays are views on this storage and must not be
+        modified.
+
+        Returns
+        -------
+        candidate_matrix : numpy nd_array of shape (n, d)
+            One row for each finished candidate, in order of
+            candidates_finished. The columns are the warped-in parameter
+            values in order of the sorted parameter names.
+        results_vector : numpy nd_array of shape (n, 1)
+            The results of the finished candidates. None results are
+            represented as nan.
+
+        Raises
+        ------
+        ValueError :
+            Iff a parameter definition does not support warping in.
+        """
+        if not self.supports_finished_matrix():
+            raise ValueError("Not all parameter definitions of %s can be "
+                             "warped in." %self.name)
+        if (self._finished_matrix is None or
+                self._num_matrix_rows != len(self.candidates_finished)):
+            self._rebuild_finished_matrix()
+        return (self._finished_matrix[:self._num_matrix_rows],
+                self._finished_results[:self._num_matrix_rows])
+
+    def _rebuild_finished_matrix(self):
+        """
+        Recreates the finished matrix from candidates_finished.
+        """
+        capacity = max(16, 2*len(self.candidates_finished))
+        self._finished_matrix = np.zeros((capacity,
+                                          len(self.parameter_definitions)))
+        self._finished_results = np.zeros((capacity, 1))
+        self._num_matrix_rows = 0
+        self._matrix_rows_written = [0]
+        for c in self.candidates_finished:
+            self._append_to_finished_matrix(c)
+
+    def _append_to_finished_matrix(self, candidate):
+        """
+        Appends the warped-in candidate to the finished matrix.
+
+        The storage doubles its capacity when full, so appending is amortized
+        O(d). Clones share the storage; if another clone has appended to it
+        since, the storage is copied first.
+
+        Parameters
+        ----------
+        candidate : Candidate
+            The finished candidate to append.
+        """
+        if (self._num_matrix_rows == self._finished_matrix.shape[0] or
+                self._num_matrix_rows != self._matrix_rows_written[0]):
+            capacity = max(16, 2 * self._num_matrix_rows)
+            finished_matrix = np.zeros((capacity,
+                                        self._finished_matrix.shape[1]))
+            finished_matrix[:self._num_matrix_rows] = \
+                self._finished_matrix[:self._num_matrix_rows]
+            finished_results = np.zeros((capacity, 1))
+            finished_results[:self._num_matrix_rows] = \
+                self._finished_results[:self._num_matrix_rows]
+            self._finished_matrix = finished_matrix
+            self._finished_results = finished_results
+            self._matrix_rows_written = [self._num_matrix_rows]
+        self._finished_matrix[self._num_matrix_rows] = self.warp_vector_in(
+            candidate.params)
+        result = candidate.result
+        if result is None:
+            result = np.nan
+        self._finished_results[self._num_matrix_rows, 0] = result
+        self._num_matrix_rows += 1
+        self._matrix_rows_written[0] = self._num_matrix_rows
+
     def to_csv_results(self, delimiter=",", line_delimiter="\n", key_order=None, wHeader=True, fromIndex=0):
         """
         Generates a csv result string from this experiment.
@@ -322,40 +590,88 @@ class Experiment(object):
             steps_included : int
                 The number of steps included in the csv.
         """
-        #parameter names
-        csv_string = ""
+        lines = []
+        if wHeader:
+            lines.append(delimiter.join(self.csv_header(key_order=key_order)))
+        for row in self.csv_rows(key_order=key_order, fromIndex=fromIndex):
+            lines.append(delimiter.join(row))
+        steps_included = len(lines) - (1 if wHeader else 0)
+        csv_string = "".join(l + line_delimiter for l in lines)
+        return csv_string, steps_included
+
+    def csv_header(self, key_order=None):
+        """
+        Returns the csv header fields used by to_csv_results.
+
+        Parameters
+        ----------
+            key_order : list of strings, optional
+                The order in which the parameters should be written. If None,
+                the order is defined by sorting the parameter names.
+
+        Returns
+        -------
+            header : list of strings
+                The column names.
+        """
         if key_order is None:
             key_order = sorted(self.parameter_definitions.keys())
+        return ["step"] + list(key_order) + ["cost", "result", "best_result"]
 
-        if wHeader:
-            csv_string += "step" + delimiter
-            for k in key_order:
-                csv_string += k + delimiter
-            csv_string += "cost" + delimiter + "result" + delimiter + \
-                          "best_result" + line_delimiter
-
-        steps_included = 0
-        for c in range(fromIndex, len(self.candidates_finished)):
-            cand = self.candidates_finished[c]
-            csv_string += str(c + 1) + delimiter + \
-                          cand.to_csv_entry(delimiter=delimiter,key_order=key_order) \
-                          + delimiter + str(self.best_candidate.result) + line_delimiter
+    def csv_rows(self, key_order=None, fromIndex=0):
+        """
+        Yields the csv fields of each finished candidate, one row at a time.
 
-            steps_included += 1
+        Parameters
+        ----------
+            key_order : list of strings, optional
+                The order in which the parameters should be written. If None,
+                the order is defined by sorting the parameter names.
+            fromIndex : int, optional
+                Beginning from which result the rows should be generated.
 
-        return csv_string, steps_included
+        Returns
+        -------
+            rows : generator of lists of strings
+                One row per finished candidate, as written by to_csv_results.
+        """
+        if key_order is None:
+            key_order = sorted(self.parameter_definitions.keys())
+        #only the new rows are visited, so appending is not O(n).
+        for c, cand in enumerate(self.candidates_finished.iter_from(fromIndex),
+                                 max(fromIndex, 0)):
+            row = [str(c + 1)]
+            row.extend(cand.to_csv_row(key_order=key_order))
+            row.append(str(self.best_candidate.result))
+            yield row
 
     def clone(self):
         """
-        Create a deep copy of this experiment and return it.
+        Create a copy of this experiment and return it.
+
+        The copy shares the finished candidates and the finished matrix with
+        this experiment, so cloning is independent of the number of finished
+        candidates. Both experiments can be changed independently; shared
+        storage is copied when necessary. The pending and working
+        candidates are copied, since workers may still change them.
+        Finished candidates and the parameter definitions must not be
+        changed.
 
         Returns
         -------
             copied_experiment : Experiment
-                A deep copy of this experiment.
+                A copy of this experiment.
         """
-        copied_experiment = copy.deepcopy(self)
-
+        copied_experiment = copy.copy(self)
+        copied_experiment.parameter_definitions = dict(
+            self.parameter_definitions)
+        #bypasses the setter, which would drop the shared finished matrix.
+        copied_experiment._candidates_finished = \
+            self.candidates_finished.copy()
+        copied_experiment.candidates_pending = [
+            copy.copy(c) for c in self.candidates_pending]
+        copied_experiment.candidates_working = [
+            copy.copy(c) for c in self.candidates_working]
         return copied_experiment
 
 
@@ -0,0 +1,246 @@
+__author__ = 'Frederik Diehl'
+
+import json
+import sqlite3
+import threading
+import time
+from apsis.models.experiment import Experiment
+from apsis.models.candidate import from_dict
+from apsis.models.parameter_definition import param_def_to_dict, \
+    param_def_from_dict
+from apsis.utilities.json_utils import to_json
+
+
+class ExperimentJournal(object):
+    """
+    An append-only journal of an experiment, stored in a SQLite database.
+
+    The journal stores the experiment's definition once, and afterwards each
+    state transition of a candidate - working, pausing or finished - as one
+    row. Replaying the transitions in order rebuilds the experiment without
+    any optimizer work. Additionally, the latest optimizer state, for
+    example the fitted gp's hyperparameters, can be stored, so that a
+    resumed optimizer does not have to refit from scratch.
+
+    Every write is committed and synced to disk immediately. The database
+    uses SQLite's write-ahead log, so a crash - even of the operating
+    system - leaves the journal consistent and loses at most the
+    transitions not yet committed.
+
+    The journal may be used by several threads at once.
+
+    Attributes
+    ----------
+    filename : string
+        The database file.
+    """
+    TRANSITIONS = ["working", "pausing", "finished"]
+
+    filename = None
+
+    _connection = None
+    _lock = None
+
+    def __init__(self, filename):
+        """
+        Opens the journal, creating it if it does not exist.
+
+        Parameters
+        ----------
+        filename : string
+            The database file.
+        """
+        self.filename = filename
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connect()
+
+    def _connect(self):
+        """
+        Returns the connection, opening it and creating the tables if
+        necessary. The caller has to hold _lock.
+        """
+        if self._connection is not None:
+            return self._connection
+        connection = sqlite3.connect(self.filename, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS experiment ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), "
+                "definition TEXT NOT NULL)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS transitions ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "status TEXT NOT NULL, "
+                "candidate TEXT NOT NULL, "
+                "time REAL NOT NULL)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS optimizer_state ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), "
+                "state TEXT NOT NULL, "
+                "time REAL NOT NULL)")
+        self._connection = connection
+        return connection
+
+    def is_empty(self):
+        """
+        Returns whether no experiment has been written to the journal yet.
+        """
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT COUNT(*) FROM experiment").fetchone()
+        return row[0] == 0
+
+    def write_experiment(self, experiment):
+        """
+        Writes the definition of an experiment to an empty journal.
+
+        The candidates of experiment are journaled as finished, working and
+        pending - the latter as pausing - transitions.
+
+        Parameters
+        ----------
+        experiment : Experiment
+            The experiment to journal.
+
+        Raises
+        ------
+        ValueError :
+            Iff the journal already contains an experiment.
+        TypeError :
+            Iff a parameter definition cannot be serialized.
+        """
+        definition = {
+            "name": experiment.name,
+            "minimization_problem": experiment.minimization_problem,
+            "parameter_definitions": dict(
+                (k, param_def_to_dict(v))
+                for k, v in experiment.parameter_definitions.items())
+        }
+        transitions = (
+            [("finished", c) for c in experiment.candidates_finished] +
+            [("working", c) for c in experiment.candidates_working] +
+            [("pausing", c) for c in experiment.candidates_pending])
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "INSERT INTO experiment (id, definition) "
+                        "VALUES (0, ?)", (to_json(definition),))
+                    connection.executemany(
+                        "INSERT INTO transitions (status, candidate, time) "
+                        "VALUES (?, ?, ?)",
+                        [(s, to_json(c.to_dict()), now)
+                         for s, c in transitions])
+            except sqlite3.IntegrityError:
+                raise ValueError("The journal %s already contains an "
+                                 "experiment." %self.filename)
+
+    def append(self, status, candidate):
+        """
+        Appends a state transition of candidate.
+
+        Parameters
+        ----------
+        status : {"working", "pausing", "finished"}
+            The new status of candidate.
+        candidate : Candidate
+            The candidate, including its result if it is finished.
+
+        Raises
+        ------
+        ValueError :
+            Iff status is not one of TRANSITIONS.
+        """
+        if status not in self.TRANSITIONS:
+            raise ValueError("status %s not in %s."
+                             %(status, self.TRANSITIONS))
+        candidate_json = to_json(candidate.to_dict())
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT INTO transitions (status, candidate, time) "
+                    "VALUES (?, ?, ?)", (status, candidate_json, time.time()))
+
+    def write_optimizer_state(self, state):
+        """
+        Replaces the stored optimizer state.
+
+        Parameters
+        ----------
+        state : json-serializable object or None
+            The state, as returned by Optimizer.get_state. None is not
+            stored.
+        """
+        if state is None:
+            return
+        state_json = to_json(state)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO optimizer_state (id, state, time) "
+                    "VALUES (0, ?, ?)", (state_json, time.time()))
+
+    def read_optimizer_state(self):
+        """
+        Returns the stored optimizer state, or None if there is none.
+        """
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT state FROM optimizer_state WHERE id = 0").fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def read_experiment(self):
+        """
+        Rebuilds the experiment by replaying all transitions.
+
+        Returns
+        -------
+        experiment : Experiment or None
+            The experiment, or None if the journal is empty. Pending
+            candidates proposed by the optimizer are not journaled and
+            therefore not restored.
+        """
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT definition FROM experiment WHERE id = 0").fetchone()
+            if row is None:
+                return None
+            transitions = connection.execute(
+                "SELECT status, candidate FROM transitions "
+                "ORDER BY seq").fetchall()
+        definition = json.loads(row[0])
+        param_defs = dict(
+            (str(k), param_def_from_dict(v))
+            for k, v in definition["parameter_definitions"].items())
+        experiment = Experiment(definition["name"], param_defs,
+                                definition["minimization_problem"])
+        add_functions = {
+            "working": experiment.add_working,
+            "pausing": experiment.add_pausing,
+            "finished": experiment.add_finished
+        }
+        for status, candidate_json in transitions:
+            add_functions[status](from_dict(json.loads(candidate_json)))
+        return experiment
+
+    def close(self):
+        """
+        Closes the database. It is reopened when the journal is used again.
+        """
+        with self._lock:
+            if self._connection is None:
+                return
+            self._connection.close()
+            self._connection = None
@@ -1,6 +1,8 @@
 from abc import ABCMeta, abstractmethod
+from bisect import bisect_left
 import random
 import math
+import numpy as np
 
 class ParamDef(object):
     """
@@ -88,6 +90,9 @@ class NominalParamDef(ParamDef):
     init function. These are a list of possible values it can take.
     """
     values = None
+    #maps each value to the index of its first occurrence in values, or None
+    #if the values are not hashable.
+    _value_idxs = None
 
     def __init__(self, values):
         """
@@ -117,13 +122,40 @@ class NominalParamDef(ParamDef):
             )
 
         self.values = values
+        try:
+            self._value_idxs = {}
+            for i, v in enumerate(values):
+                self._value_idxs.setdefault(v, i)
+        except TypeError:
+            self._value_idxs = None
 
     def is_in_parameter_domain(self, value):
         """
         Tests whether value is in self.values as defined during the init
         function.
         """
-        return value in self.values
+        try:
+            return value in self._value_idxs
+        except TypeError:
+            return value in self.values
+
+    def _index_of(self, value):
+        """
+        Returns the index of the first occurrence of value in self.values.
+
+        This is O(1) for hashable values.
+
+        Raises
+        ------
+        ValueError :
+            Iff value is not in self.values.
+        """
+        try:
+            return self._value_idxs[value]
+        except KeyError:
+            raise ValueError("%s is not in the values." %repr(value))
+        except TypeError:
+            return self.values.index(value)
 
 
 class OrdinalParamDef(NominalParamDef, ComparableParamDef):
@@ -148,14 +180,17 @@ class OrdinalParamDef(NominalParamDef, ComparableParamDef):
         considered smaller than '1' and '1' bigger than '5' because the index
         of '1' in this list is higher than the index of '5'.
         """
-        if one not in self.values or two not in self.values:
+        try:
+            index_one = self._index_of(one)
+            index_two = self._index_of(two)
+        except ValueError:
             raise ValueError(
                 "Values not comparable! Either one or the other is not in the "
                 "values domain")
 
-        if self.values.index(one) < self.values.index(two):
+        if index_one < index_two:
             return -1
-        if self.values.index(one) > self.values.index(two):
+        if index_one > index_two:
             return 1
 
         return 0
@@ -165,12 +200,13 @@ class OrdinalParamDef(NominalParamDef, ComparableParamDef):
         This distance is defined as the absolute difference between the values'
         position in the list, normed to the [0, 1] hypercube.
         """
-        if valueA not in self.values or valueB not in self.values:
+        try:
+            indexA = self._index_of(valueA)
+            indexB = self._index_of(valueB)
+        except ValueError:
             raise ValueError(
                 "Values not comparable! Either one or the other is not in the "
                 "values domain")
-        indexA = self.values.index(valueA)
-        indexB = self.values.index(valueB)
         diff = abs(indexA - indexB)
         return float(diff)/len(self.values)
 
@@ -245,6 +281,44 @@ class NumericParamDef(ParamDef, ComparableParamDef):
         """
         return self.warping_out(value_out)
 
+    def warp_in_array(self, values_in):
+        """
+        Warps each of values_in into the [0, 1] space.
+
+        Subclasses with a closed-form warping override this with a single
+        numpy computation; this calls warp_in for each value.
+
+        Parameters
+        ----------
+        values_in : array-like of shape (n,)
+            The input values.
+
+        Returns
+        -------
+        values_in_scaled : numpy nd_array of shape (n,)
+            The scaled values, in order.
+        """
+        return np.array([self.warp_in(v) for v in values_in], dtype=float)
+
+    def warp_out_array(self, values_out):
+        """
+        Warps each of values_out out of the [0, 1] space.
+
+        Subclasses with a closed-form warping override this with a single
+        numpy computation; this calls warp_out for each value.
+
+        Parameters
+        ----------
+        values_out : array-like of shape (n,)
+            The values in [0, 1].
+
+        Returns
+        -------
+        values_out_unscaled : numpy nd_array of shape (n,)
+            The unscaled values, in order.
+        """
+        return np.array([self.warp_out(v) for v in values_out], dtype=float)
+
     def compare_values(self, one, two):
         if not self.is_in_parameter_domain(one):
             raise ValueError("Parameter one = " + str(one) + " not in value "
@@ -302,6 +376,14 @@ class MinMaxNumericParamDef(NumericParamDef):
     def warp_out(self, value_out):
         return value_out*(self.x_max - self.x_min) + self.x_min
 
+    def warp_in_array(self, values_in):
+        return ((np.asarray(values_in, dtype=float) - self.x_min)
+                / (self.x_max - self.x_min))
+
+    def warp_out_array(self, values_out):
+        return (np.asarray(values_out, dtype=float)*(self.x_max - self.x_min)
+                + self.x_min)
+
     def is_in_parameter_domain(self, value):
         return self.x_min <= value <= self.x_max
 
@@ -309,8 +391,19 @@ class MinMaxNumericParamDef(NumericParamDef):
 class PositionParamDef(OrdinalParamDef):
     """
     Defines positions for each of its values.
+
+    The positions are normalized to [0, 1] by the first and last position,
+    which should therefore be the smallest and the biggest. Warping in maps
+    a value to its normalized position, and warping out a [0, 1] value to
+    the first value whose normalized position is not smaller.
     """
     positions = None
+    #the normalized position of each value, in order of values.
+    _normalized_positions = None
+    #the normalized positions in ascending order, and the index of the value
+    #belonging to each.
+    _sorted_positions = None
+    _sorted_idxs = None
 
     def __init__(self, values, positions):
         """
@@ -327,35 +420,84 @@ class PositionParamDef(OrdinalParamDef):
         assert len(values) == len(positions)
         super(PositionParamDef, self).__init__(values)
         self.positions = positions
+        span = positions[-1] - positions[0]
+        if span == 0:
+            #for example a single value; every position is mapped to 0.
+            self._normalized_positions = [0.0 for p in positions]
+        else:
+            self._normalized_positions = [float(p - positions[0])/span
+                                          for p in positions]
+        self._sorted_idxs = sorted(range(len(positions)),
+                                   key=lambda i: self._normalized_positions[i])
+        self._sorted_positions = [self._normalized_positions[i]
+                                  for i in self._sorted_idxs]
 
     def warp_in(self, value_in):
         """
         Warps in the value to a [0, 1] hypercube value.
         """
-        pos = self.positions[self.values.index(value_in)]
-        value_out = (pos - self.positions[0])/(self.positions[-1]-self.positions[0])
-        return value_out
+        return self._normalized_positions[self._index_of(value_in)]
 
     def warp_out(self, value_out):
         """
         Warps out a value from a [0, 1] hypercube to one of the values.
         """
-        if value_out > self.positions[-1]:
-            return self.values[-1]
-        if value_out < self.positions[0]:
-            return self.values[0]
-        for i, p in enumerate(self.positions):
-            if p >= value_out:
-                return self.values[i]
-        return self.values[-1]
+        i = bisect_left(self._sorted_positions, value_out)
+        i = min(i, len(self._sorted_positions) - 1)
+        return self.values[self._sorted_idxs[i]]
+
+    def warp_in_array(self, values_in):
+        """
+        Warps in each of values_in, see warp_in.
+
+        Parameters
+        ----------
+        values_in : iterable of length n
+            Values from self.values.
+
+        Returns
+        -------
+        values_in_scaled : numpy nd_array of shape (n,)
+            The [0, 1] hypercube values, in order.
+
+        Raises
+        ------
+        ValueError :
+            Iff one of values_in is not in self.values.
+        """
+        idxs = [self._index_of(v) for v in values_in]
+        return np.asarray(self._normalized_positions, dtype=float)[idxs]
+
+    def warp_out_array(self, values_out):
+        """
+        Warps out each of values_out, see warp_out.
+
+        Parameters
+        ----------
+        values_out : array-like of shape (n,)
+            The [0, 1] hypercube values.
+
+        Returns
+        -------
+        values : numpy nd_array of shape (n,) and dtype object
+            The corresponding elements of self.values, in order.
+        """
+        sorted_idxs = np.searchsorted(
+            np.asarray(self._sorted_positions, dtype=float),
+            np.asarray(values_out, dtype=float), side="left")
+        sorted_idxs = np.minimum(sorted_idxs, len(self.values) - 1)
+        values = np.empty(len(self.values), dtype=object)
+        values[:] = self.values
+        return values[np.asarray(self._sorted_idxs)[sorted_idxs]]
 
     def distance(self, valueA, valueB):
-        if valueA not in self.values or valueB not in self.values:
+        try:
+            pos_a = self.positions[self._index_of(valueA)]
+            pos_b = self.positions[self._index_of(valueB)]
+        except ValueError:
             raise ValueError(
                 "Values not comparable! Either one or the other is not in the "
                 "values domain")
-        pos_a = self.positions[self.values.index(valueA)]
-        pos_b = self.positions[self.values.index(valueB)]
         diff = abs(pos_a - pos_b)
         return float(diff)
 
@@ -442,6 +584,21 @@ class AsymptoticNumericParamDef(NumericParamDef):
             return 1
         return (1-2**(math.log(value_in, 10)))*(self.border-self.asymptotic_border)+self.asymptotic_border
 
+    def warp_in_array(self, values_in):
+        """
+        Warps in each of values_in, see warp_in.
+        """
+        values_in = np.clip(np.asarray(values_in, dtype=float),
+                            min(self.asymptotic_border, self.border),
+                            max(self.asymptotic_border, self.border))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            warped = ((1-2**np.log10(values_in))
+                      *(self.border-self.asymptotic_border)
+                      +self.asymptotic_border)
+        warped[values_in == self.asymptotic_border] = 1
+        warped[values_in == self.border] = 0
+        return warped
+
 
     def warp_out(self, value_out):
         """
@@ -467,4 +624,85 @@ class AsymptoticNumericParamDef(NumericParamDef):
             return self.asymptotic_border
         elif value_out == 0:
             return self.border
-        return 10**math.log(1-(value_out-self.asymptotic_border)/(self.border-self.asymptotic_border), 2)
\ No newline at end of file
+        return 10**math.log(1-(value_out-self.asymptotic_border)/(self.border-self.asymptotic_border), 2)
+
+    def warp_out_array(self, values_out):
+        """
+        Warps out each of values_out, see warp_out.
+        """
+        values_out = np.clip(np.asarray(values_out, dtype=float), 0, 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            warped = 10**np.log2(1-(values_out-self.asymptotic_border)
+                                 /(self.border-self.asymptotic_border))
+        warped[values_out == 0] = self.border
+        warped[values_out == 1] = self.asymptotic_border
+        return warped
+
+#For each parameter definition which can be serialized, the names of the
+#attributes which are passed to its __init__, in order.
+PARAM_DEF_ARGUMENTS = {
+    "NominalParamDef": ["values"],
+    "OrdinalParamDef": ["values"],
+    "MinMaxNumericParamDef": ["x_min", "x_max"],
+    "PositionParamDef": ["values", "positions"],
+    "FixedValueParamDef": ["values"],
+    "AsymptoticNumericParamDef": ["asymptotic_border", "border"],
+}
+
+
+def param_def_to_dict(param_def):
+    """
+    Serializes a parameter definition to a dict of basic types.
+
+    Parameters
+    ----------
+    param_def : ParamDef
+        The parameter definition. Its class has to be in
+        PARAM_DEF_ARGUMENTS.
+
+    Returns
+    -------
+    d : dict
+        The dict, with the class name as "type" and the initialization
+        arguments as "arguments".
+
+    Raises
+    ------
+    TypeError :
+        Iff param_def cannot be serialized, for example a NumericParamDef
+        with custom warping functions.
+    """
+    type_name = type(param_def).__name__
+    if type_name not in PARAM_DEF_ARGUMENTS:
+        raise TypeError("%s cannot be serialized." %type_name)
+    return {
+        "type": type_name,
+        "arguments": [getattr(param_def, a) for a in
+                      PARAM_DEF_ARGUMENTS[type_name]]
+    }
+
+
+def param_def_from_dict(d):
+    """
+    Restores a parameter definition serialized by param_def_to_dict.
+
+    Parameters
+    ----------
+    d : dict
+        The dict as returned by param_def_to_dict.
+
+    Returns
+    -------
+    param_def : ParamDef
+        The parameter definition.
+
+    Raises
+    ------
+    ValueError :
+        Iff d does not describe a known parameter definition.
+    """
+    type_name = d.get("type")
+    if type_name not in PARAM_DEF_ARGUMENTS:
+        raise ValueError("%s is not a known parameter definition."
+                         %type_name)
+    return globals()[type_name](*d.get("arguments", []))
@@ -1,11 +1,15 @@
 from abc import ABCMeta, abstractmethod
 import numpy as np
 import scipy.optimize
+import scipy.special
 import logging
 from scipy.stats import multivariate_normal
 from apsis.models.parameter_definition import NumericParamDef, PositionParamDef
-import random
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import pickle
 from apsis.utilities.logging_utils import get_logger
+from apsis.utilities.randomization import check_random_state
 
 class AcquisitionFunction(object):
     """
@@ -26,6 +30,8 @@ class AcquisitionFunction(object):
 
     optimization_random_steps = 1000
 
+    random_state = None
+
     def __init__(self, params=None):
         self.logger = get_logger(self, specific_log_name=self.LOG_FILE_NAME)
 
@@ -36,6 +42,23 @@ class AcquisitionFunction(object):
 
         self.optimization_random_steps = self.params.get(
             "optimization_random_steps", 1000)
+        self.random_state = check_random_state(
+            self.params.get("random_state", None))
+
+    def __getstate__(self):
+        """
+        Returns the state for pickling, which excludes the logger.
+        """
+        state = self.__dict__.copy()
+        state["logger"] = None
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores the pickled state and reinitializes the logger.
+        """
+        self.__dict__.update(state)
+        self.logger = get_logger(self, specific_log_name=self.LOG_FILE_NAME)
 
     @abstractmethod
     def evaluate(self, x, gp, experiment):
@@ -85,7 +108,8 @@ class AcquisitionFunction(object):
         Optimization over the acquisition function is done via random search.
         You can set the parameter optimization_random_steps of this class
         to specify how many iterations of random search will be carried out.
-        Defaults to 1000.
+        Defaults to 1000. All random points are sampled and evaluated as one
+        batch, see _compute_minimizing_evaluate_matrix.
 
         Parameters
         ----------
@@ -108,58 +132,86 @@ class AcquisitionFunction(object):
             will always be the one maximizing the acquisition function,
             followed by an unordered list of points.
         """
-        evaluated_params = []
-        evaluated_acq_scores = []
-        sum_acq = []
-
-        best_param_idx = 0
-        best_score = float("inf")
         param_defs = experiment.parameter_definitions
 
         param_names = sorted(param_defs.keys())
+        for pn in param_names:
+            pdef = param_defs[pn]
+            if not (isinstance(pdef, NumericParamDef)
+                    or isinstance(pdef, PositionParamDef)):
+                message = ("Tried using an acquisition function on "
+                           "%s, which is an object of type %s."
+                           "Only "
+                           "NumericParamDef are supported."
+                           %(str(pdef), str(type(pdef))))
+                self.logger.exception(message)
+                raise TypeError(message)
 
         random_steps = max(self.optimization_random_steps, number_proposals)
 
-        for i in range(random_steps):
-            param_dict_eval = {}
-            for pn in param_names:
-                pdef = param_defs[pn]
-                if isinstance(pdef, NumericParamDef) \
-                        or isinstance(pdef, PositionParamDef):
-                    param_dict_eval[pn] = random.random()
-                else:
-                    message = ("Tried using an acquisition function on "
-                               "%s, which is an object of type %s."
-                               "Only "
-                               "NumericParamDef are supported."
-                               %(str(pdef), str(type(pdef))))
-                    self.logger.exception(message)
-                    raise TypeError(message)
-
-            score = self._compute_minimizing_evaluate(param_dict_eval, gp, experiment)
-
-            if score < best_score:
-                best_param_idx = i
-                best_score = score
-            evaluated_params.append(param_dict_eval)
-            evaluated_acq_scores.append(score)
-            if len(sum_acq) > 0:
-                sum_acq.append(score + sum_acq[-1])
+        #sample all random points at once and score them with a single
+        #evaluation of the gp instead of one per point.
+        evaluated_params = self.random_state.uniform(
+            size=(random_steps, len(param_names)))
+        evaluated_acq_scores = np.asarray(self._compute_minimizing_evaluate_matrix(
+            evaluated_params, gp, experiment), dtype=float).reshape(-1)
+
+        proposal_idxs = [int(np.argmin(evaluated_acq_scores))]
+        if number_proposals > 1:
+            #the remaining proposals are chosen proportional to the absolute
+            #value of their acquisition score.
+            sum_acq = np.cumsum(np.abs(evaluated_acq_scores))
+            num_remaining = number_proposals - 1
+            if sum_acq[-1] > 0:
+                sum_rand = self.random_state.uniform(0, sum_acq[-1],
+                                                     size=num_remaining)
+                next_prop_idxs = np.searchsorted(sum_acq, sum_rand)
+                next_prop_idxs = np.minimum(next_prop_idxs, random_steps - 1)
             else:
-                sum_acq.append(score)
+                next_prop_idxs = self.random_state.randint(0, random_steps,
+                                                           size=num_remaining)
+            proposal_idxs.extend(next_prop_idxs)
 
         proposals = []
-        proposals.append((evaluated_params[best_param_idx], evaluated_acq_scores[best_param_idx]))
-        while len(proposals) < number_proposals:
-            next_prop_idx = 0
-            sum_rand = random.uniform(0, sum_acq[-1])
-            while sum_rand < sum_acq[next_prop_idx]:
-                next_prop_idx += 1
-            proposals.append((evaluated_params[next_prop_idx], evaluated_acq_scores[next_prop_idx]))
+        for idx in proposal_idxs:
+            proposals.append((self._translate_vector_dict(
+                evaluated_params[idx], param_names),
+                              evaluated_acq_scores[idx]))
         self.logger.info("New proposals have been calculated. They are %s"
                          %proposals)
         return proposals
 
+    def _compute_minimizing_evaluate_matrix(self, x_matrix, gp, experiment):
+        """
+        Evaluates _compute_minimizing_evaluate on several points at once.
+
+        The default implementation evaluates each row separately. Subclasses
+        should override this to evaluate all points with a single prediction
+        of the gp.
+
+        Parameters
+        ----------
+        x_matrix : numpy nd_array of shape (n, d)
+            Each row is one point in the warped-in parameter space. Columns
+            are in order of the sorted parameter names.
+        gp : GPy gp
+            The gp on which to evaluate
+        experiment : Experiment
+            The experiment for further information.
+
+        Returns
+        -------
+        values : numpy nd_array of shape (n,)
+            The minimizing acquisition function value for each row.
+        """
+        param_names = sorted(experiment.parameter_definitions.keys())
+        values = np.zeros(x_matrix.shape[0])
+        for i in range(x_matrix.shape[0]):
+            x_dict = self._translate_vector_dict(x_matrix[i], param_names)
+            values[i] = self._compute_minimizing_evaluate(x_dict, gp,
+                                                          experiment)
+        return values
+
     def _translate_dict_vector(self, x):
         """
         We translate from a dictionary to a list format for a point's params.
@@ -238,7 +290,10 @@ class ExpectedImprovement(AcquisitionFunction):
     exploitation_exploration_tradeoff = 0
     optimization_random_restarts = 10
 
-
+    optimization_workers = 1
+    optimization_pool = "thread"
+    optimization_early_stop = None
+    optimization_basin_tolerance = 1e-3
 
     def __init__(self, params=None):
         """
@@ -248,6 +303,22 @@ class ExpectedImprovement(AcquisitionFunction):
             Defines behaviour of the function. Includes:
             exploitation_tradeoff: float
                 See Brochu, page 14.
+            optimization_random_restarts : int, optional
+                The number of restarts of the scipy optimizer. Default is 10.
+            optimization_workers : int, optional
+                The number of restarts run in parallel. Default is 1, which
+                runs them one after another.
+            optimization_pool : string, optional
+                Either "thread" or "process", the kind of pool used for
+                parallel restarts. Default is "thread". If the arguments
+                cannot be sent to another process, threads are used.
+            optimization_early_stop : int or None, optional
+                If set, stops the restarts once that many of them have
+                converged to the same basin. Default is None.
+            optimization_basin_tolerance : float, optional
+                The distance in the warped space up to which two restart
+                results are considered to be in the same basin. Default is
+                1e-3.
             Also see AcquisitionFunction for other parameters.
         """
         super(ExpectedImprovement, self).__init__(params)
@@ -258,6 +329,14 @@ class ExpectedImprovement(AcquisitionFunction):
 
         self.optimization_random_restarts = params.get(
             "optimization_random_restarts", 10)
+        self.optimization_workers = params.get(
+            "optimization_workers", self.optimization_workers)
+        self.optimization_pool = params.get(
+            "optimization_pool", self.optimization_pool)
+        self.optimization_early_stop = params.get(
+            "optimization_early_stop", self.optimization_early_stop)
+        self.optimization_basin_tolerance = params.get(
+            "optimization_basin_tolerance", self.optimization_basin_tolerance)
 
     def _compute_minimizing_evaluate(self, x, gp, experiment):
         """
@@ -271,6 +350,25 @@ class ExpectedImprovement(AcquisitionFunction):
 
         return -value
 
+    def _compute_minimizing_evaluate_matrix(self, x_matrix, gp, experiment):
+        """
+        Changes the sign of EI, evaluated on all rows of x_matrix at once.
+        """
+        ei_values, _ = self._evaluate_matrix(x_matrix, gp, experiment,
+                                             compute_gradient=False)
+        return -ei_values
+
+    def _compute_minimizing_evaluate_and_gradient(self, x, gp, experiment):
+        """
+        Returns both the negated EI and its negated gradient at vector x.
+
+        This allows gradient-based optimizers to get both from a single
+        prediction of the gp (scipy.optimize.minimize with jac=True).
+        """
+        ei_values, ei_gradients = self._evaluate_matrix(np.atleast_2d(x), gp,
+                                                        experiment)
+        return -ei_values[0], -ei_gradients[0]
+
     def _compute_minimizing_gradient(self, x, gp, experiment):
         """
         Compute the gradient of EI if we want to minimize its negation
@@ -320,21 +418,41 @@ class ExpectedImprovement(AcquisitionFunction):
             The value of the gradient on the point
         """
         x_value = self._translate_vector_nd_array(x_vec)
+        ei_values, ei_gradients = self._evaluate_matrix(x_value, gp,
+                                                        experiment)
+        return ei_values[0], ei_gradients[0]
 
-        #mean, variance and their gradients
-        mean, variance = gp.predict(x_value)
-        gradient_mean, gradient_variance = gp.predictive_gradients(x_value)
+    def _evaluate_matrix(self, x_matrix, gp, experiment,
+                         compute_gradient=True):
+        """
+        Evaluates EI and its gradient on all rows of x_matrix at once.
 
-        #gpy does everythin in matrices
-        gradient_mean = gradient_mean[0]
-        #gpy returns variance in row matrices.
-        gradient_variance = np.transpose(gradient_variance)
+        Parameters
+        ----------
+        x_matrix : numpy nd_array of shape (n, d)
+            Each row is one point in the warped-in parameter space.
+        gp : GPy gp
+            The gp on which to evaluate
+        experiment : experiment
+            Some acquisition functions require more information about the
+            experiment.
+        compute_gradient : bool, optional
+            Whether to compute the gradients, too. Default is True.
 
-        #these values should be real scalars!
-        mean = mean[0][0]
-        variance = variance[0][0]
+        Results
+        -------
+        ei_values : numpy nd_array of shape (n,)
+            The value of this acquisition function on each point.
+        ei_gradients : numpy nd_array of shape (n, d) or None
+            The gradient of this acquisition function on each point. None
+            iff compute_gradient is False.
+        """
+        x_matrix = np.atleast_2d(np.asarray(x_matrix, dtype=float))
 
-        std_dev = variance ** 0.5
+        #mean and variance; gpy does everything in column matrices
+        mean, variance = gp.predict(x_matrix)
+        mean = mean[:, 0]
+        variance = variance[:, 0]
 
         #Formula adopted from the phd thesis of Jasper Snoek page 48 with
         # \gamma equals Z here
@@ -350,26 +468,29 @@ class ExpectedImprovement(AcquisitionFunction):
         z_numerator = sign * (x_best - mean +
                               self.exploitation_exploration_tradeoff)
 
-        ei_value = 0
-        ei_gradient = 0
-        if std_dev != 0:
-            z = float(z_numerator) / std_dev
+        #EI is defined as 0 wherever the gp has no variance.
+        nonzero = variance > 0
+        std_dev = np.sqrt(np.where(nonzero, variance, 1))
+        z = z_numerator / std_dev
 
-            cdf_z = scipy.stats.norm().cdf(z)
-            pdf_z = scipy.stats.norm().pdf(z)
+        cdf_z = scipy.special.ndtr(z)
+        pdf_z = np.exp(-0.5 * z**2) / np.sqrt(2 * np.pi)
 
-            ei_value = z_numerator * cdf_z + std_dev * pdf_z
+        ei_values = np.where(nonzero, z_numerator * cdf_z + std_dev * pdf_z, 0)
 
-            #compute ei gradient
-            #new implementation based on own derivation
-            ei_gradient_part1 = (1/(2*variance)) * ei_value * gradient_variance
-            ei_gradient_part2 = -1 * sign * gradient_mean * cdf_z
-            ei_gradient_part3 = -1 * gradient_variance * cdf_z * z * (1/(2*std_dev))
-            ei_gradient = ei_gradient_part1 + ei_gradient_part2 + ei_gradient_part3
+        if not compute_gradient:
+            return ei_values, None
 
-            ei_gradient = np.transpose(ei_gradient)[0]
+        gradient_mean, gradient_variance = gp.predictive_gradients(x_matrix)
+        #gpy returns the mean gradient with an additional output dimension.
+        gradient_mean = gradient_mean[:, :, 0]
 
-        return ei_value, ei_gradient
+        #dEI/dmean = -sign * cdf(z), dEI/dvariance = pdf(z)/(2*std_dev)
+        ei_gradients = (-sign * cdf_z[:, None] * gradient_mean +
+                        (pdf_z / (2 * std_dev))[:, None] * gradient_variance)
+        ei_gradients[~nonzero, :] = 0
+
+        return ei_values, ei_gradients
 
     def _evaluate_vector_gradient(self, x_vec, gp, experiment):
         """
@@ -427,54 +548,62 @@ class ExpectedImprovement(AcquisitionFunction):
             #stores tuples (x_min, f_min) from the loop of random restarts
             scipy_optimizer_results = []
             scipy_optimizer_results_out_of_range = []
+            #initial guesses are the best found by random search
+            initial_guesses = []
             for i in range(self.optimization_random_restarts):
-                #initial guess is the best found by random search
-                initial_guess = self._translate_dict_vector(random_proposals[i][0])
-
-
-
-                result = scipy.optimize.minimize(self._compute_minimizing_evaluate,
-                                                 x0=initial_guess, method=optimizer,
-                                                 jac=self._compute_minimizing_gradient,
-                                                 options={'disp': False},
-                                                 bounds=bounds,
-                                                 args=tuple([gp, experiment]))
-
-                #track results
-                x_min = result.x
-                f_min = result.fun
-                num_f_steps = result.nfev
-                num_grad_steps = 0
-                if hasattr(result, 'njev'):
-                    num_grad_steps = result.njev
-                success = result.success
-
-                #Extensive Debug Logging to Debug Acquisition Optimization
-                self.logger.debug(str(optimizer) + " EI Optimization finished.")
-                self.logger.debug("\tx_min: " + str(x_min))
-                self.logger.debug("\tf_min: " + str(f_min))
-                self.logger.debug("\tNum f evaluations: " + str(num_f_steps))
-                self.logger.debug("\tNum grad(f) evaluations: " + str(num_grad_steps))
-                self.logger.debug("RandomSearch")
-                if self.logger.level == logging.DEBUG:
-                    self.logger.debug("\tx_min " + str(random_proposals[i][0]))
-                    self.logger.debug("\tf_min " + str(random_proposals[i][1]))
-
-                #find out if we want to keep the result
-                #when using scipy.optimize.minimize use the success flag
-                if success:
-                    #as not all of the optimization methods respect the bounds
-                    #we need to check if the params are in the bounds, if
-                    #they are not then don't use them
-                    x_min_dict = self._translate_vector_dict(x_min, param_names)
-                    if experiment._check_param_dict(self._translate_vector_dict(x_min, param_names)):
-                        scipy_optimizer_results.append((x_min_dict, f_min))
+                initial_guesses.append(
+                    self._translate_dict_vector(random_proposals[i][0]))
+
+            #the minima of converged restarts, used for early stopping.
+            converged_minima = []
+            restarts = self._run_restarts(initial_guesses, gp, experiment,
+                                          optimizer, bounds)
+            try:
+                for i, result in restarts:
+                    #track results
+                    x_min = result.x
+                    f_min = result.fun
+                    num_f_steps = result.nfev
+                    num_grad_steps = 0
+                    if hasattr(result, 'njev'):
+                        num_grad_steps = result.njev
+                    success = result.success
+
+                    #Extensive Debug Logging to Debug Acquisition Optimization
+                    self.logger.debug(str(optimizer) + " EI Optimization finished.")
+                    self.logger.debug("\tx_min: " + str(x_min))
+                    self.logger.debug("\tf_min: " + str(f_min))
+                    self.logger.debug("\tNum f evaluations: " + str(num_f_steps))
+                    self.logger.debug("\tNum grad(f) evaluations: " + str(num_grad_steps))
+                    self.logger.debug("RandomSearch")
+                    if self.logger.level == logging.DEBUG:
+                        self.logger.debug("\tx_min " + str(random_proposals[i][0]))
+                        self.logger.debug("\tf_min " + str(random_proposals[i][1]))
+
+                    #find out if we want to keep the result
+                    #when using scipy.optimize.minimize use the success flag
+                    if success:
+                        #as not all of the optimization methods respect the bounds
+                        #we need to check if the params are in the bounds, if
+                        #they are not then don't use them
+                        x_min_dict = self._translate_vector_dict(x_min, param_names)
+                        if experiment._check_param_dict(self._translate_vector_dict(x_min, param_names)):
+                            scipy_optimizer_results.append((x_min_dict, f_min))
+                        else:
+                            scipy_optimizer_results_out_of_range.append((x_min_dict, f_min))
+
+                        if self._converged_to_same_basin(x_min, converged_minima):
+                            self.logger.debug("%i restarts converged to the same "
+                                              "basin. Stopping early."
+                                              %self.optimization_early_stop)
+                            break
                     else:
-                        scipy_optimizer_results_out_of_range.append((x_min_dict, f_min))
-                else:
-                    self.logger.debug(str(optimizer) + " Optimization failed "
-                                    "(random iteration: " + str(i) +
-                                    "). Using result from RandomSearch.")
+                        self.logger.debug(str(optimizer) + " Optimization failed "
+                                        "(random iteration: " + str(i) +
+                                        "). Using result from RandomSearch.")
+            finally:
+                #cancels all restarts which have not yet finished.
+                restarts.close()
 
 
             #if there was no success at all give a warning
@@ -509,6 +638,150 @@ class ExpectedImprovement(AcquisitionFunction):
             self.logger.error("The optimizer '" + str(optimizer) + "' that was"
                               " given is not supported! Please see the docs!")
 
+    def _minimize_restart(self, initial_guess, gp, experiment, optimizer,
+                          bounds):
+        """
+        Runs one scipy.optimize.minimize restart on the negated EI.
+
+        Parameters
+        ----------
+        initial_guess : vector
+            The starting point of this restart.
+        gp : GPy gp
+            The gp on which to evaluate.
+        experiment : experiment
+            The experiment for further information.
+        optimizer : string
+            The scipy.optimize.minimize method to use.
+        bounds : list of tuples
+            The bounds for each dimension.
+
+        Returns
+        -------
+        result : scipy.optimize.OptimizeResult
+            The result of the minimization.
+        """
+        if optimizer in ['Nelder-Mead', 'Powell']:
+            return scipy.optimize.minimize(self._compute_minimizing_evaluate,
+                                           x0=initial_guess, method=optimizer,
+                                           options={'disp': False},
+                                           bounds=bounds,
+                                           args=tuple([gp, experiment]))
+        #value and gradient share a single gp prediction.
+        return scipy.optimize.minimize(self._compute_minimizing_evaluate_and_gradient,
+                                       x0=initial_guess, method=optimizer,
+                                       jac=True,
+                                       options={'disp': False},
+                                       bounds=bounds,
+                                       args=tuple([gp, experiment]))
+
+    def _run_restarts(self, initial_guesses, gp, experiment, optimizer,
+                      bounds):
+        """
+        Generates the results of all restarts, one per initial guess.
+
+        The restarts are independent. If optimization_workers is bigger than
+        1, they are run on a thread or process pool (as defined by
+        optimization_pool) and generated in order of completion. If the
+        consumer stops early, the remaining restarts are cancelled.
+
+        Yields
+        ------
+        index : int
+            The index of the initial guess this result belongs to.
+        result : scipy.optimize.OptimizeResult
+            The result of the corresponding restart.
+        """
+        workers = min(self.optimization_workers, len(initial_guesses))
+        if workers <= 1:
+            for i, initial_guess in enumerate(initial_guesses):
+                yield i, self._minimize_restart(initial_guess, gp, experiment,
+                                                optimizer, bounds)
+            return
+
+        pool_type = self.optimization_pool
+        if pool_type == "process":
+            try:
+                pickle.dumps((self, gp, experiment), pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                self.logger.warning("Cannot send the restarts to a process "
+                                    "pool (%s). Using threads instead." %e)
+                pool_type = "thread"
+
+        tasks = [(self, i, initial_guess, gp, experiment, optimizer, bounds)
+                 for i, initial_guess in enumerate(initial_guesses)]
+        if pool_type == "process":
+            pool = multiprocessing.Pool(workers)
+        elif pool_type == "thread":
+            pool = ThreadPool(workers)
+        else:
+            raise ValueError("optimization_pool must be 'thread' or "
+                             "'process', not %s." %str(pool_type))
+        try:
+            for i, result in pool.imap_unordered(_minimize_restart_task,
+                                                 tasks):
+                yield i, result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _converged_to_same_basin(self, x_min, converged_minima):
+        """
+        Adds x_min to converged_minima and checks for early stopping.
+
+        Two minima are in the same basin iff their euclidean distance is at
+        most optimization_basin_tolerance.
+
+        Parameters
+        ----------
+        x_min : vector
+            The minimum found by a successful restart.
+        converged_minima : list of vectors
+            The minima found by previous successful restarts. x_min is
+            appended to it.
+
+        Returns
+        -------
+        stop : bool
+            True iff early stopping is enabled and at least
+            optimization_early_stop restarts have converged to the basin of
+            x_min.
+        """
+        x_min = np.asarray(x_min, dtype=float)
+        converged_minima.append(x_min)
+        if self.optimization_early_stop is None:
+            return False
+        same_basin = 0
+        for other in converged_minima:
+            if np.linalg.norm(other - x_min) <= self.optimization_basin_tolerance:
+                same_basin += 1
+        return same_basin >= self.optimization_early_stop
+
+
+
+def _minimize_restart_task(task):
+    """
+    Runs a single restart for ExpectedImprovement._run_restarts.
+
+    This is a module-level function so it can be sent to a process pool.
+
+    Parameters
+    ----------
+    task : tuple
+        Of the form (acquisition_function, index, initial_guess, gp,
+        experiment, optimizer, bounds).
+
+    Returns
+    -------
+    index : int
+        The index of the initial guess.
+    result : scipy.optimize.OptimizeResult
+        The result of the restart.
+    """
+    acquisition_function, index, initial_guess, gp, experiment, optimizer, \
+        bounds = task
+    return index, acquisition_function._minimize_restart(
+        initial_guess, gp, experiment, optimizer, bounds)
 
 
 class ProbabilityOfImprovement(AcquisitionFunction):
@@ -536,12 +809,28 @@ class ProbabilityOfImprovement(AcquisitionFunction):
         x_best = experiment.best_candidate.result
         z = (x_best - mean)/stdv
 
-        cdf = scipy.stats.norm().cdf(z)
+        cdf = scipy.special.ndtr(z)
         result = cdf
         if not experiment.minimization_problem:
             result = 1 - cdf
         return result
 
+    def _compute_minimizing_evaluate_matrix(self, x_matrix, gp, experiment):
+        """
+        Changes the sign of the function, evaluated on all rows of x_matrix at
+        once.
+        """
+        mean, variance = gp.predict(x_matrix)
+        stdv = variance[:, 0] ** 0.5
+        x_best = experiment.best_candidate.result
+        z = (x_best - mean[:, 0])/stdv
+
+        cdf = scipy.special.ndtr(z)
+        result = cdf
+        if not experiment.minimization_problem:
+            result = 1 - cdf
+        return -result
+
     def _compute_minimizing_evaluate(self, x, gp, experiment):
         """
         Changes the sign of the evaluate function.
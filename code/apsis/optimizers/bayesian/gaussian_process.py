@@ -0,0 +1,422 @@
+__author__ = 'Frederik Diehl'
+
+import copy
+import numpy as np
+import scipy.linalg
+import scipy.optimize
+from apsis.utilities.linalg_utils import cholesky_append
+
+
+class NumpyGP(object):
+    """
+    A gaussian process regression with a stationary ARD kernel in NumPy.
+
+    It is a lightweight alternative to GPy's GPRegression for the bayesian
+    optimizer: it has a zero mean, a Matern52 or RBF kernel and gaussian
+    noise, and offers the subset of GPy's interface the optimizer and the
+    acquisition functions use. The hyperparameters are ordered as in GPy,
+    that is variance, lengthscales and noise variance, so param_array is
+    interchangeable with GPy's.
+
+    The hyperparameters are optimized with L-BFGS on the analytic gradient
+    of the log marginal likelihood. As in GPy, the optimizer works on
+    transformed parameters: the logarithm of unbounded parameters and the
+    inverse logistic function of bounded ones.
+
+    Attributes
+    ----------
+    X : numpy nd_array of shape (n, d)
+        The inputs.
+    Y : numpy nd_array of shape (n, 1)
+        The outputs.
+    num_data : int
+        The number of data points n.
+    input_dim : int
+        The dimension d of the inputs.
+    kernel : string
+        The kernel, one of KERNELS.
+    ARD : bool
+        Whether each dimension has its own lengthscale.
+    param_array : numpy nd_array
+        The hyperparameters. After changing them in place, update_model
+        has to be called.
+    bounds : (float, float) tuple or None
+        The bounds of all hyperparameters, or None if they are only
+        constrained to be positive.
+    """
+    KERNELS = ["matern52", "rbf"]
+
+    #added to the diagonal of the covariance matrix, as in GPy.
+    JITTER = 1e-8
+
+    X = None
+    Y = None
+    num_data = None
+    input_dim = None
+    kernel = None
+    ARD = True
+    param_array = None
+    bounds = None
+
+    _chol = None
+    _alpha = None
+    _log_likelihood = None
+
+    def __init__(self, X, Y, kernel="matern52", ARD=True, variance=1.,
+                 lengthscale=1., noise_var=1.):
+        """
+        Initializes the gp and computes its posterior.
+
+        Parameters
+        ----------
+        X : numpy nd_array of shape (n, d)
+            The inputs.
+        Y : numpy nd_array of shape (n, 1)
+            The outputs.
+        kernel : string, optional
+            One of KERNELS. Default is "matern52".
+        ARD : bool, optional
+            Whether each dimension has its own lengthscale. Default is True.
+        variance : float, optional
+            The kernel variance. Default is 1.
+        lengthscale : float or array-like, optional
+            The lengthscale, or one per dimension if ARD. Default is 1.
+        noise_var : float, optional
+            The noise variance. Default is 1.
+
+        Raises
+        ------
+        ValueError :
+            Iff kernel is not in KERNELS.
+        """
+        if kernel not in self.KERNELS:
+            raise ValueError("kernel %s not in %s." %(kernel, self.KERNELS))
+        self.kernel = kernel
+        self.ARD = ARD
+        self.X = np.array(X, dtype=float, ndmin=2)
+        self.Y = np.array(Y, dtype=float).reshape(-1, 1)
+        self.num_data, self.input_dim = self.X.shape
+        num_lengthscales = self.input_dim if ARD else 1
+        lengthscale = np.ones(num_lengthscales) * lengthscale
+        self.param_array = np.hstack(([variance], lengthscale, [noise_var]))
+        self.update_model()
+
+    @property
+    def variance(self):
+        return self.param_array[0]
+
+    @property
+    def lengthscale(self):
+        return self.param_array[1:-1]
+
+    @property
+    def noise_var(self):
+        return self.param_array[-1]
+
+    def constrain_bounded(self, lower, upper):
+        """
+        Constrains all hyperparameters to [lower, upper].
+
+        Hyperparameters outside the bounds are moved into them.
+        """
+        self.bounds = (float(lower), float(upper))
+        self.param_array[:] = np.clip(self.param_array, lower, upper)
+        self.update_model()
+
+    def update_model(self, update=True):
+        """
+        Recomputes the posterior after the hyperparameters or data changed.
+
+        Raises
+        ------
+        numpy.linalg.LinAlgError :
+            Iff the covariance matrix is not positive definite.
+        """
+        if not update:
+            return
+        cov = self.K(self.X)
+        cov[np.diag_indices_from(cov)] += self.noise_var + self.JITTER
+        self._chol = np.linalg.cholesky(cov)
+        self._update_posterior()
+
+    def _update_posterior(self):
+        """
+        Computes alpha and the log likelihood from the cholesky factor.
+        """
+        self._alpha = scipy.linalg.cho_solve((self._chol, True), self.Y)
+        self._log_likelihood = float(
+            -0.5 * np.dot(self.Y[:, 0], self._alpha[:, 0])
+            - np.sum(np.log(np.diag(self._chol)))
+            - 0.5 * self.num_data * np.log(2 * np.pi))
+
+    def set_XY(self, X, Y):
+        """
+        Replaces the data and recomputes the posterior.
+        """
+        self.X = np.array(X, dtype=float, ndmin=2)
+        self.Y = np.array(Y, dtype=float).reshape(-1, 1)
+        self.num_data = self.X.shape[0]
+        self.update_model()
+
+    def append_XY(self, X_new, Y_new):
+        """
+        Appends data by extending the cholesky factor, which costs O(n^2 m)
+        instead of the O((n+m)^3) of set_XY.
+
+        Raises
+        ------
+        numpy.linalg.LinAlgError :
+            Iff the extended covariance matrix is not positive definite.
+        """
+        X_new = np.array(X_new, dtype=float, ndmin=2)
+        Y_new = np.array(Y_new, dtype=float).reshape(-1, 1)
+        new_cov = self.K(X_new)
+        new_cov[np.diag_indices_from(new_cov)] += self.noise_var + self.JITTER
+        self._chol = cholesky_append(self._chol, self.K(self.X, X_new),
+                                     new_cov)
+        self.X = np.vstack((self.X, X_new))
+        self.Y = np.vstack((self.Y, Y_new))
+        self.num_data = self.X.shape[0]
+        self._update_posterior()
+
+    def copy(self):
+        """
+        Returns an independent copy of the gp.
+        """
+        return copy.deepcopy(self)
+
+    def K(self, X1, X2=None):
+        """
+        Returns the kernel matrix between X1 and X2, or X1 and itself.
+        """
+        return self._kernel_and_factor(X1, X2)[0]
+
+    def _kernel_and_factor(self, X1, X2=None):
+        """
+        Returns the kernel matrix and the factor F with which the kernel's
+        derivatives are computed.
+
+        For both kernels, the derivative by x1_d is
+        -F * (x1_d - x2_d) / l_d**2 and the derivative by the logarithm of
+        the lengthscale l_d is F * (x1_d - x2_d)**2 / l_d**2.
+        """
+        if X2 is None:
+            X2 = X1
+        scaled_1 = X1 / self.lengthscale
+        scaled_2 = X2 / self.lengthscale
+        squared_distances = (np.sum(scaled_1**2, axis=1)[:, None]
+                             + np.sum(scaled_2**2, axis=1)[None, :]
+                             - 2 * np.dot(scaled_1, scaled_2.T))
+        squared_distances = np.maximum(squared_distances, 0)
+        if self.kernel == "rbf":
+            k = self.variance * np.exp(-0.5 * squared_distances)
+            return k, k
+        sqrt5_r = np.sqrt(5 * squared_distances)
+        exp_part = self.variance * np.exp(-sqrt5_r)
+        k = (1 + sqrt5_r + 5. / 3 * squared_distances) * exp_part
+        return k, 5. / 3 * (1 + sqrt5_r) * exp_part
+
+    def predict(self, Xnew):
+        """
+        Returns the predictive mean and variance, including the noise as in
+        GPy.
+
+        Parameters
+        ----------
+        Xnew : numpy nd_array of shape (m, d)
+            The points to predict.
+
+        Returns
+        -------
+        mean : numpy nd_array of shape (m, 1)
+        variance : numpy nd_array of shape (m, 1)
+        """
+        Xnew = np.array(Xnew, dtype=float, ndmin=2)
+        cross_cov = self.K(Xnew, self.X)
+        mean = np.dot(cross_cov, self._alpha)
+        v = scipy.linalg.solve_triangular(self._chol, cross_cov.T, lower=True)
+        variance = self.variance - np.sum(v**2, axis=0) + self.noise_var
+        return mean, np.maximum(variance, 1e-200)[:, None]
+
+    def predictive_gradients(self, Xnew):
+        """
+        Returns the gradients of the predictive mean and variance.
+
+        Parameters
+        ----------
+        Xnew : numpy nd_array of shape (m, d)
+            The points at which to compute the gradients.
+
+        Returns
+        -------
+        mean_gradient : numpy nd_array of shape (m, d, 1)
+            As in GPy, with an additional output dimension.
+        variance_gradient : numpy nd_array of shape (m, d)
+        """
+        Xnew = np.array(Xnew, dtype=float, ndmin=2)
+        cross_cov, factor = self._kernel_and_factor(Xnew, self.X)
+        #k(x, x) is constant, so the variance's gradient is
+        #-2 dk(x, X)/dx K^-1 k(X, x).
+        weights = scipy.linalg.cho_solve((self._chol, True), cross_cov.T).T
+        mean_gradient = np.zeros((Xnew.shape[0], self.input_dim, 1))
+        variance_gradient = np.zeros((Xnew.shape[0], self.input_dim))
+        lengthscale = np.ones(self.input_dim) * self.lengthscale
+        for d in range(self.input_dim):
+            dk_dx = (-factor * (Xnew[:, d, None] - self.X[None, :, d])
+                     / lengthscale[d]**2)
+            mean_gradient[:, d, 0] = np.dot(dk_dx, self._alpha[:, 0])
+            variance_gradient[:, d] = -2 * np.sum(dk_dx * weights, axis=1)
+        return mean_gradient, variance_gradient
+
+    def log_likelihood(self):
+        """
+        Returns the log marginal likelihood.
+        """
+        return self._log_likelihood
+
+    def _log_likelihood_gradient(self):
+        """
+        Returns the gradient of the log marginal likelihood by the logarithms
+        of the hyperparameters.
+        """
+        cov_inv = scipy.linalg.cho_solve((self._chol, True),
+                                         np.eye(self.num_data))
+        W = np.outer(self._alpha, self._alpha) - cov_inv
+        k, factor = self._kernel_and_factor(self.X)
+        gradient = np.zeros(self.param_array.shape)
+        gradient[0] = 0.5 * np.sum(W * k)
+        if self.ARD:
+            for d in range(self.input_dim):
+                differences = self.X[:, d, None] - self.X[None, :, d]
+                gradient[1 + d] = 0.5 * np.sum(
+                    W * factor * differences**2) / self.lengthscale[d]**2
+        else:
+            squared_distances = (np.sum(self.X**2, axis=1)[:, None]
+                                 + np.sum(self.X**2, axis=1)[None, :]
+                                 - 2 * np.dot(self.X, self.X.T))
+            gradient[1] = (0.5 * np.sum(W * factor * squared_distances)
+                           / self.lengthscale[0]**2)
+        gradient[-1] = 0.5 * np.trace(W) * self.noise_var
+        return gradient
+
+    @property
+    def optimizer_array(self):
+        """
+        The hyperparameters in the space of the optimizer.
+        """
+        if self.bounds is None:
+            return np.log(self.param_array)
+        lower, upper = self.bounds
+        scaled = np.clip((self.param_array - lower) / (upper - lower),
+                         1e-10, 1 - 1e-10)
+        return np.log(scaled / (1 - scaled))
+
+    @optimizer_array.setter
+    def optimizer_array(self, x):
+        self.param_array = self._to_params(x)
+        self.update_model()
+
+    def _to_params(self, x):
+        """
+        Returns the hyperparameters for the optimizer's x.
+        """
+        x = np.asarray(x, dtype=float)
+        if self.bounds is None:
+            return np.exp(np.clip(x, -700, 700))
+        lower, upper = self.bounds
+        return lower + (upper - lower) / (1 + np.exp(-np.clip(x, -700, 700)))
+
+    def _params_gradient(self):
+        """
+        Returns the derivatives of the logarithms of the hyperparameters by
+        the optimizer's x.
+        """
+        if self.bounds is None:
+            return np.ones(self.param_array.shape)
+        lower, upper = self.bounds
+        return ((upper - self.param_array) / (upper - lower)
+                * (self.param_array - lower) / self.param_array)
+
+    def objective_function(self):
+        """
+        Returns the negative log marginal likelihood, as minimized by
+        optimize.
+        """
+        return -self._log_likelihood
+
+    def _objective_and_gradient(self, x):
+        try:
+            self.optimizer_array = x
+        except np.linalg.LinAlgError:
+            return np.inf, np.zeros(len(x))
+        gradient = -self._log_likelihood_gradient() * self._params_gradient()
+        return self.objective_function(), gradient
+
+    def optimize(self, max_iters=1000):
+        """
+        Optimizes the hyperparameters with L-BFGS, starting at the current
+        ones.
+
+        Raises
+        ------
+        numpy.linalg.LinAlgError :
+            Iff the covariance matrix is not positive definite for the
+            starting hyperparameters.
+        """
+        x_start = self.optimizer_array
+        start_objective = self._objective_and_gradient(x_start)[0]
+        if not np.isfinite(start_objective):
+            raise np.linalg.LinAlgError("The covariance matrix is not "
+                                        "positive definite.")
+        x, objective, info = scipy.optimize.fmin_l_bfgs_b(
+            self._objective_and_gradient, x_start, maxiter=max_iters)
+        if not np.isfinite(objective) or objective > start_objective:
+            x = x_start
+        self.optimizer_array = x
+
+    def randomize(self, rand_gen=None):
+        """
+        Sets the hyperparameters to random ones.
+
+        Parameters
+        ----------
+        rand_gen : function, optional
+            Called with size to draw the hyperparameters in the optimizer's
+            space. Default is numpy.random.normal.
+        """
+        if rand_gen is None:
+            rand_gen = np.random.normal
+        self.optimizer_array = rand_gen(size=self.param_array.shape[0])
+
+    def optimize_restarts(self, num_restarts=10, verbose=False,
+                          random_state=None):
+        """
+        Optimizes the hyperparameters num_restarts times and keeps the best.
+
+        The first optimization starts at the current hyperparameters, the
+        others at random ones.
+
+        Parameters
+        ----------
+        num_restarts : int, optional
+            The number of optimizations. Default is 10.
+        verbose : bool, optional
+            Ignored; for compatibility with GPy.
+        random_state : numpy RandomState, optional
+            Used to randomize the hyperparameters. Default is numpy.random.
+        """
+        if random_state is None:
+            random_state = np.random
+        best_x = self.optimizer_array
+        best_objective = self.objective_function()
+        for i in range(num_restarts):
+            try:
+                if i > 0:
+                    self.randomize(random_state.normal)
+                self.optimize()
+            except np.linalg.LinAlgError:
+                continue
+            if self.objective_function() < best_objective:
+                best_x = self.optimizer_array
+                best_objective = self.objective_function()
+        self.optimizer_array = best_x
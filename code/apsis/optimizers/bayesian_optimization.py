@@ -2,16 +2,65 @@ __author__ = 'Frederik Diehl'
 
 from apsis.optimizers.optimizer import Optimizer
 from apsis.optimizers.random_search import RandomSearch
+from apsis.optimizers.space_filling_design import SpaceFillingDesign
 from apsis.models.parameter_definition import *
 from apsis.utilities.randomization import check_random_state
 from apsis.models.candidate import Candidate
 from apsis.optimizers.bayesian.acquisition_functions import *
+from apsis.optimizers.bayesian.gaussian_process import NumpyGP
 from apsis.utilities.import_utils import import_if_exists
-import GPy
+from apsis.utilities.linalg_utils import cholesky_append, cholesky_solve, \
+    data_fingerprint
 import logging
+import multiprocessing
+from collections import OrderedDict
 
 mcmc_imported, pm = import_if_exists("pymcmc")
 
+#GPy is slow to import, so it is only imported once a GPy gp is used.
+GPy = None
+
+
+def _import_gpy():
+    """
+    Imports GPy on first use and returns it.
+    """
+    global GPy
+    if GPy is None:
+        import GPy as gpy_module
+        GPy = gpy_module
+    return GPy
+
+
+def _optimize_restart(args):
+    """
+    Optimizes the hyperparameters of a gp from one restart.
+
+    This is executed in the worker processes of a parallel refit, so it has
+    to be a module-level function. gp is changed.
+
+    Parameters
+    ----------
+    args : (gp, seed) tuple
+        The gp to optimize, and the seed with which its hyperparameters are
+        randomized before. If seed is None, the gp's hyperparameters are
+        used as the start.
+
+    Returns
+    -------
+    result : (numpy array, float) tuple or None
+        The optimized hyperparameters in the optimizer's space and the
+        negative log-likelihood, or None if the optimization failed.
+    """
+    gp, seed = args
+    if seed is not None:
+        gp.randomize(np.random.RandomState(seed).normal)
+    try:
+        gp.optimize()
+    except np.linalg.LinAlgError:
+        return None
+    return np.array(gp.optimizer_array), float(gp.objective_function())
+
 class SimpleBayesianOptimizer(Optimizer):
     """
     This implements a simple bayesian optimizer.
@@ -23,8 +72,8 @@ class SimpleBayesianOptimizer(Optimizer):
     ----------
     SUPPORTED_PARAM_TYPES : list of ParamDefs
         The supported parameter types. Currently only numberic and position.
-    kernel : GPy Kernel
-        The Kernel to be used with the gp.
+    kernel : GPy Kernel or string
+        The Kernel to be used with the gp. A string for the numpy engine.
     acquisition_function : acquisition_function
         The acquisition function to use
     acquisition_hyperparams :
@@ -32,20 +81,63 @@ class SimpleBayesianOptimizer(Optimizer):
     random_state : scipy random_state or int.
         The scipy random state or object to initialize one. For reproduction.
     random_searcher : RandomSearch
-        The random search instance used to generate the first
-        initial_random_runs candidates.
-    gp : GPy gaussian process
+        The random search instance used to fill up proposals.
+    initial_design : string
+        How the first initial_random_runs candidates are generated. See
+        INITIAL_DESIGNS.
+    initial_designer : Optimizer
+        The optimizer generating the first initial_random_runs candidates.
+    gp : GPy gaussian process or NumpyGP
         The gaussian process used here.
+    gp_engine : string
+        Which implementation of the gp to use. See GP_ENGINES.
     initial_random_runs : int
         The number of initial random runs before using the GP. Default is 10.
     num_gp_restarts : int
         GPy's optimization requires restarts to find a good solution. This
         parameter controls this. Default is 10.
+    gp_restart_processes : int
+        The number of processes among which the restarts are distributed.
+    gp_backend : string
+        Which gp to use. See GP_BACKENDS.
+    sparse_threshold : int
+        The number of finished candidates above which the "auto" backend
+        uses a sparse gp.
+    num_inducing : int
+        The number of inducing inputs of the sparse gp.
+    batch_strategy : string or None
+        How to propose several candidates at once. See BATCH_STRATEGIES.
+    constant_liar_value : string
+        Which observed result the constant liar assumes.
+    fit_cache_size : int
+        The number of fitted gps whose hyperparameters are cached.
+    fit_cache_hits : int
+        The number of refits which reused a cached fit.
+    fit_cache_misses : int
+        The number of refits which fitted the gp.
     logger: logger
         The logger instance for this object.
     """
     SUPPORTED_PARAM_TYPES = [NumericParamDef, PositionParamDef]
 
+    #None only returns the proposals of the acquisition function.
+    #The other strategies propose one candidate at a time, each time
+    #conditioning the gp on a fantasized result for the candidates already
+    #proposed, working or pending.
+    BATCH_STRATEGIES = [None, "kriging_believer", "constant_liar"]
+    CONSTANT_LIAR_VALUES = ["min", "max", "mean"]
+
+    #"exact" always uses an exact gp, "sparse" always an inducing-point
+    #approximation, and "auto" switches above sparse_threshold candidates.
+    GP_BACKENDS = ["exact", "sparse", "auto"]
+
+    #"gpy" uses GPy's models, "numpy" the built-in NumpyGP, which imports
+    #faster and has less overhead, but only supports exact gps.
+    GP_ENGINES = ["gpy", "numpy"]
+
+    #"random" uses random search, the others the SpaceFillingDesign.
+    INITIAL_DESIGNS = ["random"] + SpaceFillingDesign.DESIGNS
+
     kernel = None
     kernel_params = None
     acquisition_function = None
@@ -53,14 +145,43 @@ class SimpleBayesianOptimizer(Optimizer):
 
     random_state = None
     random_searcher = None
+    initial_design = "random"
+    initial_designer = None
 
     gp = None
+    gp_engine = "gpy"
     mcmc = False
     initial_random_runs = 10
     num_gp_restarts = 10
+    gp_restart_processes = 1
 
     num_precomputed = None
 
+    incremental = False
+    full_refit_every = 10
+    loglik_drop_tolerance = 0.5
+    _num_fitted = 0
+    _num_at_full_refit = 0
+    _loglik_at_full_refit = None
+
+    batch_strategy = None
+    constant_liar_value = "min"
+
+    gp_backend = "auto"
+    sparse_threshold = 1000
+    num_inducing = 200
+
+    _restored_state = None
+
+    fit_cache_size = 10
+    fit_cache_hits = 0
+    fit_cache_misses = 0
+    #maps the fingerprint of the finished data to the state of the gp
+    #fitted on it, least recently used first.
+    _fit_cache = None
+    #the fingerprint of the data self.gp is fitted on.
+    _fit_fingerprint = None
+
     logger = None
 
     def __init__(self, optimizer_arguments=None):
@@ -74,6 +195,11 @@ class SimpleBayesianOptimizer(Optimizer):
             "initial_random_runs" : int, optional
                 The number of initial random runs before using the GP. Default
                 is 10.
+            "initial_design" : string, optional
+                How the initial runs are chosen. "random" uses random
+                search, "sobol", "halton" and "lhs" the corresponding
+                space-filling design, which lets the gp become useful after
+                fewer runs. Default is "random".
             "random_state" : scipy random state, optional
                 The scipy random state or object to initialize one. Default is
                 None.
@@ -82,12 +208,71 @@ class SimpleBayesianOptimizer(Optimizer):
             "num_gp_restarts" : int
                 GPy's optimization requires restarts to find a good solution.
                 This parameter controls this. Default is 10.
+            "gp_restart_processes" : int, optional
+                If larger than 1, the restarts are run in a pool of that many
+                processes. In any case, the best result is kept. Each
+                restart's hyperparameters are randomized with a seed drawn
+                from random_state, so the result does not depend on the
+                number of processes. Default is 1, which runs the restarts
+                in this process.
             "acquisition" : AcquisitionFunction
                 The acquisition function to use. Default is
                 ExpectedImprovement.
             "num_precomputed" : int
                 The number of points that should be kept precomputed for faster
                 multiple workers.
+            "incremental" : bool, optional
+                If True, new observations are appended to the existing gp by
+                extending its cholesky factor, and the hyperparameters are
+                warm-started from the previous fit. The full restart
+                optimization only runs every full_refit_every observations or
+                when the log-likelihood drops. Default is False.
+            "full_refit_every" : int, optional
+                The number of incrementally added observations after which
+                the hyperparameters are optimized again. Default is 10.
+            "loglik_drop_tolerance" : float, optional
+                The drop in log-likelihood per observation since the last full
+                refit which triggers a new one. Default is 0.5.
+            "batch_strategy" : string or None, optional
+                How to propose several candidates at once, for example for
+                several workers. If None, the best proposal of the
+                acquisition function is returned along with points drawn in
+                proportion to their acquisition value. "kriging_believer"
+                and "constant_liar" condition the gp on the working and
+                pending candidates and on each proposal before the next one
+                is computed, assuming the gp's mean or a constant as their
+                result. This leads to diverse batches, but optimizes the
+                acquisition function once per candidate. Default is None.
+            "constant_liar_value" : string, optional
+                The result assumed by the constant liar. One of "min", "max"
+                or "mean" of the finished results. Default is "min".
+            "gp_engine" : string, optional
+                "gpy" uses GPy's gps. "numpy" uses NumpyGP, a plain numpy
+                gp with a Matern52 or RBF kernel given by its name, which
+                avoids importing GPy. It does not support the sparse
+                backend or mcmc; "auto" always uses the exact gp with it.
+                Default is "gpy".
+            "gp_backend" : string, optional
+                "exact" uses GPy's GPRegression, which costs O(n^3) per
+                refit. "sparse" uses SparseGPRegression with num_inducing
+                inducing inputs, which costs O(n m^2). "auto" uses the
+                exact gp up to sparse_threshold finished candidates and the
+                sparse one above. Incremental updates are only done for the
+                exact gp. Default is "auto".
+            "sparse_threshold" : int, optional
+                The number of finished candidates above which "auto" uses
+                the sparse gp. Default is 1000.
+            "num_inducing" : int, optional
+                The number of inducing inputs of the sparse gp. Default is
+                200.
+            "fit_cache_size" : int, optional
+                The number of fitted gps to remember. Refitting on the same
+                finished candidates and results as one of them reuses its
+                hyperparameters instead of optimizing them again. Default
+                is 10.
+            Also see Optimizer._init_duplicate_filter for the duplicate
+            filter settings. Proposals which are not new are replaced by
+            further proposals, or by random search.
         """
         self.logger = get_logger(self)
         if optimizer_arguments is None:
@@ -100,6 +285,8 @@ class SimpleBayesianOptimizer(Optimizer):
             'acquisition_hyperparams', None)
         self.num_gp_restarts = optimizer_arguments.get(
             'num_gp_restarts', self.num_gp_restarts)
+        self.gp_restart_processes = optimizer_arguments.get(
+            "gp_restart_processes", self.gp_restart_processes)
         if not isinstance(optimizer_arguments.get('acquisition'), AcquisitionFunction):
             self.acquisition_function = optimizer_arguments.get(
                 'acquisition', ExpectedImprovement)(self.acquisition_hyperparams)
@@ -107,65 +294,320 @@ class SimpleBayesianOptimizer(Optimizer):
             self.acquisition_function = optimizer_arguments.get("acquisition")
         self.kernel_params = optimizer_arguments.get("kernel_params", {})
         self.kernel = optimizer_arguments.get("kernel", "matern52")
-        self.random_searcher = RandomSearch({"random_state": self.random_state})
+        self.gp_engine = optimizer_arguments.get("gp_engine", self.gp_engine)
+        if self.gp_engine not in self.GP_ENGINES:
+            raise ValueError("gp_engine %s not in %s."
+                             %(self.gp_engine, self.GP_ENGINES))
+        if self.gp_engine == "numpy" and self.kernel not in NumpyGP.KERNELS:
+            raise ValueError("The numpy gp_engine requires one of the "
+                             "kernels %s, not %s." %(NumpyGP.KERNELS,
+                                                     self.kernel))
+        self._init_duplicate_filter(optimizer_arguments)
+        self.random_searcher = RandomSearch({
+            "random_state": self.random_state,
+            "filter_duplicates": self.filter_duplicates,
+            "duplicate_epsilon": self.duplicate_epsilon,
+            "max_duplicate_redraws": self.max_duplicate_redraws})
+        self.initial_design = optimizer_arguments.get("initial_design",
+                                                      self.initial_design)
+        if self.initial_design not in self.INITIAL_DESIGNS:
+            raise ValueError("initial_design %s not in %s."
+                             %(self.initial_design, self.INITIAL_DESIGNS))
+        if self.initial_design == "random":
+            self.initial_designer = self.random_searcher
+        else:
+            self.initial_designer = SpaceFillingDesign({
+                "design": self.initial_design,
+                "design_size": self.initial_random_runs,
+                "random_state": self.random_state,
+                "filter_duplicates": self.filter_duplicates,
+                "duplicate_epsilon": self.duplicate_epsilon,
+                "max_duplicate_redraws": self.max_duplicate_redraws})
 
-        if mcmc_imported:
+        if mcmc_imported and self.gp_engine == "gpy":
             self.mcmc = optimizer_arguments.get("mcmc", False)
         else:
             self.mcmc = False
 
         self.num_precomputed = optimizer_arguments.get('num_precomputed', 10)
+        self.incremental = optimizer_arguments.get("incremental",
+                                                   self.incremental)
+        self.full_refit_every = optimizer_arguments.get(
+            "full_refit_every", self.full_refit_every)
+        self.loglik_drop_tolerance = optimizer_arguments.get(
+            "loglik_drop_tolerance", self.loglik_drop_tolerance)
+        self.batch_strategy = optimizer_arguments.get("batch_strategy",
+                                                      self.batch_strategy)
+        if self.batch_strategy not in self.BATCH_STRATEGIES:
+            raise ValueError("batch_strategy %s not in %s."
+                             %(self.batch_strategy, self.BATCH_STRATEGIES))
+        self.constant_liar_value = optimizer_arguments.get(
+            "constant_liar_value", self.constant_liar_value)
+        if self.constant_liar_value not in self.CONSTANT_LIAR_VALUES:
+            raise ValueError("constant_liar_value %s not in %s."
+                             %(self.constant_liar_value,
+                               self.CONSTANT_LIAR_VALUES))
+        self.gp_backend = optimizer_arguments.get("gp_backend",
+                                                  self.gp_backend)
+        if self.gp_backend not in self.GP_BACKENDS:
+            raise ValueError("gp_backend %s not in %s."
+                             %(self.gp_backend, self.GP_BACKENDS))
+        if self.gp_engine == "numpy" and self.gp_backend == "sparse":
+            raise ValueError("The numpy gp_engine does not support the "
+                             "sparse gp_backend.")
+        self.sparse_threshold = optimizer_arguments.get(
+            "sparse_threshold", self.sparse_threshold)
+        self.num_inducing = optimizer_arguments.get("num_inducing",
+                                                    self.num_inducing)
+        self.fit_cache_size = optimizer_arguments.get("fit_cache_size",
+                                                      self.fit_cache_size)
+        self._fit_cache = OrderedDict()
         self.logger.info("Bayesian optimization initialized.")
 
     def get_next_candidates(self, experiment, num_candidates=None):
         if num_candidates is None:
             num_candidates = self.num_precomputed
-        #check whether a random search is necessary.
+        #check whether the initial design is necessary.
         if len(experiment.candidates_finished) < self.initial_random_runs:
-            return self.random_searcher.get_next_candidates(experiment, num_candidates)
+            return self.initial_designer.get_next_candidates(experiment,
+                                                             num_candidates)
 
         self._refit(experiment)
         #TODO refitted must be set, too.
         candidates = []
+        num_proposals = num_candidates
+        for i in range(self.max_duplicate_redraws + 1):
+            new_candidates = self._propose_candidates(experiment,
+                                                      num_proposals)
+            candidates.extend(self._filter_duplicates(
+                experiment, new_candidates, accepted=candidates))
+            if len(candidates) >= num_candidates or not self.filter_duplicates:
+                break
+            if self.batch_strategy is not None:
+                #the batch proposals already replace duplicates themselves.
+                break
+            #warping out snaps to known points; draw more proposals.
+            num_proposals += num_candidates
+        candidates = candidates[:num_candidates]
+
+        if len(candidates) < num_candidates:
+            self.logger.debug("Only %i of the proposals are new. Filling up "
+                              "with random search." %len(candidates))
+            random_candidates = self.random_searcher.get_next_candidates(
+                experiment, num_candidates - len(candidates))
+            candidates.extend(random_candidates)
+        return candidates
+
+    def _propose_candidates(self, experiment, num_candidates):
+        """
+        Returns the proposals of the acquisition function as Candidates.
+
+        Parameters
+        ----------
+        experiment : Experiment
+            The experiment for which to propose candidates. The gp has to
+            be fitted on it.
+        num_candidates : int
+            The number of proposals.
+
+        Returns
+        -------
+        candidates : list of Candidate
+            The warped-out proposals, best first.
+        """
+        if self.batch_strategy is not None:
+            return self._propose_batch(experiment, num_candidates)
         new_candidate_points = self.acquisition_function.compute_proposals(
             self.gp, experiment, number_proposals=num_candidates)
 
-        for point_and_value in new_candidate_points:
-            #get the the candidate point which is the first entry in the tuple.
-            point_candidate = Candidate(experiment.warp_pt_out(point_and_value[0]))
-            candidates.append(point_candidate)
+        #the candidate point is the first entry in each tuple.
+        param_names = sorted(experiment.parameter_definitions.keys())
+        point_matrix = np.array([[point_and_value[0][pn]
+                                  for pn in param_names]
+                                 for point_and_value in new_candidate_points],
+                                dtype=float)
+        return [Candidate(params) for params in
+                experiment.warp_matrix_out(point_matrix)]
+
+    def _propose_batch(self, experiment, num_candidates):
+        """
+        Proposes candidates one at a time using the batch_strategy.
+
+        The gp is first conditioned on the working and pending candidates.
+        After each proposal, it is conditioned on that proposal, too, so
+        the acquisition function avoids the points already being evaluated.
+        Proposals duplicating known candidates are skipped, but conditioned
+        on as well, up to max_duplicate_redraws times per candidate.
+        self.gp is not changed.
+
+        Parameters
+        ----------
+        experiment : Experiment
+            The experiment for which to propose candidates. The gp has to
+            be fitted on it.
+        num_candidates : int
+            The number of proposals.
+
+        Returns
+        -------
+        candidates : list of Candidate
+            The warped-out proposals, in order of proposal. There may be
+            less than num_candidates if too many proposals were duplicates.
+        """
+        param_names = sorted(experiment.parameter_definitions.keys())
+        lie = None
+        if self.batch_strategy == "constant_liar":
+            results = np.asarray(self.gp.Y)
+            lie = {"min": np.min, "max": np.max,
+                   "mean": np.mean}[self.constant_liar_value](results)
+
+        gp = self.gp
+        busy = (list(experiment.candidates_working) +
+                list(experiment.candidates_pending))
+        if busy:
+            busy_matrix = experiment.warp_matrix_in([c.params for c in busy])
+            gp = self._fantasize(gp, busy_matrix, lie)
+
+        candidates = []
+        max_proposals = num_candidates * (self.max_duplicate_redraws + 1)
+        for i in range(max_proposals):
+            point = self.acquisition_function.compute_proposals(
+                gp, experiment, number_proposals=1)[0][0]
+            candidates.extend(self._filter_duplicates(
+                experiment, [Candidate(experiment.warp_pt_out(point))],
+                accepted=candidates))
+            if len(candidates) >= num_candidates:
+                break
+            point_matrix = np.array([[point[pn] for pn in param_names]],
+                                    dtype=float)
+            gp = self._fantasize(gp, point_matrix, lie)
         return candidates
 
+    def _fantasize(self, gp, new_candidates, lie=None):
+        """
+        Returns a copy of gp conditioned on fantasized observations.
+
+        The hyperparameters are not changed.
+
+        Parameters
+        ----------
+        gp : GPy gp
+            The gp to condition. It is not changed.
+        new_candidates : numpy nd_array of shape (m, d)
+            The warped-in points to condition on.
+        lie : float or None, optional
+            The result assumed for all new_candidates. If None, the mean
+            predicted by gp is assumed (kriging believer).
+
+        Returns
+        -------
+        fantasy_gp : GPy gp
+            The conditioned copy of gp.
+        """
+        if lie is None:
+            fantasized_results = gp.predict(new_candidates)[0]
+        else:
+            fantasized_results = np.full((new_candidates.shape[0], 1),
+                                         lie, dtype=float)
+        fantasy_gp = gp.copy()
+        try:
+            if self._supports_appending(fantasy_gp):
+                self._append_observations(fantasy_gp, new_candidates,
+                                          fantasized_results)
+                return fantasy_gp
+        except np.linalg.LinAlgError:
+            #duplicate points without noise; GPy's inference adds jitter.
+            fantasy_gp = gp.copy()
+        fantasy_gp.set_XY(np.vstack((np.asarray(gp.X), new_candidates)),
+                          np.vstack((np.asarray(gp.Y), fantasized_results)))
+        return fantasy_gp
+
 
 
     def _refit(self, experiment):
         """
         Refits the GP with the data from experiment.
 
+        If the gp has already been fitted on the same finished candidates
+        and results, it is kept. If one of the last fit_cache_size fits was
+        on the same data, its hyperparameters are restored. Only otherwise
+        is the gp fitted.
+
         Parameters
         ----------
         experiment : experiment
             The experiment on which to refit this gp.
         """
-        candidate_matrix = np.zeros((len(experiment.candidates_finished),
-                                     len(experiment.parameter_definitions)))
-        results_vector = np.zeros((len(experiment.candidates_finished), 1))
+        candidate_matrix, results_vector = experiment.get_finished_matrix()
 
         param_names = sorted(experiment.parameter_definitions.keys())
-        self.kernel = self._check_kernel(self.kernel, len(param_names),
-                                         kernel_params=self.kernel_params)
-        for i, c in enumerate(experiment.candidates_finished):
-            warped_in = experiment.warp_pt_in(c.params)
-            param_values = []
-            for pn in param_names:
-                param_values.append(warped_in[pn])
-            candidate_matrix[i, :] = param_values
-            results_vector[i] = c.result
+        if self.gp_engine == "gpy":
+            self.kernel = self._check_kernel(self.kernel, len(param_names),
+                                             kernel_params=self.kernel_params)
+
+        fingerprint = data_fingerprint(candidate_matrix, results_vector)
+        if self.gp is not None and fingerprint == self._fit_fingerprint:
+            self.fit_cache_hits += 1
+            return
+        cached_state = self._fit_cache.pop(fingerprint, None)
+        if cached_state is not None and self._restore_gp(
+                cached_state, candidate_matrix, results_vector):
+            self.logger.debug("Reusing the cached gp fit.")
+            self.fit_cache_hits += 1
+        else:
+            self.fit_cache_misses += 1
+            self._fit_gp(candidate_matrix, results_vector)
+            cached_state = self._gp_state()
+        self._fit_fingerprint = fingerprint
+        if cached_state is not None and self.fit_cache_size > 0:
+            self._fit_cache[fingerprint] = cached_state
+            while len(self._fit_cache) > self.fit_cache_size:
+                self._fit_cache.popitem(last=False)
+
+    def _fit_gp(self, candidate_matrix, results_vector):
+        """
+        Fits the gp on the given data.
+
+        Depending on the settings, the gp is restored from a state set with
+        set_state, updated incrementally or optimized from scratch.
+
+        Parameters
+        ----------
+        candidate_matrix : numpy nd_array of shape (n, d)
+            The warped-in finished candidates.
+        results_vector : numpy nd_array of shape (n, 1)
+            Their results.
+        """
+        if self._restored_state is not None:
+            state = self._restored_state
+            self._restored_state = None
+            if (self._restore_gp(state, candidate_matrix, results_vector) and
+                    self._num_fitted == candidate_matrix.shape[0]):
+                return
+
+        if self.incremental and self._can_update_incrementally(
+                candidate_matrix, results_vector):
+            num_new = candidate_matrix.shape[0] - self._num_fitted
+            if num_new == 0:
+                return
+            self.logger.debug("Appending %i observations to the gp."
+                              %num_new)
+            self._append_to_gp(candidate_matrix[self._num_fitted:],
+                               results_vector[self._num_fitted:])
+            if not self._needs_full_refit():
+                return
 
         self.logger.debug("Refitting gp with cand %s and results %s"
                           %(candidate_matrix, results_vector))
-        self.gp = GPy.models.GPRegression(candidate_matrix, results_vector,
-                                          self.kernel)
+        noise_var = None
+        if self.incremental and self.gp is not None:
+            #warm-start the noise from the previous fit. The kernel
+            #hyperparameters are kept in self.kernel anyways.
+            if isinstance(self.gp, NumpyGP):
+                noise_var = float(self.gp.noise_var)
+            else:
+                noise_var = float(self.gp.likelihood.variance)
+        self.gp = self._build_gp(candidate_matrix, results_vector, noise_var)
 
 
         if self.mcmc:
@@ -179,11 +621,380 @@ class SimpleBayesianOptimizer(Optimizer):
                         verbose=True)
 
         else:
-            self.gp.constrain_positive("*")
-            self.gp.constrain_bounded(0.1, 1, warning=False)
-            self.gp.optimize_restarts(num_restarts=self.num_gp_restarts,
-                                  verbose=False)
+            self._constrain_gp(self.gp)
+            self._optimize_restarts(self.gp)
+
+        self._num_fitted = candidate_matrix.shape[0]
+        self._num_at_full_refit = self._num_fitted
+        self._loglik_at_full_refit = (float(self.gp.log_likelihood())
+                                      / max(self._num_fitted, 1))
+
+    def _optimize_restarts(self, gp):
+        """
+        Optimizes the hyperparameters of gp with restarts.
+
+        As with GPy's restarts, the first restart starts from the current
+        hyperparameters and the others from randomized ones. gp is set to
+        the best result. The restarts run in a process pool of
+        gp_restart_processes processes, or in this process for a single
+        one.
+
+        Parameters
+        ----------
+        gp : GPy gp
+            The constrained gp to optimize.
+        """
+        num_restarts = max(self.num_gp_restarts, 1)
+        seeds = [None] + [int(s) for s in self.random_state.randint(
+            2**31 - 1, size=num_restarts - 1)]
+        self.logger.debug("Running %i gp restarts in %i processes."
+                          %(num_restarts, self.gp_restart_processes))
+        num_processes = min(self.gp_restart_processes, num_restarts)
+        if num_processes <= 1:
+            #the pool's workers optimize copies of gp, so do the same here.
+            results = [_optimize_restart((gp.copy(), s)) for s in seeds]
+        else:
+            pool = multiprocessing.Pool(num_processes)
+            try:
+                results = pool.map(_optimize_restart,
+                                   [(gp, s) for s in seeds])
+            finally:
+                pool.close()
+                pool.join()
+        results = [r for r in results if r is not None]
+        if not results:
+            self.logger.warning("All gp restarts failed. Keeping the "
+                                "hyperparameters.")
+            return
+        best_params, best_objective = min(results, key=lambda r: r[1])
+        gp.optimizer_array = best_params
 
+    def _constrain_gp(self, gp):
+        """
+        Constrains the hyperparameters of gp before optimizing them.
+        """
+        if isinstance(gp, NumpyGP):
+            gp.constrain_bounded(0.1, 1)
+        elif self._is_sparse(gp):
+            #the inducing inputs are fixed, so only constrain the rest.
+            gp.kern.constrain_bounded(0.1, 1, warning=False)
+            gp.likelihood.constrain_bounded(0.1, 1, warning=False)
+        else:
+            gp.constrain_positive("*")
+            gp.constrain_bounded(0.1, 1, warning=False)
+
+    def _is_sparse(self, gp):
+        """
+        Returns whether gp is GPy's sparse gp.
+        """
+        if isinstance(gp, NumpyGP):
+            return False
+        return isinstance(gp, _import_gpy().models.SparseGPRegression)
+
+    def get_state(self):
+        """
+        Returns the fitted gp's hyperparameters, the refit bookkeeping and
+        the initial design's state.
+
+        The state also contains a fingerprint of the data the gp is fitted
+        on, so set_state can check that it is resumed on the same data.
+
+        Returns
+        -------
+        state : dict or None
+            The state, or None if there is nothing to keep yet.
+        """
+        state = self._gp_state()
+        design_state = self.initial_designer.get_state()
+        if design_state is not None:
+            if state is None:
+                state = {}
+            state["initial_design_state"] = design_state
+        return state
+
+    def _gp_state(self):
+        """
+        Returns the fitted gp's part of the state, or None if no gp has
+        been fitted yet.
+        """
+        if self.gp is None or self.mcmc:
+            return None
+        return {
+            "gp_params": np.asarray(self.gp.param_array).tolist(),
+            "sparse": self._is_sparse(self.gp),
+            "num_fitted": self._num_fitted,
+            "num_at_full_refit": self._num_at_full_refit,
+            "loglik_at_full_refit": self._loglik_at_full_refit,
+            "data_fingerprint": data_fingerprint(np.asarray(self.gp.X),
+                                                 np.asarray(self.gp.Y))
+        }
+
+    def set_state(self, state):
+        """
+        Restores a state returned by get_state.
+
+        On the next refit, the gp is rebuilt with the stored hyperparameters
+        instead of being optimized, provided the experiment's first finished
+        candidates are the ones the state was fitted on. Newer candidates
+        are then added as after any other refit. The initial design
+        continues where it stopped.
+        """
+        if state is not None:
+            self.initial_designer.set_state(
+                state.get("initial_design_state", None))
+        self._restored_state = state
+
+    def _restore_gp(self, state, candidate_matrix, results_vector):
+        """
+        Rebuilds the gp from a state returned by get_state.
+
+        Parameters
+        ----------
+        state : dict
+            The state.
+        candidate_matrix : numpy nd_array of shape (n, d)
+            The warped-in finished candidates.
+        results_vector : numpy nd_array of shape (n, 1)
+            Their results.
+
+        Returns
+        -------
+        restored : bool
+            True iff the gp has been restored. It then fits the first
+            state["num_fitted"] candidates.
+        """
+        num_fitted = state.get("num_fitted", 0)
+        if (self.mcmc or num_fitted == 0 or
+                num_fitted > candidate_matrix.shape[0]):
+            return False
+        candidate_matrix = candidate_matrix[:num_fitted]
+        results_vector = results_vector[:num_fitted]
+        if (data_fingerprint(candidate_matrix, results_vector) !=
+                state.get("data_fingerprint")):
+            self.logger.debug("Not restoring the gp; the data differs.")
+            return False
+        gp = self._build_gp(candidate_matrix, results_vector)
+        if self._is_sparse(gp) != state.get("sparse"):
+            return False
+        self._constrain_gp(gp)
+        gp_params = np.asarray(state["gp_params"], dtype=float)
+        if gp_params.shape != gp.param_array.shape:
+            return False
+        gp.param_array[:] = gp_params
+        gp.update_model(True)
+        self.logger.debug("Restored the gp on %i candidates." %num_fitted)
+        self.gp = gp
+        self._num_fitted = num_fitted
+        self._num_at_full_refit = state.get("num_at_full_refit", num_fitted)
+        self._loglik_at_full_refit = state.get("loglik_at_full_refit")
+        if self._loglik_at_full_refit is None:
+            self._loglik_at_full_refit = (float(gp.log_likelihood())
+                                          / num_fitted)
+        return True
+
+    def _build_gp(self, candidate_matrix, results_vector, noise_var=None):
+        """
+        Creates the gp on the given data, using the configured backend.
+
+        The sparse backend uses SparseGPRegression with num_inducing inducing
+        inputs, chosen at random from the candidates and fixed during the
+        optimization. It is used if gp_backend is "sparse", or if it is
+        "auto" and there are more than sparse_threshold candidates.
+
+        The numpy gp_engine always creates an exact NumpyGP. As with the
+        GPy kernel kept in self.kernel, it starts with the kernel
+        hyperparameters of the previous gp.
+
+        Parameters
+        ----------
+        candidate_matrix : numpy nd_array of shape (n, d)
+            The warped-in finished candidates.
+        results_vector : numpy nd_array of shape (n, 1)
+            Their results.
+        noise_var : float or None, optional
+            The initial noise variance. If None, GPy's default is used.
+
+        Returns
+        -------
+        gp : GPy gp or NumpyGP
+            The new, not yet optimized gp.
+        """
+        if self.gp_engine == "numpy":
+            gp_arguments = {}
+            if noise_var is not None:
+                gp_arguments["noise_var"] = noise_var
+            if (isinstance(self.gp, NumpyGP) and
+                    self.gp.input_dim == candidate_matrix.shape[1]):
+                gp_arguments["variance"] = self.gp.variance
+                gp_arguments["lengthscale"] = self.gp.lengthscale
+            return NumpyGP(candidate_matrix, results_vector, self.kernel,
+                           ARD=self.kernel_params.get("ARD", True),
+                           **gp_arguments)
+        GPy = _import_gpy()
+        num_data = candidate_matrix.shape[0]
+        use_sparse = (self.gp_backend == "sparse" or
+                      (self.gp_backend == "auto" and
+                       num_data > self.sparse_threshold))
+        if not use_sparse:
+            gp_arguments = {}
+            if noise_var is not None:
+                gp_arguments["noise_var"] = noise_var
+            return GPy.models.GPRegression(candidate_matrix, results_vector,
+                                           self.kernel, **gp_arguments)
+
+        num_inducing = min(self.num_inducing, num_data)
+        self.logger.debug("Using a sparse gp with %i inducing inputs for %i "
+                          "candidates." %(num_inducing, num_data))
+        inducing_idxs = self.random_state.choice(num_data, num_inducing,
+                                                 replace=False)
+        gp = GPy.models.SparseGPRegression(
+            candidate_matrix, results_vector, self.kernel,
+            Z=candidate_matrix[inducing_idxs].copy())
+        gp.Z.fix()
+        if noise_var is not None:
+            gp.likelihood.variance = noise_var
+        return gp
+
+    def _can_update_incrementally(self, candidate_matrix, results_vector):
+        """
+        Checks whether the current gp can be updated by appending rows.
+
+        This is the case iff the gp is an exact, non-mcmc gp whose data is
+        the beginning of candidate_matrix and results_vector.
+
+        Parameters
+        ----------
+        candidate_matrix : numpy nd_array of shape (n, d)
+            The warped-in finished candidates.
+        results_vector : numpy nd_array of shape (n, 1)
+            Their results.
+
+        Returns
+        -------
+        incremental : bool
+            True iff the gp can be updated incrementally.
+        """
+        if self.gp is None or self.mcmc:
+            return False
+        if not self._supports_appending(self.gp):
+            return False
+        if (self.gp_backend == "auto" and
+                candidate_matrix.shape[0] > self.sparse_threshold):
+            #refit to switch to the sparse gp.
+            return False
+        if candidate_matrix.shape[0] < self._num_fitted:
+            return False
+        return (np.array_equal(np.asarray(self.gp.X),
+                               candidate_matrix[:self._num_fitted]) and
+                np.array_equal(np.asarray(self.gp.Y),
+                               results_vector[:self._num_fitted]))
+
+    def _supports_appending(self, gp):
+        """
+        Returns whether observations can be appended to gp directly.
+
+        This is the case for NumpyGPs and exact GPy gps without normalizer
+        or mean function.
+        """
+        if isinstance(gp, NumpyGP):
+            return True
+        if not type(gp) is _import_gpy().models.GPRegression:
+            return False
+        return (getattr(gp, "normalizer", None) is None and
+                getattr(gp, "mean_function", None) is None)
+
+    def _append_to_gp(self, new_candidates, new_results):
+        """
+        Appends observations to the gp without refitting it.
+
+        The hyperparameters are kept. Instead of recomputing the posterior,
+        its cholesky factor is extended by the new points, which costs
+        O(n^2) per point instead of O(n^3).
+
+        Parameters
+        ----------
+        new_candidates : numpy nd_array of shape (m, d)
+            The warped-in new candidates.
+        new_results : numpy nd_array of shape (m, 1)
+            Their results.
+        """
+        self._append_observations(self.gp, new_candidates, new_results)
+        self._num_fitted = self.gp.num_data
+
+    def _append_observations(self, gp, new_candidates, new_results):
+        """
+        Appends observations to gp by extending its cholesky factor.
+
+        See _append_to_gp. gp is changed in place and must support
+        appending, see _supports_appending.
+
+        Parameters
+        ----------
+        gp : GPy.models.GPRegression or NumpyGP
+            The gp to append to.
+        new_candidates : numpy nd_array of shape (m, d)
+            The warped-in new candidates.
+        new_results : numpy nd_array of shape (m, 1)
+            Their results.
+        """
+        if isinstance(gp, NumpyGP):
+            gp.append_XY(new_candidates, new_results)
+            return
+        old_candidates = np.asarray(gp.X)
+        old_results = np.asarray(gp.Y)
+        noise = float(gp.likelihood.variance)
+
+        cross_cov = gp.kern.K(old_candidates, new_candidates)
+        new_prior_cov = gp.kern.K(new_candidates)
+        #GPy adds a jitter of 1e-8 to the diagonal.
+        new_cov = new_prior_cov + (noise + 1e-8) * np.eye(
+            new_candidates.shape[0])
+        #GPy's linear algebra expects fortran-ordered factors.
+        chol = np.asfortranarray(cholesky_append(gp.posterior.woodbury_chol,
+                                                 cross_cov, new_cov))
+
+        candidates = np.vstack((old_candidates, new_candidates))
+        results = np.vstack((old_results, new_results))
+        prior_cov = np.vstack((
+            np.hstack((gp.posterior._K, cross_cov)),
+            np.hstack((cross_cov.T, new_prior_cov))))
+        alpha = cholesky_solve(chol, results)
+        log_likelihood = 0.5 * (-results.size * np.log(2 * np.pi)
+                                - 2 * np.sum(np.log(np.diag(chol)))
+                                - np.sum(alpha * results))
+
+        #Setting X and Y via set_XY would trigger a full inference, so we
+        #exchange the data and the posterior directly.
+        gp.X = type(gp.X)(candidates)
+        gp.Y = type(gp.Y)(results)
+        gp.Y_normalized = gp.Y
+        gp.num_data = candidates.shape[0]
+        gp.posterior = type(gp.posterior)(woodbury_chol=chol,
+                                          woodbury_vector=alpha, K=prior_cov)
+        gp._log_marginal_likelihood = log_likelihood
+
+    def _needs_full_refit(self):
+        """
+        Decides whether the incrementally updated gp needs a full refit.
+
+        This is the case every full_refit_every observations, or if the
+        log-likelihood per observation has dropped by more than
+        loglik_drop_tolerance since the last full refit.
+
+        Returns
+        -------
+        refit : bool
+            True iff the hyperparameters should be optimized again.
+        """
+        if self._num_fitted - self._num_at_full_refit >= self.full_refit_every:
+            return True
+        loglik = float(self.gp.log_likelihood()) / self._num_fitted
+        if loglik < self._loglik_at_full_refit - self.loglik_drop_tolerance:
+            self.logger.debug("Log-likelihood per observation dropped from "
+                              "%f to %f." %(self._loglik_at_full_refit,
+                                            loglik))
+            return True
+        return False
 
     def _check_kernel(self, kernel, dimension, kernel_params):
         """
@@ -206,6 +1017,7 @@ class SimpleBayesianOptimizer(Optimizer):
         kernel : GPy.kern
             A GPy kernel.
         """
+        GPy = _import_gpy()
         if (isinstance(kernel, GPy.kern.Kern)):
             return kernel
         translation_dict = {
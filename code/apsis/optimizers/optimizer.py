@@ -2,6 +2,7 @@ __author__ = 'Frederik Diehl'
 
 from apsis.models.experiment import Experiment
 from abc import ABCMeta, abstractmethod
+import numpy as np
 
 
 class Optimizer(object):
@@ -12,6 +13,10 @@ class Optimizer(object):
 
     SUPPORTED_PARAM_TYPES = []
 
+    filter_duplicates = True
+    duplicate_epsilon = 0
+    max_duplicate_redraws = 10
+
     @abstractmethod
     def __init__(self, optimizer_params):
         """
@@ -26,7 +31,7 @@ class Optimizer(object):
         pass
 
     @abstractmethod
-    def get_next_candidates(self, experiment):
+    def get_next_candidates(self, experiment, num_candidates=None):
         """
         Returns several Candidate objects given an experiment.
 
@@ -36,6 +41,9 @@ class Optimizer(object):
         ----------
         experiment : Experiment
             The experiment to form the base of the next candidate.
+        num_candidates : int or None, optional
+            The number of Candidates to provide. If None, the optimizer
+            chooses.
 
         Returns
         -------
@@ -44,6 +52,109 @@ class Optimizer(object):
         """
         pass
 
+    def get_state(self):
+        """
+        Returns the state learned by the optimizer, for example fitted
+        hyperparameters.
+
+        The state allows a new optimizer with the same arguments to resume
+        without repeating expensive computations, see set_state.
+
+        Returns
+        -------
+        state : json-serializable object or None
+            The state, or None if the optimizer has no state worth keeping.
+        """
+        return None
+
+    def set_state(self, state):
+        """
+        Restores a state returned by get_state.
+
+        The state is only a hint; the optimizer may ignore it, for example
+        if it does not fit the experiment it is used on.
+
+        Parameters
+        ----------
+        state : json-serializable object or None
+            The state to restore.
+        """
+        pass
+
+    def _init_duplicate_filter(self, optimizer_arguments):
+        """
+        Reads the duplicate filter settings from optimizer_arguments.
+
+        Parameters
+        ----------
+        optimizer_arguments : dict
+            The following keys are used:
+            "filter_duplicates" : bool, optional
+                Whether to reject proposals which are already finished,
+                working or pending. Default is True.
+            "duplicate_epsilon" : float, optional
+                Proposals within this euclidean distance of a known candidate
+                in the warped-in space are rejected, too. Default is 0, which
+                only rejects equal candidates.
+            "max_duplicate_redraws" : int, optional
+                How often to try replacing rejected proposals. Default is 10.
+        """
+        self.filter_duplicates = optimizer_arguments.get(
+            "filter_duplicates", self.filter_duplicates)
+        self.duplicate_epsilon = optimizer_arguments.get(
+            "duplicate_epsilon", self.duplicate_epsilon)
+        self.max_duplicate_redraws = optimizer_arguments.get(
+            "max_duplicate_redraws", self.max_duplicate_redraws)
+
+    def _filter_duplicates(self, experiment, candidates, accepted=None):
+        """
+        Removes the candidates which duplicate known candidates.
+
+        A candidate is a duplicate if the experiment already knows it (see
+        Experiment.is_known_candidate) or it duplicates a candidate accepted
+        before it.
+
+        Parameters
+        ----------
+        experiment : Experiment
+            The experiment whose candidates to check against.
+        candidates : list of Candidate
+            The proposed candidates.
+        accepted : list of Candidate, optional
+            Candidates already accepted for the same batch.
+
+        Returns
+        -------
+        filtered : list of Candidate
+            The candidates which are no duplicates, in order.
+        """
+        if not self.filter_duplicates:
+            return list(candidates)
+        if accepted is None:
+            accepted = []
+        use_epsilon = (self.duplicate_epsilon > 0 and
+                       experiment.supports_finished_matrix())
+        accepted_set = set(accepted)
+        accepted_points = []
+        if use_epsilon:
+            accepted_points = list(experiment.warp_matrix_in(
+                [c.params for c in accepted]))
+        filtered = []
+        for c in candidates:
+            if c in accepted_set:
+                continue
+            if experiment.is_known_candidate(c, self.duplicate_epsilon):
+                continue
+            if use_epsilon:
+                point = experiment.warp_vector_in(c.params)
+                if any(np.linalg.norm(point - p) <= self.duplicate_epsilon
+                       for p in accepted_points):
+                    continue
+                accepted_points.append(point)
+            accepted_set.add(c)
+            filtered.append(c)
+        return filtered
+
     def _is_experiment_supported(self, experiment):
         """
         Tests whether all parameter types in experiment are supported by this
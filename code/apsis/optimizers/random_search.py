@@ -4,6 +4,7 @@ from apsis.optimizers.optimizer import Optimizer
 from apsis.models.parameter_definition import *
 from apsis.utilities.randomization import check_random_state
 from apsis.models.candidate import Candidate
+from apsis.utilities.logging_utils import get_logger
 
 class RandomSearch(Optimizer):
     """
@@ -19,6 +20,8 @@ class RandomSearch(Optimizer):
 
     random_state = None
 
+    logger = None
+
     def __init__(self, optimizer_arguments=None):
         """
         Initializes the RandomSearch.
@@ -31,42 +34,81 @@ class RandomSearch(Optimizer):
             "random_state" : random_state, None or int, optional
                 A numpy random_state (after which it is modelled). Can be used
                 for repeatability.
+            Also see Optimizer._init_duplicate_filter for the duplicate
+            filter settings.
         """
+        self.logger = get_logger(self)
         if optimizer_arguments is None:
             optimizer_arguments = {}
         self.random_state = optimizer_arguments.get("random_state", None)
+        self._init_duplicate_filter(optimizer_arguments)
 
     def get_next_candidates(self, experiment, num_candidates=1):
-        list = []
-        for i in range(num_candidates):
-            list.append(self._get_one_candidate(experiment))
-        return list
+        """
+        Returns num_candidates random candidates.
+
+        Candidates duplicating known ones are redrawn up to
+        max_duplicate_redraws times. If the parameter space is too small
+        to find enough new candidates, the rest is filled with duplicates.
+        """
+        candidates = []
+        for i in range(self.max_duplicate_redraws + 1):
+            new_candidates = self._draw_candidates(
+                experiment, num_candidates - len(candidates))
+            candidates.extend(self._filter_duplicates(
+                experiment, new_candidates, accepted=candidates))
+            if len(candidates) >= num_candidates:
+                break
+        if len(candidates) < num_candidates:
+            self.logger.warning("Found only %i new candidates. Filling up with "
+                                "already known ones." %len(candidates))
+            candidates.extend(self._draw_candidates(
+                experiment, num_candidates - len(candidates)))
+        return candidates
 
-    def _get_one_candidate(self, experiment):
+    def _draw_candidates(self, experiment, num_candidates):
+        """
+        Draws num_candidates random candidates without any filtering.
+
+        The values are drawn column-wise, that is with one call to the
+        random_state per parameter for all candidates at once.
+        """
+        if num_candidates <= 0:
+            return []
         self.random_state = check_random_state(self.random_state)
-        value_dict = {}
-        for key, param_def in experiment.parameter_definitions.iteritems():
-            value_dict[key] = self._gen_param_val(param_def)
-        return Candidate(value_dict)
+        keys = sorted(experiment.parameter_definitions.keys())
+        columns = [self._gen_param_vals(experiment.parameter_definitions[k],
+                                        num_candidates)
+                   for k in keys]
+        return [Candidate(dict(zip(keys, values)))
+                for values in zip(*columns)]
 
-    def _gen_param_val(self, param_def):
+    def _gen_param_vals(self, param_def, num_vals):
         """
-        Returns a random parameter value for param_def.
+        Returns num_vals random parameter values for param_def.
 
         Parameters
         ----------
         param_def : ParamDef
-            The parameter definition from which to choose one at random. The
-            following may happen:
-            NumericParamDef: warps_out a uniform 0-1 chosen value.
-            NominalParamDef: chooses one of the values at random.
+            The parameter definition from which to choose the values at
+            random. The following may happen:
+            NumericParamDef: warps_out uniform 0-1 chosen values.
+            NominalParamDef: chooses values at random.
+            Any other ParamDef: None values.
+        num_vals : int
+            The number of values to generate.
 
         Returns
         -------
-        param_val:
-            The generated parameter value.
+        param_vals : list
+            The generated parameter values.
         """
         if isinstance(param_def, NumericParamDef):
-            return param_def.warp_out(self.random_state.uniform(0, 1))
+            return list(param_def.warp_out_array(
+                self.random_state.uniform(0, 1, size=num_vals)))
         elif isinstance(param_def, NominalParamDef):
-            return self.random_state.choice(param_def.values)
+            idxs = self.random_state.randint(0, len(param_def.values),
+                                             size=num_vals)
+            #indexing the list keeps the values' types, unlike choice.
+            return [param_def.values[i] for i in idxs]
+        return [None] * num_vals
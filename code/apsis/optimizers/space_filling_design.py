@@ -0,0 +1,246 @@
+__author__ = 'Frederik Diehl'
+
+from apsis.optimizers.optimizer import Optimizer
+from apsis.models.parameter_definition import *
+from apsis.utilities.randomization import check_random_state
+from apsis.utilities.design_utils import sobol_sequence, halton_sequence, \
+    latin_hypercube
+from apsis.models.candidate import Candidate
+from apsis.utilities.logging_utils import get_logger
+import numpy as np
+
+
+class SpaceFillingDesign(Optimizer):
+    """
+    Proposes the points of a space-filling design.
+
+    Unlike random search, the points of a space-filling design cover the
+    parameter space evenly, so fewer points are needed to explore it. This
+    is especially useful as the initial design of a bayesian optimization.
+
+    The design's points are generated in the warped-in [0, 1] space and
+    warped out. Nominal parameters use the interval of the [0, 1] space
+    corresponding to each value.
+
+    The design keeps track of the points it has returned. Points which the
+    experiment does not know on the next call, because the caller dropped
+    them unused, are returned again before any new point, so the points
+    evaluated are the first ones of the design. See get_state for
+    resuming the design.
+
+    Attributes
+    ----------
+    design : string
+        The design to use. See DESIGNS.
+    random_state : None, int or random_state
+        The random_state used for the latin hypercube.
+    design_size : int
+        The number of points of each latin hypercube.
+    lhs_iterations : int
+        The number of random latin hypercubes of which the maximin one is
+        chosen.
+    logger : logging.logger
+        The logger for this class.
+    """
+    SUPPORTED_PARAM_TYPES = [NominalParamDef, NumericParamDef]
+
+    #"sobol" and "halton" are low-discrepancy sequences; "lhs" is a
+    #sequence of maximin latin hypercubes of design_size points each.
+    DESIGNS = ["sobol", "halton", "lhs"]
+
+    design = "sobol"
+    random_state = None
+    design_size = 10
+    lhs_iterations = 100
+
+    #the index of the next design point never returned.
+    _next_index = 0
+    #the indices of the returned points not yet known to the experiment.
+    _emitted = None
+    _lhs_blocks = None
+
+    logger = None
+
+    def __init__(self, optimizer_arguments=None):
+        """
+        Initializes the SpaceFillingDesign.
+
+        Parameters
+        ----------
+        optimizer_arguments : dict or None, optional
+            A dictionary of parameters for the optimizer. The following keys
+            are used:
+            "design" : string, optional
+                One of DESIGNS. Default is "sobol".
+            "random_state" : random_state, None or int, optional
+                A numpy random_state (after which it is modelled). Only used
+                by the latin hypercube design.
+            "design_size" : int, optional
+                The number of points of each latin hypercube. Should be the
+                number of points expected to be evaluated. Default is 10.
+            "lhs_iterations" : int, optional
+                The number of random latin hypercubes of which the one with
+                the largest minimal distance between points is used. Default
+                is 100.
+            Also see Optimizer._init_duplicate_filter for the duplicate
+            filter settings.
+
+        Raises
+        ------
+        ValueError :
+            Iff design is not in DESIGNS.
+        """
+        self.logger = get_logger(self)
+        if optimizer_arguments is None:
+            optimizer_arguments = {}
+        self.design = optimizer_arguments.get("design", self.design)
+        if self.design not in self.DESIGNS:
+            raise ValueError("design %s not in %s." %(self.design,
+                                                      self.DESIGNS))
+        self.random_state = check_random_state(
+            optimizer_arguments.get("random_state", None))
+        self.design_size = optimizer_arguments.get("design_size",
+                                                   self.design_size)
+        self.lhs_iterations = optimizer_arguments.get("lhs_iterations",
+                                                      self.lhs_iterations)
+        self._next_index = 0
+        self._emitted = set()
+        self._lhs_blocks = []
+        self._init_duplicate_filter(optimizer_arguments)
+
+    def get_next_candidates(self, experiment, num_candidates=1):
+        """
+        Returns the next num_candidates points of the design.
+
+        Returned points the experiment does not know are returned again
+        first, then new points follow. The point with the lowest index is
+        returned last, since the experiment assistants use the last
+        candidate first.
+
+        New points duplicating known candidates, for example because nominal
+        parameters snap to the same value, are skipped for up to
+        max_duplicate_redraws further batches of points. If the parameter
+        space is too small to find enough new candidates, the rest is
+        filled with duplicates.
+        """
+        self._forget_known_points(experiment)
+        idxs = sorted(self._emitted)[:num_candidates]
+        indexed = zip(idxs, self._design_candidates(experiment, idxs))
+        for i in range(self.max_duplicate_redraws + 1):
+            if len(indexed) >= num_candidates:
+                break
+            new_indexed = self._new_points(experiment,
+                                           num_candidates - len(indexed))
+            accepted = self._filter_duplicates(
+                experiment, [c for idx, c in new_indexed],
+                accepted=[c for idx, c in indexed])
+            accepted_ids = set(id(c) for c in accepted)
+            indexed.extend((idx, c) for idx, c in new_indexed
+                           if id(c) in accepted_ids)
+        if len(indexed) < num_candidates:
+            self.logger.warning("Found only %i new candidates. Filling up with "
+                                "already known ones." %len(indexed))
+            indexed.extend(self._new_points(experiment,
+                                            num_candidates - len(indexed)))
+        for idx, c in indexed:
+            self._emitted.add(idx)
+        indexed.sort(key=lambda ic: ic[0], reverse=True)
+        return [c for idx, c in indexed]
+
+    def get_state(self):
+        """
+        Returns the position in the design and the generated latin
+        hypercubes.
+
+        Returns
+        -------
+        state : dict
+            The state, which set_state restores.
+        """
+        return {
+            "next_index": self._next_index,
+            "emitted": sorted(self._emitted),
+            "lhs_blocks": [b.tolist() for b in self._lhs_blocks]
+        }
+
+    def set_state(self, state):
+        """
+        Restores a state returned by get_state, so the design continues
+        where it stopped.
+        """
+        if state is None:
+            return
+        self._next_index = state.get("next_index", 0)
+        self._emitted = set(state.get("emitted", []))
+        self._lhs_blocks = [np.asarray(b, dtype=float)
+                            for b in state.get("lhs_blocks", [])]
+
+    def _forget_known_points(self, experiment):
+        """
+        Removes the returned points the experiment knows from _emitted.
+        """
+        idxs = sorted(self._emitted)
+        for idx, c in zip(idxs, self._design_candidates(experiment, idxs)):
+            if experiment.is_known_candidate(c):
+                self._emitted.discard(idx)
+
+    def _new_points(self, experiment, num_points):
+        """
+        Returns (index, candidate) tuples for the next num_points points
+        never returned before.
+        """
+        idxs = range(self._next_index, self._next_index + num_points)
+        self._next_index += num_points
+        return zip(idxs, self._design_candidates(experiment, idxs))
+
+    def _design_candidates(self, experiment, idxs):
+        """
+        Returns the candidates for the design points idxs, without any
+        filtering.
+        """
+        if not idxs:
+            return []
+        keys = sorted(experiment.parameter_definitions.keys())
+        points = self._design_points(idxs, len(keys))
+        columns = [self._warp_out_column(experiment.parameter_definitions[k],
+                                         points[:, i])
+                   for i, k in enumerate(keys)]
+        return [Candidate(dict(zip(keys, values)))
+                for values in zip(*columns)]
+
+    def _design_points(self, idxs, dimension):
+        """
+        Returns the design points idxs.
+
+        Returns
+        -------
+        points : numpy array of shape (len(idxs), dimension)
+            The points in the [0, 1] space.
+        """
+        first = min(idxs)
+        num_points = max(idxs) - first + 1
+        if self.design == "sobol":
+            #the sobol sequence is only balanced in blocks of 2**k points
+            #starting at the origin, so the origin is not skipped.
+            points = sobol_sequence(num_points, dimension, skip=first)
+        elif self.design == "halton":
+            #as usual, the halton sequence starts after the origin.
+            points = halton_sequence(num_points, dimension, skip=first + 1)
+        else:
+            last_block = (first + num_points - 1) // self.design_size
+            while len(self._lhs_blocks) <= last_block:
+                self._lhs_blocks.append(latin_hypercube(
+                    self.design_size, dimension, self.random_state,
+                    self.lhs_iterations))
+            points = np.vstack(self._lhs_blocks)[first:first + num_points]
+        return points[np.asarray(idxs) - first]
+
+    def _warp_out_column(self, param_def, values):
+        """
+        Returns the parameter values of param_def for the values in [0, 1].
+        """
+        if isinstance(param_def, (NumericParamDef, PositionParamDef)):
+            return list(param_def.warp_out_array(values))
+        num_values = len(param_def.values)
+        idxs = np.minimum((values * num_values).astype(int), num_values - 1)
+        return [param_def.values[i] for i in idxs]
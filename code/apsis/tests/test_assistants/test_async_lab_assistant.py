@@ -0,0 +1,95 @@
+__author__ = 'Frederik Diehl'
+
+from apsis.assistants.async_lab_assistant import AsyncLabAssistant, Future
+from apsis.assistants.lab_assistant import BasicLabAssistant
+from apsis.models.parameter_definition import *
+from apsis.optimizers.random_search import RandomSearch
+from nose.tools import assert_equal, assert_raises, assert_true, \
+    assert_false, assert_is_none
+import tempfile
+import shutil
+import threading
+
+
+class GatedSearch(RandomSearch):
+    """
+    Records the number of requested candidates and blocks until released.
+    """
+
+    def __init__(self, optimizer_arguments=None):
+        super(GatedSearch, self).__init__(optimizer_arguments)
+        self.requested = []
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+
+    def get_next_candidates(self, experiment, num_candidates=1):
+        self.requested.append(num_candidates)
+        self.entered.set()
+        self.gate.wait()
+        return super(GatedSearch, self).get_next_candidates(
+            experiment, num_candidates)
+
+
+class TestAsyncLabAssistant(object):
+    """
+    Tests the AsyncLabAssistant.
+    """
+    directory = None
+    LAss = None
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.LAss = AsyncLabAssistant(BasicLabAssistant(self.directory))
+
+    def teardown(self):
+        self.LAss.close()
+        shutil.rmtree(self.directory)
+
+    def test_coalescing(self):
+        optimizer = GatedSearch()
+        self.LAss.init_experiment("test", optimizer,
+                                  {"x": MinMaxNumericParamDef(0, 1)})
+        first = self.LAss.get_next_candidate("test")
+        optimizer.entered.wait(10)
+        #these arrive while the first one is being computed.
+        others = [self.LAss.get_next_candidate("test") for i in range(3)]
+        assert_false(first.done())
+        optimizer.gate.set()
+        candidates = [f.result(10) for f in [first] + others]
+        assert_equal(optimizer.requested, [1, 3])
+        assert_equal(len(set(c.cand_id for c in candidates)), 4)
+
+    def test_update_order(self):
+        self.LAss.init_experiment("test", "RandomSearch",
+                                  {"x": MinMaxNumericParamDef(0, 1)})
+        futures = []
+        for i in range(5):
+            cand = self.LAss.get_next_candidate("test").result(10)
+            cand.result = i
+            futures.append(self.LAss.update("test", cand, "working"))
+            futures.append(self.LAss.update("test", cand))
+        best = self.LAss.get_best_candidate("test")
+        assert_equal(best.result(10).result, 0)
+        for f in futures:
+            assert_is_none(f.result(10))
+        exp = self.LAss.lab_assistant.exp_assistants["test"].experiment
+        assert_equal(len(exp.candidates_finished), 5)
+        assert_equal(len(exp.candidates_working), 0)
+
+    def test_exceptions(self):
+        future = self.LAss.get_next_candidate("unknown")
+        with assert_raises(KeyError):
+            future.result(10)
+        assert_true(isinstance(future.exception(), KeyError))
+
+    def test_future(self):
+        future = Future()
+        results = []
+        future.add_done_callback(lambda f: results.append(f.result()))
+        with assert_raises(RuntimeError):
+            future.result(0)
+        future.set_result(1)
+        future.add_done_callback(lambda f: results.append(f.result()))
+        assert_equal(results, [1, 1])
+        with assert_raises(RuntimeError):
+            future.set_result(2)
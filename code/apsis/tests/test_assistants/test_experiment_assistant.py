@@ -3,9 +3,15 @@ __author__ = 'Frederik Diehl'
 from apsis.assistants.experiment_assistant import *
 from nose.tools import assert_equal, assert_items_equal, assert_dict_equal, \
     assert_is_none, assert_raises, raises, assert_greater_equal, \
-    assert_less_equal, assert_in
+    assert_less_equal, assert_in, assert_true
 from apsis.utilities.logging_utils import get_logger
 from apsis.models.parameter_definition import *
+from apsis.optimizers.random_search import RandomSearch
+import tempfile
+import shutil
+import threading
+import os
+import numpy as np
 
 class TestAcquisition(object):
     """
@@ -91,6 +97,73 @@ class TestAcquisition(object):
         with assert_raises(ValueError):
             EAss.update(False)
 
+    def test_csv_writing(self):
+        """
+        Tests whether the buffered results file matches to_csv_results.
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            param_defs = {
+                "x": MinMaxNumericParamDef(0, 1),
+                "name": NominalParamDef(["A", "B", "C"])
+            }
+            EAss = BasicExperimentAssistant("test_csv", "RandomSearch",
+                                            param_defs,
+                                            experiment_directory_base=directory,
+                                            csv_flush_rows=3)
+            filename = os.path.join(directory, "test_csv_results.csv")
+            for i in range(4):
+                cand = EAss.get_next_candidate()
+                cand.result = 1./(i+1)
+                EAss.update(cand)
+            #only the header and the first two candidates are flushed yet.
+            with open(filename, "r") as results_file:
+                assert_equal(len(results_file.readlines()), 3)
+            EAss.close()
+            with open(filename, "r") as results_file:
+                lines = results_file.readlines()
+            assert_equal(len(lines), 5)
+            assert_equal(lines[0], EAss.experiment.to_csv_results()[0].split(
+                "\n")[0] + "\n")
+            assert_equal(EAss.csv_steps_written, 4)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_precompute_proposals(self):
+        """
+        Tests whether proposals are precomputed in the background.
+            - after a finished candidate, no synchronous computation happens.
+            - stale proposals are not served.
+        """
+        class ThreadRecordingSearch(RandomSearch):
+            threads = []
+
+            def get_next_candidates(self, experiment, num_candidates=1):
+                self.threads.append(threading.current_thread().name)
+                return super(ThreadRecordingSearch, self).get_next_candidates(
+                    experiment, num_candidates=3)
+
+        optimizer = ThreadRecordingSearch()
+        param_defs = {"x": MinMaxNumericParamDef(0, 1)}
+        EAss = BasicExperimentAssistant("test_precompute", optimizer,
+                                        param_defs, csv_write_frequency=0,
+                                        precompute_proposals=True,
+                                        max_proposal_staleness_steps=0)
+        cand = EAss.get_next_candidate()
+        assert_equal(optimizer.threads, ["MainThread"])
+        cand.result = 1
+        EAss.update(cand)
+        cand = EAss.get_next_candidate()
+        assert_equal(len(optimizer.threads), 2)
+        assert_in("precompute", optimizer.threads[1])
+        assert_equal(len(EAss.experiment.candidates_pending), 2)
+
+        #the proposals are too old now.
+        EAss.max_proposal_staleness_seconds = 0
+        EAss.get_next_candidate()
+        assert_equal(optimizer.threads[2], "MainThread")
+        EAss.close()
+
     def test_get_best_candidate(self):
         """
         Tests whether get_best_candidate works.
@@ -138,4 +211,84 @@ class TestAcquisition(object):
         cand = EAss.get_next_candidate()
         cand.result = 2
 
-        EAss.plot_result_per_step(show_plot=False)
\ No newline at end of file
+        EAss.plot_result_per_step(show_plot=False)
+
+    def test_shared_finished_matrix(self):
+        """
+        Tests whether the finished matrix is built once on the experiment
+        and only appended to afterwards, instead of once per snapshot.
+        """
+        rebuild = Experiment._rebuild_finished_matrix
+        rebuilds = []
+        def counting_rebuild(experiment):
+            rebuilds.append(experiment)
+            rebuild(experiment)
+        Experiment._rebuild_finished_matrix = counting_rebuild
+        try:
+            EAss = BasicExperimentAssistant(
+                "test_matrix", "BayOpt", {"x": MinMaxNumericParamDef(0, 1)},
+                optimizer_arguments={"initial_random_runs": 3,
+                                     "num_gp_restarts": 1},
+                csv_write_frequency=0)
+            for i in range(8):
+                cand = EAss.get_next_candidate()
+                cand.result = cand.params["x"]
+                EAss.update(cand)
+        finally:
+            Experiment._rebuild_finished_matrix = rebuild
+        assert_equal(rebuilds, [EAss.experiment])
+        candidate_matrix, results = EAss.experiment.get_finished_matrix()
+        assert_equal(candidate_matrix.shape, (8, 1))
+        assert_equal(len(rebuilds), 1)
+
+    def test_journal_resume(self):
+        """
+        Tests whether an experiment is resumed from its journal.
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            journal_filename = os.path.join(directory, "journal.sqlite")
+            param_defs = {"x": MinMaxNumericParamDef(0, 1)}
+            optimizer_arguments = {"initial_random_runs": 3,
+                                   "num_gp_restarts": 1}
+            EAss = BasicExperimentAssistant(
+                "test_journal", "BayOpt", param_defs,
+                optimizer_arguments=optimizer_arguments,
+                csv_write_frequency=0, journal_filename=journal_filename)
+            for i in range(5):
+                cand = EAss.get_next_candidate()
+                EAss.update(cand, "working")
+                cand.result = cand.params["x"]
+                EAss.update(cand)
+            working = EAss.get_next_candidate()
+            EAss.update(working, "working")
+            #a rejected update is not journaled.
+            invalid = Candidate({"x": 5.0})
+            invalid.result = 1
+            with assert_raises(ValueError):
+                EAss.update(invalid)
+            gp_params = EAss.optimizer.gp.param_array.copy()
+            EAss.close()
+
+            resumed = BasicExperimentAssistant(
+                "test_journal", "BayOpt", None,
+                optimizer_arguments=optimizer_arguments,
+                csv_write_frequency=0, journal_filename=journal_filename)
+            assert_equal(resumed.experiment.candidates_finished,
+                         EAss.experiment.candidates_finished)
+            assert_equal(resumed.experiment.candidates_working, [working])
+            assert_equal(resumed.get_best_candidate().result,
+                         EAss.get_best_candidate().result)
+            #the restored gp is used as long as no new result comes in.
+            resumed.optimizer_arguments["num_gp_restarts"] = None
+            resumed.get_next_candidate()
+            assert_true(np.allclose(resumed.optimizer.gp.param_array,
+                                    gp_params))
+            with assert_raises(ValueError):
+                BasicExperimentAssistant(
+                    "test_journal", "BayOpt", param_defs,
+                    experiment=EAss.experiment, csv_write_frequency=0,
+                    journal_filename=journal_filename)
+            resumed.close()
+        finally:
+            shutil.rmtree(directory)
@@ -3,9 +3,12 @@ __author__ = 'Frederik Diehl'
 from apsis.assistants.lab_assistant import *
 from nose.tools import assert_equal, assert_items_equal, assert_dict_equal, \
     assert_is_none, assert_raises, raises, assert_greater_equal, \
-    assert_less_equal, assert_in
+    assert_less_equal, assert_in, assert_true
 from apsis.utilities.logging_utils import get_logger
 from apsis.models.parameter_definition import *
+import tempfile
+import shutil
+import threading
 
 class TestAcquisition(object):
     """
@@ -147,6 +150,43 @@ class TestAcquisition(object):
         LAss.plot_result_per_step([name], show_plot=False)
         LAss.exp_assistants[name].experiment.minimization_problem = False
         LAss.plot_result_per_step(name, show_plot=False)
+        LAss.close()
+
+    def test_plot_throttling(self):
+        """
+        Tests whether plots are written for the requested steps only.
+            - synchronously, exactly every plot_every_n_steps-th step.
+            - asynchronously, the last step and at most one other.
+        """
+        optimizer = "RandomSearch"
+        name = "test_plot_throttling"
+        param_defs = {
+            "x": MinMaxNumericParamDef(0, 1),
+        }
+        directory = tempfile.mkdtemp()
+        try:
+            for async_plotting in [False, True]:
+                LAss = PrettyLabAssistant(write_directory_base=directory,
+                                          async_plotting=async_plotting,
+                                          plot_every_n_steps=2)
+                LAss.init_experiment(name, optimizer, param_defs)
+                for i in range(4):
+                    cand = LAss.get_next_candidate(name)
+                    cand.result = i
+                    LAss.update(name, cand)
+                assert_true(LAss.flush_plots(timeout=60))
+                written = os.listdir(os.path.join(LAss.lab_run_directory,
+                                                  "plots"))
+                if not async_plotting:
+                    assert_items_equal(written, ["2", "4"])
+                else:
+                    #renderings show the step current at rendering time.
+                    assert_in("4", written)
+                    assert_less_equal(len(written), 2)
+                LAss.close()
+                shutil.rmtree(LAss.lab_run_directory)
+        finally:
+            shutil.rmtree(directory)
 
     def test_validation_lab_assistant(self):
         """
@@ -170,4 +210,60 @@ class TestAcquisition(object):
         LAss.plot_result_per_step([name], show_plot=False)
         LAss.plot_validation([name], show_plot=False)
         LAss.exp_assistants[name][0].experiment.minimization_problem = False
-        LAss.plot_result_per_step(name, show_plot=False)
\ No newline at end of file
+        LAss.plot_result_per_step(name, show_plot=False)
+        LAss.close()
+
+    def test_validation_concurrent_workers(self):
+        """
+        Tests whether several outstanding candidates are tracked per fold.
+            - each candidate updates the fold it has been returned from.
+            - a rejected update can be retried.
+            - concurrent workers finish all candidates.
+        """
+        optimizer = "RandomSearch"
+        name = "test_concurrent"
+        param_defs = {
+            "x": MinMaxNumericParamDef(0, 1),
+        }
+        LAss = ValidationLabAssistant(cv=3, disable_auto_plot=True)
+        LAss.init_experiment(name, optimizer, param_defs)
+        cands = [LAss.get_next_candidate(name) for i in range(3)]
+        assert_items_equal(LAss.candidate_folds[name].values(), [0, 1, 2])
+        for cand in reversed(cands):
+            fold = LAss.candidate_folds[name][cand.cand_id]
+            cand.result = cand.params["x"]
+            LAss.update(name, cand)
+            assert_in(cand, LAss.exp_assistants[name][fold].experiment.
+                      candidates_finished)
+        assert_equal(LAss.candidate_folds[name], {})
+        with assert_raises(ValueError):
+            LAss.update(name, cands[0])
+
+        cand = LAss.get_next_candidate(name)
+        cand.result = cand.params["x"]
+        fold = LAss.candidate_folds[name][cand.cand_id]
+        def reject(candidate, status="finished"):
+            raise ValueError("Rejected.")
+        LAss.exp_assistants[name][fold].update = reject
+        with assert_raises(ValueError):
+            LAss.update(name, cand)
+        del LAss.exp_assistants[name][fold].update
+        LAss.update(name, cand)
+        assert_equal(LAss.candidate_folds[name], {})
+
+        def work():
+            for i in range(10):
+                cand = LAss.get_next_candidate(name)
+                LAss.update(name, cand, status="working")
+                cand.result = cand.params["x"]
+                LAss.update(name, cand)
+        workers = [threading.Thread(target=work) for i in range(4)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        finished = [len(e.experiment.candidates_finished)
+                    for e in LAss.exp_assistants[name]]
+        assert_equal(sum(finished), 44)
+        assert_less_equal(max(finished) - min(finished), 4)
+        LAss.close()
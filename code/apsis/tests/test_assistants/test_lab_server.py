@@ -0,0 +1,100 @@
+__author__ = 'Frederik Diehl'
+
+from apsis.assistants.lab_assistant import BasicLabAssistant
+from apsis.assistants.lab_server import LabAssistantServer
+from apsis.assistants.lab_client import LabAssistantClient, RemoteError
+from apsis.models.parameter_definition import *
+from nose.tools import assert_equal, assert_raises, assert_true, \
+    assert_is_none, assert_is_instance, assert_less_equal
+import tempfile
+import shutil
+import threading
+import numpy as np
+
+
+class TestLabAssistantServer(object):
+    """
+    Tests the LabAssistantServer together with the LabAssistantClient.
+    """
+    directory = None
+    server = None
+    client = None
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = LabAssistantServer(BasicLabAssistant(self.directory))
+        self.server.start()
+        host, port = self.server.address
+        self.client = LabAssistantClient(host, port)
+        self.client.init_experiment("test", "RandomSearch",
+                                    {"x": MinMaxNumericParamDef(0, 1),
+                                     "y": NominalParamDef(["A", "B"])})
+
+    def teardown(self):
+        self.client.close()
+        self.server.stop()
+        self.server.lab_assistant.close()
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        assert_is_none(self.client.get_best_candidate("test"))
+        for i in range(5):
+            cand = self.client.get_next_candidate("test")
+            assert_true(0 <= cand.params["x"] <= 1)
+            assert_true(cand.params["y"] in ["A", "B"])
+            #numpy results, as computed by most experiments, are sent too.
+            cand.result = np.float32(cand.params["x"])
+            self.client.update("test", cand)
+        exp = self.server.lab_assistant.exp_assistants["test"].experiment
+        assert_equal(len(exp.candidates_finished), 5)
+        best = self.client.get_best_candidate("test")
+        assert_equal(best.result,
+                     min(c.result for c in exp.candidates_finished))
+
+    def test_errors(self):
+        with assert_raises(ValueError):
+            self.client.init_experiment("test", "RandomSearch",
+                                        {"x": MinMaxNumericParamDef(0, 1)})
+        with assert_raises(ValueError):
+            self.client.call("unknown_method")
+        with assert_raises(TypeError):
+            self.client.call("get_next_candidate", not_an_argument=1)
+        with assert_raises(RemoteError):
+            self.client._unwrap({"error": {"type": "LinAlgError",
+                                           "message": "not pd"}})
+        #the connection is still usable after errors.
+        assert_true(self.client.get_next_candidate("test") is not None)
+
+    def test_batch_and_pipeline(self):
+        calls = [("get_next_candidate", {"exp_name": "test"})] * 3
+        calls.append(("get_next_candidate", {"exp_name": "unknown"}))
+        for results in [self.client.batch(calls),
+                        self.client.pipeline(calls)]:
+            assert_equal(len(results), 4)
+            for r in results[:3]:
+                assert_true("x" in r["params"])
+            assert_is_instance(results[3], Exception)
+
+    def test_concurrent_clients(self):
+        host, port = self.server.address
+        errors = []
+
+        def work():
+            try:
+                with LabAssistantClient(host, port) as client:
+                    for i in range(5):
+                        cand = client.get_next_candidate("test")
+                        cand.result = 1
+                        client.update("test", cand)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert_equal(errors, [])
+        exp = self.server.lab_assistant.exp_assistants["test"].experiment
+        assert_equal(len(exp.candidates_finished), 20)
+        assert_less_equal(len(exp.candidates_working), 0)
@@ -3,6 +3,8 @@ __author__ = 'Frederik Diehl'
 from apsis.models.candidate import Candidate, from_dict
 from nose.tools import assert_dict_equal, assert_equal, assert_raises, \
     assert_not_equal, assert_false, assert_true
+import copy
+import pickle
 
 
 class TestCandidate(object):
@@ -29,6 +31,9 @@ class TestCandidate(object):
         with assert_raises(ValueError):
             Candidate(False)
 
+        assert_not_equal(cand1.cand_id, Candidate(params).cand_id)
+        assert_equal(Candidate(params, cand_id="id").cand_id, "id")
+
     def test_eq(self):
         """
         Tests the equiality.
@@ -92,7 +97,47 @@ class TestCandidate(object):
         d["result"] = None
         d["cost"] = None
         d["worker_information"] = None
+        d["cand_id"] = cand1.cand_id
         assert_dict_equal(entry, d)
 
         cand2 = from_dict(entry)
-        assert_equal(cand1, cand2)
\ No newline at end of file
+        assert_equal(cand1, cand2)
+        assert_equal(cand1.cand_id, cand2.cand_id)
+
+    def test_hash_and_immutability(self):
+        """
+        Tests hashing, the immutable params and copying.
+        """
+        params = {
+            "x": 1,
+            "name": "B"
+        }
+        cand1 = Candidate(params)
+        cand2 = Candidate(dict(params))
+        cand3 = Candidate({"x": 2, "name": "B"})
+        assert_equal(hash(cand1), hash(cand2))
+        assert_equal(cand1.fingerprint, cand2.fingerprint)
+        assert_equal(len(set([cand1, cand2, cand3])), 2)
+        assert_false(cand1 != cand2)
+        assert_true(cand1 != cand3)
+
+        #changing the original dictionary does not change the candidate.
+        params["x"] = 5
+        assert_equal(cand1.params["x"], 1)
+        with assert_raises(TypeError):
+            cand1.params["x"] = 3
+        with assert_raises(TypeError):
+            cand1.params.update({"x": 3})
+        with assert_raises(AttributeError):
+            cand1.not_an_attribute = 3
+
+        cand1.result = 2
+        for copied in [copy.copy(cand1), copy.deepcopy(cand1),
+                       pickle.loads(pickle.dumps(cand1)),
+                       pickle.loads(pickle.dumps(cand1, 2))]:
+            assert_equal(copied, cand1)
+            assert_equal(copied.result, 2)
+            assert_equal(copied.cand_id, cand1.cand_id)
+            assert_equal(hash(copied), hash(cand1))
+            with assert_raises(TypeError):
+                copied.params["x"] = 3
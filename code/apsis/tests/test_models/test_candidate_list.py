@@ -0,0 +1,97 @@
+__author__ = 'Frederik Diehl'
+
+from apsis.models.candidate import Candidate
+from apsis.models.candidate_list import CandidateList
+from nose.tools import assert_equal, assert_raises, assert_true, \
+    assert_false, assert_in, assert_not_in
+
+
+class TestCandidateList(object):
+    """
+    Tests the CandidateList.
+    """
+
+    def test_list_behaviour(self):
+        """
+        Tests that the CandidateList behaves like a list of Candidates.
+        """
+        cands = [Candidate({"x": i}) for i in range(5)]
+        cand_list = CandidateList(cands[:3])
+        assert_equal(len(cand_list), 3)
+        assert_equal(cand_list, cands[:3])
+        cand_list.extend(cands[3:])
+        assert_equal(list(cand_list), cands)
+        assert_equal(cand_list[1], cands[1])
+        assert_equal(cand_list[-1], cands[-1])
+        assert_equal(cand_list[1:3], cands[1:3])
+
+        assert_equal(cand_list.pop(), cands[4])
+        assert_equal(cand_list.pop(0), cands[0])
+        assert_equal(cand_list.pop(1), cands[2])
+        assert_equal(list(cand_list), [cands[1], cands[3]])
+        cand_list.pop()
+        cand_list.pop()
+        assert_false(cand_list)
+        with assert_raises(IndexError):
+            cand_list.pop()
+
+    def test_membership_and_removal(self):
+        """
+        Tests membership and removal, which use candidate equality.
+        """
+        cand = Candidate({"x": 1, "name": "A"})
+        equal_cand = Candidate({"x": 1, "name": "A"})
+        other_cand = Candidate({"x": 2, "name": "A"})
+        cand_list = CandidateList([cand, other_cand, cand])
+
+        assert_in(equal_cand, cand_list)
+        assert_not_in(Candidate({"x": 3, "name": "A"}), cand_list)
+        assert_not_in(False, cand_list)
+
+        cand_list.remove(equal_cand)
+        assert_equal(list(cand_list), [other_cand, cand])
+        assert_in(cand, cand_list)
+        assert_true(cand_list.discard(cand))
+        assert_not_in(cand, cand_list)
+        assert_false(cand_list.discard(cand))
+        with assert_raises(ValueError):
+            cand_list.remove(cand)
+        assert_equal(list(cand_list), [other_cand])
+
+    def test_copy(self):
+        """
+        Tests that copies share their storage but change independently.
+        """
+        cands = [Candidate({"x": i}) for i in range(6)]
+        original = CandidateList(cands[:3])
+        copied = original.copy()
+        assert_true(copied._storage is original._storage)
+
+        #the first to append does so in place.
+        original.append(cands[3])
+        assert_true(copied._storage is original._storage)
+        assert_not_in(cands[3], copied)
+        assert_equal(len(copied), 3)
+        copied.append(cands[4])
+        assert_false(copied._storage is original._storage)
+        assert_equal(list(original), cands[:4])
+        assert_equal(list(copied), cands[:3] + [cands[4]])
+
+        #removing copies the shared storage first.
+        copied = original.copy()
+        copied.remove(cands[0])
+        assert_equal(list(original), cands[:4])
+        assert_equal(list(copied), cands[1:4])
+        assert_equal(original.pop(), cands[3])
+        assert_in(cands[3], copied)
+        original.append(cands[5])
+        assert_equal(list(original), cands[:3] + [cands[5]])
+        assert_equal(list(copied), cands[1:4])
+
+        #iterating from an index ignores what other lists appended.
+        shared = original.copy()
+        original.append(cands[4])
+        assert_equal(list(shared.iter_from(2)), [cands[2], cands[5]])
+        assert_equal(list(original.iter_from(3)), [cands[5], cands[4]])
+        assert_equal(list(original.iter_from(-1)), list(original))
+        assert_equal(list(original.iter_from(10)), [])
@@ -2,9 +2,10 @@ __author__ = 'Frederik Diehl'
 
 from apsis.models.experiment import Experiment
 from nose.tools import assert_equal, assert_raises, assert_dict_equal, \
-    assert_true, assert_false
+    assert_true, assert_false, assert_almost_equal
 from apsis.models.candidate import Candidate
 from apsis.models.parameter_definition import *
+import numpy as np
 
 class TestExperiment(object):
 
@@ -123,4 +124,102 @@ class TestExperiment(object):
         exp.add_finished(cand)
         string, steps_incl = exp.to_csv_results()
         assert_equal(steps_incl, 1)
-        assert_equal(string, "step,name,x,cost,result,best_result\n1,A,1,None,None,None\n")
\ No newline at end of file
+        assert_equal(string, "step,name,x,cost,result,best_result\n1,A,1,None,None,None\n")
+
+    def test_finished_matrix(self):
+        param_def = {
+            "x": MinMaxNumericParamDef(0, 10),
+            "y": MinMaxNumericParamDef(-1, 1)
+        }
+        exp = Experiment("test_experiment", param_def)
+        for i in range(5):
+            cand = Candidate({"x": i, "y": 0})
+            cand.result = i
+            exp.add_finished(cand)
+        candidate_matrix, results_vector = exp.get_finished_matrix()
+        assert_equal(candidate_matrix.shape, (5, 2))
+        assert_equal(results_vector.shape, (5, 1))
+        assert_equal(list(candidate_matrix[3]), [0.3, 0.5])
+
+        #adding candidates grows the matrix beyond its initial capacity.
+        for i in range(5, 40):
+            cand = Candidate({"x": i % 10, "y": 1})
+            cand.result = i
+            exp.add_finished(cand)
+        candidate_matrix, results_vector = exp.get_finished_matrix()
+        assert_equal(candidate_matrix.shape, (40, 2))
+        for i, c in enumerate(exp.candidates_finished):
+            warped_in = exp.warp_pt_in(c.params)
+            assert_equal(list(candidate_matrix[i]),
+                         [warped_in["x"], warped_in["y"]])
+            assert_equal(results_vector[i, 0], c.result)
+
+        #replacing the finished candidates replaces the matrix, even if
+        #their number stays the same.
+        replaced = [Candidate({"x": 10, "y": -1}) for i in range(40)]
+        for c in replaced:
+            c.result = 1
+        exp.candidates_finished = replaced
+        candidate_matrix, results_vector = exp.get_finished_matrix()
+        assert_equal(candidate_matrix.shape, (40, 2))
+        assert_true((candidate_matrix == [1, 0]).all())
+        assert_true((results_vector == 1).all())
+
+        exp_nominal = Experiment("test_experiment", {
+            "x": MinMaxNumericParamDef(0, 1),
+            "name": NominalParamDef(["A", "B", "C"])
+        })
+        assert_false(exp_nominal.supports_finished_matrix())
+        with assert_raises(ValueError):
+            exp_nominal.get_finished_matrix()
+
+    def test_clone(self):
+        exp = Experiment("test_experiment", {"x": MinMaxNumericParamDef(0, 10)})
+        for i in range(5):
+            cand = Candidate({"x": i})
+            cand.result = i
+            exp.add_finished(cand)
+        exp.get_finished_matrix()
+        working = Candidate({"x": 7})
+        exp.add_working(working)
+
+        clone = exp.clone()
+        assert_true(clone.candidates_finished[0] is exp.candidates_finished[0])
+        assert_false(clone.candidates_working[0] is working)
+        assert_equal(clone.candidates_working, [working])
+
+        for e, x in [(exp, 5), (clone, 6)]:
+            cand = Candidate({"x": x})
+            cand.result = -x
+            e.add_finished(cand)
+        clone.add_finished(clone.candidates_working[0])
+        assert_equal(exp.candidates_working, [working])
+        assert_equal([c.params["x"] for c in exp.candidates_finished],
+                     [0, 1, 2, 3, 4, 5])
+        assert_equal([c.params["x"] for c in clone.candidates_finished],
+                     [0, 1, 2, 3, 4, 6, 7])
+        assert_equal(exp.best_candidate.result, -5)
+        assert_equal(clone.best_candidate.result, -6)
+        assert_equal(list(exp.get_finished_matrix()[0][:, 0]),
+                     [0, 0.1, 0.2, 0.3, 0.4, 0.5])
+        assert_equal(list(clone.get_finished_matrix()[0][:, 0]),
+                     [0, 0.1, 0.2, 0.3, 0.4, 0.6, 0.7])
+
+    def test_warp_matrix(self):
+        exp = Experiment("test_experiment", {
+            "x": MinMaxNumericParamDef(0, 10),
+            "y": AsymptoticNumericParamDef(0, 1),
+            "z": PositionParamDef(["A", "B"], [0, 1])
+        })
+        params_list = [{"x": i, "y": 0.1**i, "z": "AB"[i % 2]}
+                       for i in range(5)]
+        matrix = exp.warp_matrix_in(params_list)
+        assert_equal(matrix.shape, (5, 3))
+        for params, row in zip(params_list, matrix):
+            assert_true(np.allclose(row, exp.warp_vector_in(params)))
+        for params, warped_out in zip(params_list,
+                                      exp.warp_matrix_out(matrix)):
+            assert_equal(warped_out["z"], params["z"])
+            assert_almost_equal(warped_out["x"], params["x"])
+            assert_almost_equal(warped_out["y"], params["y"])
+        assert_equal(exp.warp_matrix_in([]).shape, (0, 3))
@@ -0,0 +1,73 @@
+__author__ = 'Frederik Diehl'
+
+from apsis.models.experiment_journal import ExperimentJournal
+from apsis.models.experiment import Experiment
+from apsis.models.candidate import Candidate
+from apsis.models.parameter_definition import *
+from nose.tools import assert_equal, assert_raises, assert_true, \
+    assert_false, assert_is_none
+import tempfile
+import shutil
+import os
+
+
+class TestExperimentJournal(object):
+    directory = None
+    filename = None
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "journal.sqlite")
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replay(self):
+        param_defs = {"x": MinMaxNumericParamDef(0, 1),
+                      "y": NominalParamDef(["A", "B"])}
+        exp = Experiment("test", param_defs, minimization_problem=False)
+        journal = ExperimentJournal(self.filename)
+        assert_true(journal.is_empty())
+        assert_is_none(journal.read_experiment())
+        journal.write_experiment(exp)
+        with assert_raises(ValueError):
+            journal.write_experiment(exp)
+
+        for i in range(5):
+            cand = Candidate({"x": i / 10., "y": "A"})
+            exp.add_working(cand)
+            journal.append("working", cand)
+            if i == 3:
+                exp.add_pausing(cand)
+                journal.append("pausing", cand)
+                continue
+            cand.result = i
+            cand.cost = 2 * i
+            exp.add_finished(cand)
+            journal.append("finished", cand)
+        with assert_raises(ValueError):
+            journal.append("unknown", cand)
+        journal.close()
+
+        restored = ExperimentJournal(self.filename).read_experiment()
+        assert_false(restored.minimization_problem)
+        assert_equal(restored.name, "test")
+        assert_equal(restored.candidates_finished, exp.candidates_finished)
+        assert_equal(restored.candidates_pending, exp.candidates_pending)
+        assert_equal(restored.candidates_working, exp.candidates_working)
+        assert_equal([c.cost for c in restored.candidates_finished],
+                     [c.cost for c in exp.candidates_finished])
+        assert_equal([c.cand_id for c in restored.candidates_finished],
+                     [c.cand_id for c in exp.candidates_finished])
+        assert_equal(restored.best_candidate.result, 4)
+
+    def test_optimizer_state(self):
+        journal = ExperimentJournal(self.filename)
+        assert_is_none(journal.read_optimizer_state())
+        journal.write_optimizer_state(None)
+        assert_is_none(journal.read_optimizer_state())
+        journal.write_optimizer_state({"a": [1, 2]})
+        journal.write_optimizer_state({"a": [3]})
+        journal.close()
+        assert_equal(ExperimentJournal(self.filename).read_optimizer_state(),
+                     {"a": [3]})
@@ -2,6 +2,8 @@ __author__ = 'Frederik Diehl'
 
 from apsis.models.parameter_definition import *
 from nose.tools import assert_equal, assert_raises, assert_items_equal, assert_true, assert_false, assert_almost_equal
+import json
+import numpy as np
 
 class TestParameterDefinitions(object):
 
@@ -82,4 +84,71 @@ class TestParameterDefinitions(object):
             x=float(i)/100 * asymptotic + (1-float(i)/100)*border
             w_i = pd.warp_in(x)
             w_o = pd.warp_out(w_i)
-            assert_almost_equal(w_o, min(max(x, 0), 1))
\ No newline at end of file
+            assert_almost_equal(w_o, min(max(x, 0), 1))
+
+    def test_param_def_dict_round_trip(self):
+        param_defs = [
+            NominalParamDef(["A", "B", "C"]),
+            OrdinalParamDef(["A", "B", "C"]),
+            MinMaxNumericParamDef(0, 10),
+            PositionParamDef(["A", "B", "C"], [0, 1, 10]),
+            FixedValueParamDef([1, 2, 5]),
+            AsymptoticNumericParamDef(0, 1)
+        ]
+        for pd in param_defs:
+            d = param_def_to_dict(pd)
+            restored = param_def_from_dict(json.loads(json.dumps(d)))
+            assert_equal(type(restored), type(pd))
+            assert_equal(restored.__dict__, pd.__dict__)
+        with assert_raises(ValueError):
+            param_def_from_dict({"type": "UnknownParamDef", "arguments": []})
+
+    def test_warp_arrays(self):
+        param_defs = [
+            MinMaxNumericParamDef(-2, 10),
+            AsymptoticNumericParamDef(0, 1),
+            AsymptoticNumericParamDef(1, 0),
+            NumericParamDef(lambda x: x**2, lambda x: x**0.5),
+        ]
+        values_out = np.linspace(0, 1, 23)
+        for pd in param_defs:
+            warped_out = pd.warp_out_array(values_out)
+            assert_equal(warped_out.shape, values_out.shape)
+            for v, w in zip(values_out, warped_out):
+                assert_almost_equal(w, pd.warp_out(v))
+            warped_in = pd.warp_in_array(warped_out)
+            for v, w in zip(warped_out, warped_in):
+                assert_almost_equal(w, pd.warp_in(v))
+
+        pd = PositionParamDef(["A", "B", "C"], [0, 0.2, 1])
+        assert_equal(list(pd.warp_in_array(["C", "A", "B"])),
+                     [pd.warp_in("C"), pd.warp_in("A"), pd.warp_in("B")])
+        with assert_raises(ValueError):
+            pd.warp_in_array(["D"])
+        for v in values_out:
+            assert_equal(pd.warp_out_array([v])[0], pd.warp_out(v))
+
+    def test_position_lookup(self):
+        widths = range(16, 16 * 300, 16)
+        pd = FixedValueParamDef(widths)
+        for w in widths[::7]:
+            assert_equal(pd.warp_out(pd.warp_in(w)), w)
+        assert_equal(pd.compare_values(32, 16), 1)
+        assert_almost_equal(pd.distance(16, 48), 32)
+        #warp_out works on the normalized positions, not the raw ones.
+        pd = PositionParamDef(["A", "B", "C"], [10, 20, 30])
+        assert_equal(pd.warp_out(0.3), "B")
+        assert_equal(pd.warp_out(0.5), "B")
+        assert_equal(pd.warp_out(0.51), "C")
+        assert_equal(pd.warp_out(-1), "A")
+        assert_equal(pd.warp_out(2), "C")
+        assert_equal(list(pd.warp_out_array([0.3, 0.51, -1, 2])),
+                     ["B", "C", "A", "C"])
+        #a single value has a zero span.
+        pd = FixedValueParamDef([5])
+        assert_equal(pd.warp_in(5), 0)
+        assert_equal(pd.warp_out(0.7), 5)
+        assert_equal(list(pd.warp_out_array([0, 1])), [5, 5])
+        ordinal = OrdinalParamDef([[1], [2]])
+        assert_true(ordinal.is_in_parameter_domain([2]))
+        assert_equal(ordinal.compare_values([1], [2]), -1)
@@ -2,11 +2,12 @@ __author__ = 'Frederik Diehl'
 
 from apsis.optimizers.bayesian_optimization import SimpleBayesianOptimizer
 from nose.tools import assert_is_none, assert_equal, assert_dict_equal, \
-    assert_true, assert_false
+    assert_true, assert_false, assert_almost_equal
 from apsis.optimizers.bayesian.acquisition_functions import ExpectedImprovement, ProbabilityOfImprovement
 from apsis.models.experiment import Experiment
 from apsis.models.parameter_definition import MinMaxNumericParamDef
 from apsis.models.candidate import Candidate
+import numpy as np
 
 class testAcqusitionFunction(object):
 
@@ -31,4 +32,82 @@ class testAcqusitionFunction(object):
             cand.result = 2
             exp.add_finished(cand)
         cands = opt.get_next_candidates(exp, num_candidates=3)
-        assert_equal(len(cands), 3)
\ No newline at end of file
+        assert_equal(len(cands), 3)
+
+    def test_evaluate_matrix(self):
+        opt = SimpleBayesianOptimizer({"initial_random_runs": 3})
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1),
+                                  "y": MinMaxNumericParamDef(0, 1)})
+        for i in range(5):
+            cand = opt.get_next_candidates(exp)[0]
+            cand.result = cand.params["x"] + cand.params["y"]
+            exp.add_finished(cand)
+        opt._refit(exp)
+        x_matrix = np.random.uniform(size=(20, 2))
+        for acq in [ExpectedImprovement(), ProbabilityOfImprovement()]:
+            values = acq._compute_minimizing_evaluate_matrix(x_matrix, opt.gp,
+                                                             exp)
+            assert_equal(values.shape, (20,))
+            for i in range(20):
+                x_dict = {"x": x_matrix[i, 0], "y": x_matrix[i, 1]}
+                assert_almost_equal(
+                    values[i],
+                    float(acq._compute_minimizing_evaluate(x_dict, opt.gp,
+                                                           exp)))
+            proposals = acq.compute_proposals(opt.gp, exp, number_proposals=4)
+            assert_equal(len(proposals), 4)
+            assert_equal(proposals[0][1], min([p[1] for p in proposals]))
+
+    def test_EI_matrix_gradient(self):
+        opt = SimpleBayesianOptimizer({"initial_random_runs": 3})
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1),
+                                  "y": MinMaxNumericParamDef(0, 1)})
+        for i in range(6):
+            cand = opt.get_next_candidates(exp)[0]
+            cand.result = (cand.params["x"] - 0.3)**2 + cand.params["y"]
+            exp.add_finished(cand)
+        opt._refit(exp)
+        ei = ExpectedImprovement()
+        x_matrix = np.random.uniform(0.1, 0.9, size=(10, 2))
+        values, gradients = ei._evaluate_matrix(x_matrix, opt.gp, exp)
+        assert_equal(values.shape, (10,))
+        assert_equal(gradients.shape, (10, 2))
+        eps = 1e-6
+        for i in range(10):
+            value, gradient = ei._evaluate_vector(x_matrix[i], opt.gp, exp)
+            assert_almost_equal(value, values[i])
+            for d in range(2):
+                x_plus = x_matrix[i].copy()
+                x_plus[d] += eps
+                x_minus = x_matrix[i].copy()
+                x_minus[d] -= eps
+                numeric = (ei._evaluate_vector(x_plus, opt.gp, exp)[0] -
+                           ei._evaluate_vector(x_minus, opt.gp, exp)[0])/(2*eps)
+                assert_almost_equal(gradients[i, d], numeric, places=4)
+
+    def test_EI_parallel_restarts(self):
+        for acq_params in [{"optimization_workers": 3},
+                           {"optimization_workers": 2,
+                            "optimization_pool": "process"},
+                           {"optimization_early_stop": 2,
+                            "optimization_basin_tolerance": 1}]:
+            opt = SimpleBayesianOptimizer({"initial_random_runs": 3,
+                                           "acquisition_hyperparams":
+                                               acq_params})
+            exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1)})
+            for i in range(5):
+                cand = opt.get_next_candidates(exp)[0]
+                cand.result = (cand.params["x"] - 0.5)**2
+                exp.add_finished(cand)
+            cands = opt.get_next_candidates(exp, num_candidates=3)
+            assert_equal(len(cands), 3)
+
+    def test_EI_early_stop(self):
+        ei = ExpectedImprovement({"optimization_early_stop": 2,
+                                  "optimization_basin_tolerance": 0.1})
+        minima = []
+        assert_false(ei._converged_to_same_basin([0.5], minima))
+        assert_false(ei._converged_to_same_basin([0.9], minima))
+        assert_true(ei._converged_to_same_basin([0.55], minima))
+        assert_false(ExpectedImprovement()._converged_to_same_basin([0.5],
+                                                                    [[0.5]]))
@@ -0,0 +1,67 @@
+__author__ = 'Frederik Diehl'
+
+from apsis.optimizers.bayesian.gaussian_process import NumpyGP
+from nose.tools import assert_equal, assert_true, assert_raises
+import numpy as np
+import GPy
+
+
+class TestNumpyGP(object):
+
+    def _data(self):
+        random_state = np.random.RandomState(0)
+        X = random_state.uniform(size=(12, 2))
+        Y = np.sin(5 * X[:, :1]) + X[:, 1:]
+        return X, Y, random_state.uniform(size=(4, 2))
+
+    def test_matches_gpy(self):
+        X, Y, X_new = self._data()
+        kernels = {"matern52": GPy.kern.Matern52, "rbf": GPy.kern.RBF}
+        for name, kernel in kernels.items():
+            gp = NumpyGP(X, Y, name, variance=1.5, lengthscale=[0.3, 0.6],
+                         noise_var=0.05)
+            reference = GPy.models.GPRegression(
+                X, Y, kernel(2, variance=1.5, lengthscale=[0.3, 0.6],
+                             ARD=True), noise_var=0.05)
+            assert_true(np.allclose(gp.param_array, reference.param_array))
+            assert_true(np.allclose(gp.log_likelihood(),
+                                    reference.log_likelihood()))
+            for mine, theirs in zip(gp.predict(X_new),
+                                    reference.predict(X_new)):
+                assert_true(np.allclose(mine, theirs))
+            for mine, theirs in zip(gp.predictive_gradients(X_new),
+                                    reference.predictive_gradients(X_new)):
+                assert_true(np.allclose(mine, theirs))
+        assert_raises(ValueError, NumpyGP, X, Y, "linear")
+
+    def test_optimize(self):
+        X, Y, X_new = self._data()
+        gp = NumpyGP(X, Y, ARD=False)
+        gp.constrain_bounded(0.01, 10)
+        #the analytic gradient matches the numerical one.
+        x = gp.optimizer_array
+        objective, gradient = gp._objective_and_gradient(x)
+        steps = 1e-6 * np.eye(len(x))
+        numerical = [(gp._objective_and_gradient(x + s)[0] -
+                      gp._objective_and_gradient(x - s)[0]) / 2e-6
+                     for s in steps]
+        assert_true(np.allclose(gradient, numerical, atol=1e-5))
+
+        gp.optimizer_array = x
+        gp.optimize_restarts(3, random_state=np.random.RandomState(1))
+        assert_true(gp.log_likelihood() > -objective)
+        assert_true(np.all(gp.param_array >= 0.01))
+        assert_true(np.all(gp.param_array <= 10))
+
+    def test_append(self):
+        X, Y, X_new = self._data()
+        gp = NumpyGP(X[:8], Y[:8])
+        appended = gp.copy()
+        appended.append_XY(X[8:], Y[8:])
+        assert_equal(gp.num_data, 8)
+        assert_equal(appended.num_data, 12)
+        full = NumpyGP(X, Y)
+        assert_true(np.allclose(appended.log_likelihood(),
+                                full.log_likelihood()))
+        assert_true(np.allclose(appended.predict(X_new)[0],
+                                full.predict(X_new)[0]))
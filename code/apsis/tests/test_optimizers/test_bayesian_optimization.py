@@ -2,11 +2,15 @@ __author__ = 'Frederik Diehl'
 
 from apsis.optimizers.bayesian_optimization import SimpleBayesianOptimizer
 from nose.tools import assert_is_none, assert_equal, assert_dict_equal, \
-    assert_true, assert_false
+    assert_true, assert_false, assert_raises
 from apsis.optimizers.bayesian.acquisition_functions import ExpectedImprovement, ProbabilityOfImprovement
 from apsis.models.experiment import Experiment
-from apsis.models.parameter_definition import MinMaxNumericParamDef
+from apsis.models.parameter_definition import MinMaxNumericParamDef, \
+    FixedValueParamDef
 from apsis.models.candidate import Candidate
+import numpy as np
+import GPy
+import json
 
 class testSimpleBayesianOptimization(object):
 
@@ -53,4 +57,231 @@ class testSimpleBayesianOptimization(object):
             cand.result = 2
             exp.add_finished(cand)
         cands = opt.get_next_candidates(exp, num_candidates=3)
-        assert_equal(len(cands), 3)
\ No newline at end of file
+        assert_equal(len(cands), 3)
+
+    def test_incremental(self):
+        #the thresholds are large enough that there is only one full refit,
+        #so every later observation is appended incrementally.
+        opt = SimpleBayesianOptimizer({"initial_random_runs": 3,
+                                       "incremental": True,
+                                       "full_refit_every": 1000,
+                                       "loglik_drop_tolerance": 1e10,
+                                       "num_gp_restarts": 2})
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1)})
+        for i in range(8):
+            cand = opt.get_next_candidates(exp, num_candidates=1)[0]
+            cand.result = (cand.params["x"] - 0.3)**2
+            exp.add_finished(cand)
+        opt._refit(exp)
+        assert_equal(opt._num_fitted, 8)
+        num_at_full_refit = opt._num_at_full_refit
+
+        cand = Candidate({"x": 0.75})
+        cand.result = 0.2025
+        exp.add_finished(cand)
+        opt._refit(exp)
+        assert_equal(opt.gp.X.shape[0], 9)
+        assert_equal(opt._num_at_full_refit, num_at_full_refit)
+        #the incrementally updated gp has to predict the same as a gp with
+        #the same hyperparameters built from scratch.
+        reference = GPy.models.GPRegression(
+            np.asarray(opt.gp.X), np.asarray(opt.gp.Y),
+            opt.gp.kern.copy(),
+            noise_var=float(opt.gp.likelihood.variance))
+        test_points = np.linspace(0, 1, 7)[:, None]
+        mean, var = opt.gp.predict(test_points)
+        ref_mean, ref_var = reference.predict(test_points)
+        assert_true(np.allclose(mean, ref_mean))
+        assert_true(np.allclose(var, ref_var))
+        assert_true(np.allclose(opt.gp.log_likelihood(),
+                                reference.log_likelihood()))
+
+    def test_duplicate_filter(self):
+        #the last free value is found by random search, which needs enough
+        #redraws to find it reliably.
+        opt = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                       "num_gp_restarts": 2,
+                                       "max_duplicate_redraws": 50})
+        exp = Experiment("test", {"x": FixedValueParamDef([0, 1, 2, 3, 4])})
+        for i in range(5):
+            cand = opt.get_next_candidates(exp, num_candidates=1)[0]
+            assert_false(cand in exp.candidates_finished)
+            cand.result = cand.params["x"]
+            exp.add_finished(cand)
+        assert_equal(len(set(exp.candidates_finished)), 5)
+
+    def test_batch_strategies(self):
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1),
+                                  "y": MinMaxNumericParamDef(0, 1)})
+        for x in np.linspace(0, 1, 5):
+            cand = Candidate({"x": x, "y": 1 - x})
+            cand.result = 10 * (x - 0.3)**2
+            exp.add_finished(cand)
+        working = Candidate({"x": 0.3, "y": 0.7})
+        exp.add_working(working)
+
+        for strategy in ["kriging_believer", "constant_liar"]:
+            opt = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                           "num_gp_restarts": 2,
+                                           "batch_strategy": strategy,
+                                           "duplicate_epsilon": 1e-2,
+                                           "acquisition_hyperparams": {
+                                               "optimization_random_restarts":
+                                                   3},
+                                           "random_state": 1})
+            cands = opt.get_next_candidates(exp, num_candidates=4)
+            assert_equal(len(cands), 4)
+            points = [np.array([c.params["x"], c.params["y"]])
+                      for c in cands + [working]]
+            for i in range(len(points)):
+                for j in range(i):
+                    assert_true(np.linalg.norm(points[i] - points[j]) > 1e-2)
+            #the fantasies must not change the gp itself.
+            assert_equal(opt.gp.X.shape[0], 5)
+
+        with assert_raises(ValueError):
+            SimpleBayesianOptimizer({"batch_strategy": "q-ei"})
+
+    def test_sparse_backend(self):
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1)})
+        for x in np.linspace(0, 1, 30):
+            cand = Candidate({"x": x})
+            cand.result = np.sin(5 * x)
+            exp.add_finished(cand)
+
+        opt = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                       "num_gp_restarts": 2,
+                                       "sparse_threshold": 20,
+                                       "num_inducing": 10})
+        cands = opt.get_next_candidates(exp, num_candidates=2)
+        assert_equal(len(cands), 2)
+        assert_true(isinstance(opt.gp, GPy.models.SparseGPRegression))
+        assert_equal(opt.gp.Z.shape, (10, 1))
+
+        opt = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                       "num_gp_restarts": 2,
+                                       "gp_backend": "exact",
+                                       "sparse_threshold": 20})
+        opt.get_next_candidates(exp, num_candidates=1)
+        assert_true(type(opt.gp) is GPy.models.GPRegression)
+
+        with assert_raises(ValueError):
+            SimpleBayesianOptimizer({"gp_backend": "vfe"})
+
+    def test_state(self):
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1)})
+        for x in np.linspace(0, 1, 12):
+            cand = Candidate({"x": x})
+            cand.result = np.sin(5 * x)
+            exp.add_finished(cand)
+        opt = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                       "num_gp_restarts": 2})
+        assert_equal(opt.get_state(), None)
+        opt.get_next_candidates(exp)
+        state = json.loads(json.dumps(opt.get_state()))
+
+        #the restored gp is used without optimizing it again.
+        restored = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                            "num_gp_restarts": 2})
+        restored.set_state(state)
+        #optimizing would fail with this.
+        restored.num_gp_restarts = None
+        restored._refit(exp)
+        assert_true(np.allclose(restored.gp.param_array, opt.gp.param_array))
+
+        #a state for other data is ignored.
+        other = Experiment("other", {"x": MinMaxNumericParamDef(0, 1)})
+        for x in [0.1, 0.55]:
+            cand = Candidate({"x": x})
+            cand.result = x
+            other.add_finished(cand)
+        ignoring = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                            "num_gp_restarts": 2})
+        ignoring.set_state(state)
+        ignoring._refit(other)
+        assert_equal(ignoring.gp.num_data, 2)
+
+    def test_fit_cache(self):
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1)})
+        for x in np.linspace(0, 1, 6):
+            cand = Candidate({"x": x})
+            cand.result = np.sin(5 * x)
+            exp.add_finished(cand)
+        opt = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                       "num_gp_restarts": 2})
+        opt.get_next_candidates(exp)
+        gp = opt.gp
+        gp_params = np.array(gp.param_array)
+        opt.get_next_candidates(exp)
+        assert_true(opt.gp is gp)
+        assert_equal((opt.fit_cache_hits, opt.fit_cache_misses), (1, 1))
+
+        old_exp = exp.clone()
+        cand = Candidate({"x": 0.3})
+        cand.result = np.sin(1.5)
+        exp.add_finished(cand)
+        opt.get_next_candidates(exp)
+        assert_equal((opt.fit_cache_hits, opt.fit_cache_misses), (1, 2))
+
+        #the fit on the old data is restored without optimizing.
+        opt.num_gp_restarts = None
+        opt._refit(old_exp)
+        assert_equal((opt.fit_cache_hits, opt.fit_cache_misses), (2, 2))
+        assert_equal(opt.gp.num_data, 6)
+        assert_true(np.allclose(opt.gp.param_array, gp_params))
+
+    def test_parallel_restarts(self):
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1),
+                                  "y": MinMaxNumericParamDef(0, 1)})
+        random_state = np.random.RandomState(0)
+        for i in range(8):
+            x, y = random_state.uniform(size=2)
+            cand = Candidate({"x": x, "y": y})
+            cand.result = np.sin(5 * x) + y
+            exp.add_finished(cand)
+        params = []
+        for processes in [1, 2, 3]:
+            opt = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                           "num_gp_restarts": 4,
+                                           "gp_restart_processes": processes,
+                                           "random_state": 1})
+            opt._refit(exp)
+            params.append(np.array(opt.gp.param_array))
+        #the seeded restarts do not depend on the number of processes, even
+        #if they run in this process.
+        assert_true(np.allclose(params[0], params[1]))
+        assert_true(np.allclose(params[0], params[2]))
+
+    def test_numpy_engine(self):
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1),
+                                  "y": MinMaxNumericParamDef(0, 1)})
+        random_state = np.random.RandomState(0)
+        for i in range(8):
+            x, y = random_state.uniform(size=2)
+            cand = Candidate({"x": x, "y": y})
+            cand.result = np.sin(5 * x) + y
+            exp.add_finished(cand)
+        opt = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                       "num_gp_restarts": 3,
+                                       "gp_engine": "numpy",
+                                       "incremental": True,
+                                       "random_state": 1})
+        cands = opt.get_next_candidates(exp, num_candidates=2)
+        assert_equal(len(cands), 2)
+        assert_false(isinstance(opt.gp, GPy.core.Model))
+        reference = SimpleBayesianOptimizer({"initial_random_runs": 2,
+                                             "num_gp_restarts": 3})
+        reference._refit(exp)
+        assert_true(abs(opt.gp.log_likelihood() -
+                        reference.gp.log_likelihood()) < 0.1)
+
+        cand = cands[0]
+        cand.result = 0
+        exp.add_finished(cand)
+        opt._refit(exp)
+        assert_equal(opt.gp.num_data, 9)
+
+        assert_raises(ValueError, SimpleBayesianOptimizer,
+                      {"gp_engine": "numpy", "gp_backend": "sparse"})
+        assert_raises(ValueError, SimpleBayesianOptimizer,
+                      {"gp_engine": "numpy", "kernel": "linear"})
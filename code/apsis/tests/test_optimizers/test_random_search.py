@@ -4,7 +4,8 @@ from apsis.optimizers.random_search import RandomSearch
 from nose.tools import assert_is_none, assert_equal, assert_dict_equal, \
     assert_true, assert_false
 from apsis.models.experiment import Experiment
-from apsis.models.parameter_definition import MinMaxNumericParamDef, NominalParamDef
+from apsis.models.parameter_definition import MinMaxNumericParamDef, NominalParamDef, \
+    ParamDef
 from apsis.models.candidate import Candidate
 
 class testSimpleBayesianOptimization(object):
@@ -22,4 +23,65 @@ class testSimpleBayesianOptimization(object):
             cand.result = 2
             exp.add_finished(cand)
         cands = opt.get_next_candidates(exp, num_candidates=3)
-        assert_equal(len(cands), 3)
\ No newline at end of file
+        assert_equal(len(cands), 3)
+
+    def test_duplicate_filter(self):
+        exp = Experiment("test", {"x": NominalParamDef(["A", "B", "C", "D"])})
+        opt = RandomSearch({"random_state": 1, "max_duplicate_redraws": 100})
+        cand = Candidate({"x": "A"})
+        cand.result = 1
+        exp.add_finished(cand)
+        exp.add_working(Candidate({"x": "B"}))
+        cands = opt.get_next_candidates(exp, num_candidates=2)
+        assert_equal(sorted([c.params["x"] for c in cands]), ["C", "D"])
+
+        #if the space is exhausted, known candidates are returned.
+        cands = opt.get_next_candidates(exp, num_candidates=3)
+        assert_equal(len(cands), 3)
+
+        opt = RandomSearch({"random_state": 1, "filter_duplicates": False})
+        cands = opt.get_next_candidates(exp, num_candidates=20)
+        assert_true(len(set(cands)) < 20)
+
+    def test_duplicate_epsilon(self):
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1)})
+        cand = Candidate({"x": 0.5})
+        cand.result = 1
+        exp.add_finished(cand)
+        assert_true(exp.is_known_candidate(Candidate({"x": 0.5})))
+        assert_false(exp.is_known_candidate(Candidate({"x": 0.55})))
+        assert_true(exp.is_known_candidate(Candidate({"x": 0.55}), 0.1))
+        opt = RandomSearch({"random_state": 1, "duplicate_epsilon": 0.3})
+        cands = opt.get_next_candidates(exp, num_candidates=2)
+        for c in cands:
+            assert_true(abs(c.params["x"] - 0.5) > 0.3)
+        assert_true(abs(cands[0].params["x"] - cands[1].params["x"]) > 0.3)
+
+    def test_many_candidates(self):
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(-1, 3),
+                                  "y": NominalParamDef(["A", 2, (3, 4)])})
+        opt = RandomSearch({"random_state": 1, "filter_duplicates": False})
+        cands = opt.get_next_candidates(exp, num_candidates=5000)
+        assert_equal(len(cands), 5000)
+        for c in cands:
+            assert_true(-1 <= c.params["x"] <= 3)
+            assert_true(c.params["y"] in ["A", 2, (3, 4)])
+        assert_equal(set(type(c.params["y"]) for c in cands),
+                     set([str, int, tuple]))
+        opt = RandomSearch({"random_state": 1, "filter_duplicates": False})
+        assert_equal(opt.get_next_candidates(exp, num_candidates=5000),
+                     cands)
+
+    def test_unsupported_param_def(self):
+        #values of unsupported parameter definitions are None.
+        class AnyParamDef(ParamDef):
+            def is_in_parameter_domain(self, value):
+                return True
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1),
+                                  "y": AnyParamDef()})
+        opt = RandomSearch({"random_state": 1})
+        cands = opt._draw_candidates(exp, 3)
+        assert_equal(len(cands), 3)
+        for c in cands:
+            assert_is_none(c.params["y"])
+            assert_true(0 <= c.params["x"] <= 1)
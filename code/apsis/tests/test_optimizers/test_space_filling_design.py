@@ -0,0 +1,98 @@
+__author__ = 'Frederik Diehl'
+
+from apsis.optimizers.space_filling_design import SpaceFillingDesign
+from apsis.optimizers.bayesian_optimization import SimpleBayesianOptimizer
+from apsis.utilities.optimizer_utils import check_optimizer
+from nose.tools import assert_equal, assert_true, assert_raises
+from apsis.models.experiment import Experiment
+from apsis.models.parameter_definition import MinMaxNumericParamDef, \
+    NominalParamDef
+from apsis.models.candidate import Candidate
+from apsis.assistants.experiment_assistant import BasicExperimentAssistant
+import json
+
+
+class TestSpaceFillingDesign(object):
+
+    def test_init(self):
+        opt = check_optimizer("SpaceFillingDesign", {"design": "halton"})
+        assert_true(isinstance(opt, SpaceFillingDesign))
+        assert_raises(ValueError, SpaceFillingDesign, {"design": "grid"})
+
+    def test_get_next_candidates(self):
+        for design in SpaceFillingDesign.DESIGNS:
+            exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 4),
+                                      "y": NominalParamDef(["A", "B"])})
+            opt = SpaceFillingDesign({"design": design, "random_state": 1,
+                                      "design_size": 8})
+            cands = opt.get_next_candidates(exp, num_candidates=4)
+            for c in cands:
+                exp.add_pending(c)
+            #the design continues after the returned points.
+            cands.extend(opt.get_next_candidates(exp, num_candidates=4))
+            assert_equal(len(set(cands)), 8)
+            assert_equal(sorted(int(c.params["x"]*2) for c in cands),
+                         range(8))
+            assert_equal(sorted(c.params["y"] for c in cands),
+                         ["A"]*4 + ["B"]*4)
+
+    def test_duplicates(self):
+        exp = Experiment("test", {"x": NominalParamDef(["A", "B", "C"])})
+        cand = Candidate({"x": "A"})
+        cand.result = 1
+        exp.add_finished(cand)
+        opt = SpaceFillingDesign({"design": "sobol"})
+        cands = opt.get_next_candidates(exp, num_candidates=2)
+        assert_equal(sorted(c.params["x"] for c in cands), ["B", "C"])
+        assert_equal(len(opt.get_next_candidates(exp, num_candidates=4)), 4)
+
+    def test_initial_design(self):
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1),
+                                  "y": MinMaxNumericParamDef(0, 1)})
+        opt = SimpleBayesianOptimizer({"initial_random_runs": 4,
+                                       "initial_design": "lhs",
+                                       "random_state": 1})
+        cands = opt.get_next_candidates(exp, num_candidates=4)
+        for dim in ["x", "y"]:
+            assert_equal(sorted(int(c.params[dim]*4) for c in cands),
+                         range(4))
+        assert_raises(ValueError, SimpleBayesianOptimizer,
+                      {"initial_design": "grid"})
+
+    def test_assistant_design(self):
+        #the assistant only uses one of the proposed candidates per call;
+        #the evaluated points still have to be the first ones of the design.
+        param_defs = {"x": MinMaxNumericParamDef(0, 1),
+                      "y": MinMaxNumericParamDef(0, 1)}
+        EAss = BasicExperimentAssistant(
+            "test_design", "BayOpt", param_defs,
+            optimizer_arguments={"initial_design": "lhs",
+                                 "initial_random_runs": 10,
+                                 "random_state": 1},
+            csv_write_frequency=0)
+        for i in range(10):
+            cand = EAss.get_next_candidate()
+            cand.result = cand.params["x"] + cand.params["y"]
+            EAss.update(cand)
+        finished = EAss.experiment.candidates_finished
+        for dim in ["x", "y"]:
+            assert_equal(sorted(int(c.params[dim]*10) for c in finished),
+                         range(10))
+
+    def test_state(self):
+        exp = Experiment("test", {"x": MinMaxNumericParamDef(0, 1)})
+        opt = SpaceFillingDesign({"design": "lhs", "random_state": 1,
+                                  "design_size": 6})
+        first = opt.get_next_candidates(exp, num_candidates=3)
+        exp.add_pending(first[-1])
+        state = json.loads(json.dumps(opt.get_state()))
+        resumed = SpaceFillingDesign({"design": "lhs", "random_state": 2,
+                                      "design_size": 6})
+        resumed.set_state(state)
+        #the dropped points are proposed again, then the new ones.
+        assert_equal(resumed.get_next_candidates(exp, num_candidates=2),
+                     first[:2])
+        cands = resumed.get_next_candidates(exp, num_candidates=5)
+        assert_equal(cands, opt.get_next_candidates(exp, num_candidates=5))
+        cands.append(first[-1])
+        assert_equal(sorted(int(c.params["x"]*6) for c in cands), range(6))
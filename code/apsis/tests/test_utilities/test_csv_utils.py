@@ -0,0 +1,34 @@
+__author__ = 'Frederik Diehl'
+
+from apsis.utilities.csv_utils import BufferedCSVWriter
+from nose.tools import assert_equal, assert_true
+import tempfile
+import shutil
+import os
+
+
+class TestBufferedCSVWriter(object):
+
+    def test_write(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "test.csv")
+            writer = BufferedCSVWriter(filename, flush_rows=2,
+                                       flush_interval=1000)
+            writer.writerow(["a", 1])
+            assert_equal(open(filename).read(), "")
+            #values are not quoted, even if they contain the delimiter.
+            writer.writerow(["b,c", 2.5])
+            assert_equal(open(filename).read(), "a,1\nb,c,2.5\n")
+            writer.writerow(["d", 3])
+            writer.close()
+            assert_true(writer.closed)
+            assert_equal(open(filename).read(), "a,1\nb,c,2.5\nd,3\n")
+
+            #a writer which is never closed is flushed when collected.
+            writer = BufferedCSVWriter(filename, flush_interval=1000)
+            writer.writerow(["e", 4])
+            del writer
+            assert_equal(open(filename).read().splitlines()[-1], "e,4")
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,37 @@
+__author__ = 'Frederik Diehl'
+
+from apsis.utilities.design_utils import sobol_sequence, halton_sequence, \
+    latin_hypercube, first_primes, SOBOL_MAX_DIMENSION
+from nose.tools import assert_equal, assert_true, assert_raises
+import numpy as np
+
+
+class TestDesignUtils(object):
+
+    def test_sobol_sequence(self):
+        points = sobol_sequence(8, 3)
+        assert_true(np.allclose(points[:4], [[0, 0, 0], [0.5, 0.5, 0.5],
+                                             [0.75, 0.25, 0.25],
+                                             [0.25, 0.75, 0.75]]))
+        #each of the first 2**k points lies in its own interval of 1/2**k.
+        for j in range(3):
+            assert_equal(sorted((points[:, j] * 8).astype(int)), range(8))
+        assert_true(np.allclose(sobol_sequence(5, 3, skip=3), points[3:]))
+
+        points = sobol_sequence(64, SOBOL_MAX_DIMENSION, skip=64)
+        for j in range(SOBOL_MAX_DIMENSION):
+            assert_equal(sorted((points[:, j] * 64).astype(int)), range(64))
+        assert_raises(ValueError, sobol_sequence, 1, SOBOL_MAX_DIMENSION + 1)
+
+    def test_halton_sequence(self):
+        assert_equal(first_primes(5), [2, 3, 5, 7, 11])
+        points = halton_sequence(4, 2, skip=1)
+        assert_true(np.allclose(points, [[1./2, 1./3], [1./4, 2./3],
+                                         [3./4, 1./9], [1./8, 4./9]]))
+
+    def test_latin_hypercube(self):
+        random_state = np.random.RandomState(1)
+        points = latin_hypercube(10, 3, random_state, num_iterations=20)
+        assert_equal(points.shape, (10, 3))
+        for j in range(3):
+            assert_equal(sorted((points[:, j] * 10).astype(int)), range(10))
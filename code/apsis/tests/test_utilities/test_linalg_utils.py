@@ -0,0 +1,25 @@
+__author__ = 'Frederik Diehl'
+
+from apsis.utilities.linalg_utils import cholesky_append, cholesky_solve
+from nose.tools import assert_equal, assert_true
+import numpy as np
+
+
+class TestLinalgUtils(object):
+
+    def test_cholesky_append(self):
+        random_state = np.random.RandomState(0)
+        points = random_state.uniform(size=(6, 2))
+        cov = np.exp(-np.sum((points[:, None, :] - points[None, :, :])**2,
+                             axis=2)) + 0.1 * np.eye(6)
+        chol = np.linalg.cholesky(cov[:4, :4])
+        chol = cholesky_append(chol, cov[:4, 4:5], cov[4:5, 4:5])
+        chol = cholesky_append(chol, cov[:5, 5:], cov[5:, 5:])
+        assert_equal(chol.shape, (6, 6))
+        assert_true(np.allclose(chol, np.linalg.cholesky(cov)))
+
+        chol = cholesky_append(np.zeros((0, 0)), np.zeros((0, 6)), cov)
+        assert_true(np.allclose(chol, np.linalg.cholesky(cov)))
+
+        b = random_state.uniform(size=(6, 1))
+        assert_true(np.allclose(np.dot(cov, cholesky_solve(chol, b)), b))
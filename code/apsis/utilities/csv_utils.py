@@ -0,0 +1,124 @@
+__author__ = 'Frederik Diehl'
+
+import os
+import time
+
+
+class BufferedCSVWriter(object):
+    """
+    Appends rows to a csv file which is kept open between writes.
+
+    Rows are buffered and only flushed to the file every flush_rows rows or
+    if flush_interval seconds have passed since the last flush, whichever
+    comes first. There is no timer; the interval is only checked when a row
+    is written, so the last rows stay buffered until close. On close, the
+    file is flushed and synced to disk. A writer which is garbage collected
+    without being closed is still flushed.
+
+    Like Experiment.to_csv_results, values are joined with the delimiter
+    without any quoting.
+
+    Attributes
+    ----------
+    filename : string
+        The file to append to.
+    flush_rows : int
+        The number of rows after which to flush.
+    flush_interval : float
+        The number of seconds after which to flush.
+    rows_written : int
+        The number of rows written, flushed or not.
+    """
+    filename = None
+    flush_rows = None
+    flush_interval = None
+    rows_written = None
+
+    _file = None
+    _delimiter = None
+    _line_delimiter = None
+    _rows_unflushed = None
+    _last_flush = None
+
+    def __init__(self, filename, delimiter=",", line_delimiter="\n",
+                 flush_rows=10, flush_interval=5.):
+        """
+        Initializes the writer and opens the file for appending.
+
+        Parameters
+        ----------
+        filename : string
+            The file to append to. It is created if it does not exist.
+        delimiter : string, optional
+            The column delimiter.
+        line_delimiter : string, optional
+            The line delimiter.
+        flush_rows : int, optional
+            The number of rows after which to flush. Default is 10.
+        flush_interval : float, optional
+            The number of seconds after which to flush. Default is 5.
+        """
+        self.filename = filename
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._rows_unflushed = 0
+        self._delimiter = delimiter
+        self._line_delimiter = line_delimiter
+        self._file = open(filename, "ab")
+        self._last_flush = time.time()
+
+    def writerow(self, row):
+        """
+        Appends a single row.
+
+        Parameters
+        ----------
+        row : list
+            The row's values. Values are written as str(value).
+        """
+        self._file.write(self._delimiter.join(str(v) for v in row) +
+                         self._line_delimiter)
+        self.rows_written += 1
+        self._rows_unflushed += 1
+        if (self._rows_unflushed >= self.flush_rows or
+                time.time() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Flushes the buffered rows to the file.
+        """
+        if self._file is None:
+            return
+        self._file.flush()
+        self._rows_unflushed = 0
+        self._last_flush = time.time()
+
+    def close(self):
+        """
+        Flushes, syncs the file to disk and closes it.
+
+        Calling close on a closed writer does nothing.
+        """
+        if self._file is None:
+            return
+        self.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    def __del__(self):
+        """
+        Flushes and closes the file if the writer has not been closed.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def closed(self):
+        """
+        Whether the writer has been closed.
+        """
+        return self._file is None
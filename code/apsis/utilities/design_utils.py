@@ -0,0 +1,227 @@
+__author__ = 'Frederik Diehl'
+
+import numpy as np
+
+#The direction numbers of the Sobol sequence for dimensions 2 to 50, from
+#S. Joe and F. Y. Kuo, Constructing Sobol sequences with better
+#two-dimensional projections, SIAM J. Sci. Comput. 30, 2635-2654 (2008),
+#file new-joe-kuo-6.21201. Each entry is the degree s of the primitive
+#polynomial, its coefficients a and the initial direction numbers m.
+#The first dimension uses m = 1 throughout.
+SOBOL_DIRECTIONS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+    (6, 19, [1, 1, 1, 15, 7, 5]),
+    (6, 22, [1, 3, 1, 15, 13, 25]),
+    (6, 25, [1, 1, 5, 5, 19, 61]),
+    (7, 1, [1, 3, 7, 11, 23, 15, 103]),
+    (7, 4, [1, 3, 7, 13, 13, 15, 69]),
+    (7, 7, [1, 1, 3, 13, 7, 35, 63]),
+    (7, 8, [1, 3, 5, 9, 1, 25, 53]),
+    (7, 14, [1, 3, 1, 13, 9, 35, 107]),
+    (7, 19, [1, 3, 1, 5, 27, 61, 31]),
+    (7, 21, [1, 1, 5, 11, 19, 41, 61]),
+    (7, 28, [1, 3, 5, 3, 3, 13, 69]),
+    (7, 31, [1, 1, 7, 13, 1, 19, 1]),
+    (7, 32, [1, 3, 7, 5, 13, 19, 59]),
+    (7, 37, [1, 1, 3, 9, 25, 29, 41]),
+    (7, 41, [1, 3, 5, 13, 23, 1, 55]),
+    (7, 42, [1, 3, 7, 3, 13, 59, 17]),
+    (7, 50, [1, 3, 1, 3, 5, 53, 69]),
+    (7, 55, [1, 1, 5, 5, 23, 33, 13]),
+    (7, 56, [1, 1, 7, 7, 1, 61, 123]),
+    (7, 59, [1, 1, 7, 9, 13, 61, 49]),
+    (7, 62, [1, 3, 3, 5, 3, 55, 33]),
+    (8, 14, [1, 3, 1, 15, 31, 13, 49, 245]),
+    (8, 21, [1, 3, 5, 15, 31, 59, 63, 97]),
+    (8, 22, [1, 3, 1, 11, 11, 11, 77, 249]),
+    (8, 38, [1, 3, 1, 11, 27, 43, 71, 9]),
+    (8, 47, [1, 1, 7, 15, 21, 11, 81, 45]),
+    (8, 49, [1, 3, 7, 3, 25, 31, 65, 79]),
+    (8, 50, [1, 3, 1, 1, 19, 11, 3, 205]),
+    (8, 52, [1, 1, 5, 9, 19, 21, 29, 157]),
+    (8, 56, [1, 3, 7, 11, 1, 33, 89, 185]),
+    (8, 67, [1, 3, 3, 3, 15, 9, 79, 71]),
+    (8, 70, [1, 3, 7, 11, 15, 39, 119, 27]),
+    (8, 84, [1, 1, 3, 1, 11, 31, 97, 225]),
+    (8, 97, [1, 1, 1, 3, 23, 43, 57, 177])
+]
+
+SOBOL_MAX_DIMENSION = len(SOBOL_DIRECTIONS) + 1
+
+#the number of bits of the generated points.
+SOBOL_BITS = 32
+
+
+def _sobol_direction_vectors(dimension):
+    """
+    Returns the direction vectors for the first dimension dimensions.
+
+    Returns
+    -------
+    directions : numpy array of shape (dimension, SOBOL_BITS)
+        directions[j, k] is the k-th direction vector of dimension j, scaled
+        to integers of SOBOL_BITS bits.
+    """
+    directions = np.zeros((dimension, SOBOL_BITS), dtype=np.uint64)
+    for k in range(SOBOL_BITS):
+        directions[0, k] = 1 << (SOBOL_BITS - 1 - k)
+    for j in range(1, dimension):
+        s, a, m = SOBOL_DIRECTIONS[j - 1]
+        v = [m_k << (SOBOL_BITS - 1 - k) for k, m_k in enumerate(m)]
+        for k in range(s, SOBOL_BITS):
+            new_v = v[k - s] ^ (v[k - s] >> s)
+            for i in range(1, s):
+                if (a >> (s - 1 - i)) & 1:
+                    new_v ^= v[k - i]
+            v.append(new_v)
+        directions[j] = v
+    return directions
+
+
+def sobol_sequence(num_points, dimension, skip=0):
+    """
+    Returns points of the Sobol sequence.
+
+    Parameters
+    ----------
+    num_points : int
+        The number of points to return.
+    dimension : int
+        The dimension of the points. At most SOBOL_MAX_DIMENSION.
+    skip : int, optional
+        The index of the first point to return. Default is 0, whose point is
+        the origin.
+
+    Returns
+    -------
+    points : numpy array of shape (num_points, dimension)
+        The points skip to skip + num_points - 1 of the sequence, in [0, 1).
+
+    Raises
+    ------
+    ValueError :
+        Iff dimension is larger than SOBOL_MAX_DIMENSION or the indices
+        exceed 2**SOBOL_BITS.
+    """
+    if dimension > SOBOL_MAX_DIMENSION:
+        raise ValueError("The Sobol sequence is only available for up to %i "
+                         "dimensions, not %i."
+                         %(SOBOL_MAX_DIMENSION, dimension))
+    if skip + num_points > 2**SOBOL_BITS:
+        raise ValueError("The Sobol sequence only has %i points."
+                         %2**SOBOL_BITS)
+    directions = _sobol_direction_vectors(dimension)
+    idxs = np.arange(skip, skip + num_points, dtype=np.uint64)
+    #point i is the xor of the direction vectors of the bits of i's gray
+    #code, so the points can be computed independently of each other.
+    gray = idxs ^ (idxs >> np.uint64(1))
+    points = np.zeros((num_points, dimension), dtype=np.uint64)
+    for k in range(SOBOL_BITS):
+        bit_set = ((gray >> np.uint64(k)) & np.uint64(1)).astype(bool)
+        points[bit_set] ^= directions[:, k]
+    return points.astype(float) / 2.**SOBOL_BITS
+
+
+def first_primes(num_primes):
+    """
+    Returns a list of the first num_primes prime numbers.
+    """
+    primes = []
+    candidate = 2
+    while len(primes) < num_primes:
+        if all(candidate % p for p in primes if p * p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def halton_sequence(num_points, dimension, skip=0):
+    """
+    Returns points of the Halton sequence.
+
+    Dimension j is the radical inverse of the point index in the base of the
+    j-th prime number.
+
+    Parameters
+    ----------
+    num_points : int
+        The number of points to return.
+    dimension : int
+        The dimension of the points.
+    skip : int, optional
+        The index of the first point to return. Default is 0, whose point is
+        the origin.
+
+    Returns
+    -------
+    points : numpy array of shape (num_points, dimension)
+        The points skip to skip + num_points - 1 of the sequence, in [0, 1).
+    """
+    points = np.zeros((num_points, dimension))
+    for j, base in enumerate(first_primes(dimension)):
+        idxs = np.arange(skip, skip + num_points)
+        factor = 1. / base
+        while np.any(idxs > 0):
+            points[:, j] += factor * (idxs % base)
+            idxs //= base
+            factor /= base
+    return points
+
+
+def latin_hypercube(num_points, dimension, random_state, num_iterations=100):
+    """
+    Returns a maximin Latin hypercube design.
+
+    Each dimension is divided into num_points equally sized intervals, each
+    of which contains exactly one point. Of num_iterations random designs,
+    the one with the largest minimal distance between two points is
+    returned.
+
+    Parameters
+    ----------
+    num_points : int
+        The number of points of the design.
+    dimension : int
+        The dimension of the points.
+    random_state : numpy RandomState
+        The random state used to generate the designs.
+    num_iterations : int, optional
+        The number of random designs to choose from. Default is 100.
+
+    Returns
+    -------
+    points : numpy array of shape (num_points, dimension)
+        The points of the design, in [0, 1).
+    """
+    best_points = None
+    best_distance = -1
+    for i in range(max(num_iterations, 1)):
+        intervals = np.argsort(random_state.uniform(
+            size=(num_points, dimension)), axis=0)
+        points = (intervals + random_state.uniform(
+            size=(num_points, dimension))) / num_points
+        if num_points < 2:
+            return points
+        squared_norms = np.sum(points**2, axis=1)
+        squared_distances = (squared_norms[:, None] + squared_norms[None, :]
+                             - 2 * np.dot(points, points.T))
+        np.fill_diagonal(squared_distances, np.inf)
+        min_distance = np.min(squared_distances)
+        if min_distance > best_distance:
+            best_points = points
+            best_distance = min_distance
+    return best_points
@@ -0,0 +1,32 @@
+__author__ = 'Frederik Diehl'
+
+import json
+import numpy as np
+
+
+def to_json(obj):
+    """
+    Serializes obj to a single line of json.
+
+    numpy scalars, as contained in warped-out parameters or results, are
+    converted to the corresponding python types.
+
+    Parameters
+    ----------
+    obj : object
+        The object to serialize.
+
+    Returns
+    -------
+    json_string : string
+        The json representation of obj, without newlines.
+    """
+    return json.dumps(obj, default=_json_default)
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError("%s is not json serializable." %repr(obj))
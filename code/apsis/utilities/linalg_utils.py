@@ -0,0 +1,94 @@
+__author__ = 'Frederik Diehl'
+
+import hashlib
+import numpy as np
+import scipy.linalg
+
+
+def cholesky_append(chol, cross_cov, new_cov):
+    """
+    Extends a lower cholesky factor by new rows and columns.
+
+    If chol is the lower cholesky factor of a matrix A, this returns the
+    lower cholesky factor of the block matrix
+        [[A,           cross_cov],
+         [cross_cov.T, new_cov  ]].
+    For a single new point, this is a rank-1 update costing O(n^2) instead
+    of the O(n^3) of a full decomposition.
+
+    Parameters
+    ----------
+    chol : numpy nd_array of shape (n, n)
+        The lower cholesky factor of A.
+    cross_cov : numpy nd_array of shape (n, m)
+        The covariance between the old and the new points.
+    new_cov : numpy nd_array of shape (m, m)
+        The covariance of the new points.
+
+    Returns
+    -------
+    extended_chol : numpy nd_array of shape (n+m, n+m)
+        The lower cholesky factor of the extended matrix.
+
+    Raises
+    ------
+    numpy.linalg.LinAlgError :
+        Iff the extended matrix is not positive definite.
+    """
+    n = chol.shape[0]
+    m = new_cov.shape[0]
+    extended_chol = np.zeros((n + m, n + m))
+    extended_chol[:n, :n] = chol
+    if n > 0:
+        lower_left = scipy.linalg.solve_triangular(chol, cross_cov,
+                                                   lower=True).T
+    else:
+        lower_left = np.zeros((m, 0))
+    extended_chol[n:, :n] = lower_left
+    extended_chol[n:, n:] = np.linalg.cholesky(
+        new_cov - np.dot(lower_left, lower_left.T))
+    return extended_chol
+
+
+def cholesky_solve(chol, b):
+    """
+    Solves A x = b given the lower cholesky factor of A.
+
+    Parameters
+    ----------
+    chol : numpy nd_array of shape (n, n)
+        The lower cholesky factor of A.
+    b : numpy nd_array of shape (n,) or (n, k)
+        The right hand side.
+
+    Returns
+    -------
+    x : numpy nd_array
+        The solution, with the same shape as b.
+    """
+    return scipy.linalg.cho_solve((chol, True), b)
+
+
+def data_fingerprint(*arrays):
+    """
+    Computes a fingerprint of the shapes and values of several arrays.
+
+    Equal arrays have equal fingerprints, so it can be used to check
+    whether a model has been fitted on certain data without storing it.
+
+    Parameters
+    ----------
+    arrays : numpy nd_arrays
+        The arrays to fingerprint, in order.
+
+    Returns
+    -------
+    fingerprint : string
+        The hex digest of a sha1 hash.
+    """
+    sha = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(a, dtype=float)
+        sha.update(str(a.shape))
+        sha.update(a.tobytes())
+    return sha.hexdigest()
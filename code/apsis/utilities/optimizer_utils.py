@@ -3,8 +3,10 @@ __author__ = 'Frederik Diehl'
 from apsis.optimizers.random_search import RandomSearch
 from apsis.optimizers.optimizer import Optimizer
 from apsis.optimizers.bayesian_optimization import SimpleBayesianOptimizer
+from apsis.optimizers.space_filling_design import SpaceFillingDesign
 
-AVAILABLE_OPTIMIZERS = {"RandomSearch": RandomSearch, "BayOpt": SimpleBayesianOptimizer}
+AVAILABLE_OPTIMIZERS = {"RandomSearch": RandomSearch, "BayOpt": SimpleBayesianOptimizer,
+                        "SpaceFillingDesign": SpaceFillingDesign}
 
 def check_optimizer(optimizer, optimizer_arguments=None):
     """
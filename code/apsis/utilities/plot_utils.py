@@ -2,6 +2,11 @@ __author__ = 'Frederik Diehl'
 import matplotlib.pyplot as plt
 import random
 import os
+import threading
+
+#pyplot keeps global state, so it may only be used by one thread at a time.
+#Everything creating or writing figures holds this lock.
+PYPLOT_LOCK = threading.RLock()
 
 def plot_lists(to_plot_list, fig=None, fig_options=None,
                plot_min=None, plot_max=None):
@@ -51,35 +56,36 @@ def plot_lists(to_plot_list, fig=None, fig_options=None,
     fig: plt.figure
         Either a new figure or fig, now containing the plots as specified.
     """
-    newly_created = False
-    if fig is None:
-        fig = _create_figure(fig_options)
-        newly_created = True
-    for p in to_plot_list:
-        fig = plot_single(p, fig)
+    with PYPLOT_LOCK:
+        newly_created = False
+        if fig is None:
+            fig = _create_figure(fig_options)
+            newly_created = True
+        for p in to_plot_list:
+            fig = plot_single(p, fig)
 
-    if plot_min is not None:
-        plt.ylim(ymin=plot_min)
+        if plot_min is not None:
+            plt.ylim(ymin=plot_min)
 
-    if plot_max is not None:
-        plt.ylim(ymax=plot_max)
+        if plot_max is not None:
+            plt.ylim(ymax=plot_max)
 
-    #if (plot_at_least[0] < 1) or plot_at_least[1] < 1:
-    #    max_y = -float("inf")
-    #    min_y = float("inf")
+        #if (plot_at_least[0] < 1) or plot_at_least[1] < 1:
+        #    max_y = -float("inf")
+        #    min_y = float("inf")
 
-    #    for i in range(len(to_plot_list)):
-    #        cur_min, cur_max = _get_y_min_max(to_plot_list[i]["y"], plot_at_least)
-    #        if cur_min < min_y:
-    #            min_y = cur_min
-    #        if cur_max > max_y:
-    #            max_y = cur_max
-    #        plt.ylim(ymax = max_y, ymin = min_y)
+        #    for i in range(len(to_plot_list)):
+        #        cur_min, cur_max = _get_y_min_max(to_plot_list[i]["y"], plot_at_least)
+        #        if cur_min < min_y:
+        #            min_y = cur_min
+        #        if cur_max > max_y:
+        #            max_y = cur_max
+        #        plt.ylim(ymax = max_y, ymin = min_y)
 
-    if newly_created:
-        _polish_figure(fig, fig_options)
+        if newly_created:
+            _polish_figure(fig, fig_options)
 
-    return fig
+        return fig
 
 def _get_y_min_max(y, plot_at_least):
     """
@@ -196,9 +202,10 @@ def write_plot_to_file(fig, filename, store_path,  file_format="png", transparen
         Specifies if a transparent figure is written. Default is False.
     """
     filename_w_extension = os.path.join(store_path, filename + "." + file_format)
-    fig.savefig(filename_w_extension, format=file_format, transparent=transparent)
-
-    plt.close(fig)
+    with PYPLOT_LOCK:
+        fig.savefig(filename_w_extension, format=file_format,
+                    transparent=transparent)
+        plt.close(fig)
 
 def _create_figure(fig_options=None):
     """